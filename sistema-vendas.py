@@ -1,99 +1,2585 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-import mysql.connector
-from datetime import datetime
+from tkinter import ttk, messagebox, simpledialog, filedialog
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import math
+import multiprocessing
+import platform
+import queue
+import random
+import re
+import sqlite3
+import sys
+import threading
+import unicodedata
+import uuid
+from bisect import bisect_left
+import time
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
 
 DB_HOST = "localhost"
 DB_USER = "root"
 DB_PASSWORD = ""
 DB_NAME = "sistema_vendas"
 
-def conectar_db():
+TAMANHO_PAGINA = 200
+PAGINAS_MARGEM = 1
+LIMIAR_ROLAGEM = 0.9
+INTERVALO_RESULTADOS_MS = 20
+MARGEM_ALTERACOES_S = 5
+# Ids auto-incremento podem ser confirmados fora de ordem entre terminais: a
+# marca por id relê sempre os últimos ids abaixo dela.
+MARGEM_ALTERACOES_IDS = 200
+MAX_ALTERACOES = 500
+CACHE_CATALOGO_TTL_S = 300
+CACHE_CATALOGO_MAX = 2000
+BUSCA_ATRASO_MS = 250
+BUSCA_LIMITE = 20
+BUSCA_MIN_CARACTERES = 2
+BUSCA_TEXTO_MIN_TERMO = 3
+LOTE_IMPORTACAO = 1000
+LOTE_EXPORTACAO = 5000
+LOTE_BACKUP = 50000
+PARALELO_BACKUP = 4
+FORMATO_BACKUP = 1
+TABELAS_BACKUP = (
+    "clientes", "produtos", "pedidos", "itens_pedido",
+    "vendas_diarias", "vendas_clientes_dia", "vendas_produtos_dia", "arquivos_pedidos",
+)
+LOTE_DETALHES_PEDIDOS = 500
+LOTE_LEITURA = 100
+MAX_SENTENCAS_PREPARADAS = 64
+MAX_DETALHES_PEDIDOS = 2000
+DIAS_HISTORICO_PADRAO = 30
+MESES_ATIVOS_PADRAO = 12
+DIRETORIO_ARQUIVO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "arquivo_pedidos")
+PERIODOS_PAINEL = {"Hoje": 1, "Últimos 7 dias": 7, "Últimos 30 dias": 30, "Últimos 90 dias": 90}
+PAINEL_RANKING = 10
+ESTOQUE_MINIMO = 10
+
+POOL_LEITURA = 3
+POOL_ESCRITA = 1
+RECONEXAO_TENTATIVAS = 5
+RECONEXAO_ESPERA_INICIAL = 0.5
+RECONEXAO_ESPERA_MAXIMA = 8.0
+
+LIMIAR_CONSULTA_LENTA_S = 0.5
+MAX_AMOSTRAS_METRICAS = 1000
+MAX_CONSULTAS_LENTAS = 200
+INTERVALO_BATIMENTO_MS = 100
+INTERVALO_DIAGNOSTICO_MS = 1000
+INTERVALO_METRICAS_MS = 15000
+
+CAMINHO_DIARIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pedidos_pendentes.db")
+LIMITE_PEDIDOS_PENDENTES = 1000
+LOTE_REPLICACAO = 50
+INTERVALO_REPLICACAO_S = 1.0
+REPLICACAO_ESPERA_MAXIMA_S = 30.0
+REPLICACAO_TENTATIVAS_TRAVA = 5
+INTERVALO_DIARIO_MS = 1000
+
+SQL_LISTA_CLIENTES = "SELECT id, nome, cpf, telefone, email, atualizado_em FROM clientes"
+CHAVE_LISTA_CLIENTES = ("nome", "id")
+SQL_MARCA_CLIENTES = "SELECT MAX(atualizado_em) FROM clientes"
+SQL_LISTA_PRODUTOS = "SELECT id, nome, preco, estoque, descricao, atualizado_em FROM produtos"
+CHAVE_LISTA_PRODUTOS = ("nome", "id")
+SQL_MARCA_PRODUTOS = "SELECT MAX(atualizado_em) FROM produtos"
+SQL_LISTA_PEDIDOS = """
+    SELECT p.id, c.nome as nome_cliente, p.data_pedido, p.valor_total
+    FROM pedidos p
+    JOIN clientes c ON p.cliente_id = c.id
+"""
+CHAVE_LISTA_PEDIDOS = ("p.data_pedido", "p.id")
+SQL_MARCA_PEDIDOS = "SELECT MAX(id) FROM pedidos"
+SQL_PEDIDOS_ARQUIVAMENTO = """
+    SELECT p.id, p.cliente_id, c.nome AS nome_cliente, p.data_pedido, p.valor_total, p.uuid
+    FROM pedidos p
+    JOIN clientes c ON c.id = p.cliente_id
+    WHERE p.data_pedido >= %s AND p.data_pedido < %s AND p.id > %s
+    ORDER BY p.id
+    LIMIT %s
+"""
+# Tabelas de resumo: cada uma com as colunas da chave e a consulta que a recalcula
+# a partir dos pedidos de um período [inicio, fim).
+RESUMOS_VENDAS = {
+    "vendas_diarias": (("dia",), ("pedidos", "valor_total"), """
+        SELECT DATE(p.data_pedido) AS dia, COUNT(*) AS pedidos, SUM(p.valor_total) AS valor_total
+        FROM pedidos p
+        WHERE p.data_pedido >= %s AND p.data_pedido < %s
+        GROUP BY DATE(p.data_pedido)
+    """),
+    "vendas_clientes_dia": (("dia", "cliente_id"), ("pedidos", "valor_total"), """
+        SELECT DATE(p.data_pedido) AS dia, p.cliente_id, COUNT(*) AS pedidos, SUM(p.valor_total) AS valor_total
+        FROM pedidos p
+        WHERE p.data_pedido >= %s AND p.data_pedido < %s
+        GROUP BY DATE(p.data_pedido), p.cliente_id
+    """),
+    "vendas_produtos_dia": (("dia", "produto_id"), ("quantidade", "valor_total"), """
+        SELECT DATE(p.data_pedido) AS dia, i.produto_id, SUM(i.quantidade) AS quantidade,
+               SUM(i.quantidade * i.preco_unitario) AS valor_total
+        FROM itens_pedido i
+        JOIN pedidos p ON p.id = i.pedido_id
+        WHERE p.data_pedido >= %s AND p.data_pedido < %s
+        GROUP BY DATE(p.data_pedido), i.produto_id
+    """),
+}
+SQL_PAINEL_DIAS = "SELECT dia, pedidos, valor_total FROM vendas_diarias WHERE dia >= %s AND dia < %s ORDER BY dia"
+SQL_PAINEL_PRODUTOS = """
+    SELECT v.produto_id, pr.nome, SUM(v.quantidade) AS quantidade, SUM(v.valor_total) AS valor_total
+    FROM vendas_produtos_dia v
+    JOIN produtos pr ON pr.id = v.produto_id
+    WHERE v.dia >= %s AND v.dia < %s
+    GROUP BY v.produto_id, pr.nome
+    ORDER BY valor_total DESC
+    LIMIT %s
+"""
+SQL_PAINEL_CLIENTES = """
+    SELECT v.cliente_id, c.nome, SUM(v.pedidos) AS pedidos, SUM(v.valor_total) AS valor_total
+    FROM vendas_clientes_dia v
+    JOIN clientes c ON c.id = v.cliente_id
+    WHERE v.dia >= %s AND v.dia < %s
+    GROUP BY v.cliente_id, c.nome
+    ORDER BY valor_total DESC
+    LIMIT %s
+"""
+SQL_PAINEL_ESTOQUE_BAIXO = """
+    SELECT pr.id, pr.nome, pr.estoque, COALESCE(SUM(v.quantidade), 0) AS vendidos
+    FROM produtos pr
+    LEFT JOIN vendas_produtos_dia v ON v.produto_id = pr.id AND v.dia >= %s AND v.dia < %s
+    WHERE pr.estoque <= %s
+    GROUP BY pr.id, pr.nome, pr.estoque
+    ORDER BY pr.estoque, pr.id
+    LIMIT %s
+"""
+SQL_ITENS_PEDIDOS = """
+    SELECT i.pedido_id, i.produto_id, pr.nome AS nome_produto, i.quantidade, i.preco_unitario
+    FROM itens_pedido i
+    JOIN produtos pr ON pr.id = i.produto_id
+    WHERE i.pedido_id IN ({})
+    ORDER BY i.pedido_id, i.id
+"""
+SQL_BUSCA_CLIENTES_CPF = "SELECT id, nome, cpf FROM clientes WHERE cpf LIKE %s ORDER BY cpf LIMIT %s"
+SQL_BUSCA_CLIENTES_NOME = "SELECT id, nome, cpf FROM clientes WHERE nome LIKE %s ORDER BY nome, id LIMIT %s"
+SQL_BUSCA_PRODUTOS_ID = "SELECT id, nome, preco, estoque FROM produtos WHERE id = %s AND estoque > 0"
+SQL_BUSCA_TEXTO_PRODUTOS = """
+    SELECT id, nome, preco, estoque, descricao, atualizado_em,
+           MATCH(nome) AGAINST (%s IN BOOLEAN MODE) * 2 + MATCH(nome, descricao) AGAINST (%s IN BOOLEAN MODE) AS relevancia
+    FROM produtos
+    WHERE MATCH(nome, descricao) AGAINST (%s IN BOOLEAN MODE)
+"""
+PALAVRAS_VAZIAS = {"com", "das", "dos", "para", "por", "sem", "uma", "que", "nas", "nos", "pela", "pelo"}
+SQL_CATALOGO = {
+    'clientes': "SELECT id, nome, cpf, atualizado_em FROM clientes",
+    'produtos': "SELECT id, nome, preco, estoque, atualizado_em FROM produtos",
+}
+CAMPOS_CATALOGO = {'clientes': ("id", "nome", "cpf"), 'produtos': ("id", "nome", "preco", "estoque")}
+
+# O driver do MySQL é importado só na primeira conexão, para que a janela
+# apareça sem esperar por ele.
+mysql = None
+
+def carregar_driver():
+    global mysql
+    if mysql is None:
+        import mysql.connector
+        import mysql.connector.errorcode
+
+def abrir_conexao(autocommit=False):
+    carregar_driver()
+    return mysql.connector.connect(
+        host=DB_HOST,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME,
+        autocommit=autocommit
+    )
+
+def preparar_banco():
     try:
-        conn = mysql.connector.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        cursor = conn.cursor()
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_NAME}")
-        conn.database = DB_NAME
-        return conn
+        return abrir_conexao()
     except mysql.connector.Error as err:
-        messagebox.showerror("Erro de Conexão", f"Não foi possível conectar ao MySQL: {err}")
-        return None
+        if err.errno != mysql.connector.errorcode.ER_BAD_DB_ERROR:
+            raise
+    conn = mysql.connector.connect(
+        host=DB_HOST,
+        user=DB_USER,
+        password=DB_PASSWORD
+    )
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_NAME}")
+    cursor.close()
+    conn.database = DB_NAME
+    return conn
 
-def criar_tabelas(conn):
-    if not conn:
-        return
+def coluna_existe(cursor, tabela, coluna):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (tabela, coluna)
+    )
+    return cursor.fetchone()[0] > 0
+
+def indice_existe(cursor, tabela, indice):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        (tabela, indice)
+    )
+    return cursor.fetchone()[0] > 0
+
+def adicionar_indice(cursor, tabela, indice, colunas):
+    if not indice_existe(cursor, tabela, indice):
+        cursor.execute(f"ALTER TABLE {tabela} ADD INDEX {indice} ({colunas})")
+
+def migracao_tabelas_iniciais(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS clientes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nome VARCHAR(255) NOT NULL,
+            cpf VARCHAR(14) UNIQUE,
+            telefone VARCHAR(20),
+            email VARCHAR(255)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS produtos (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nome VARCHAR(255) NOT NULL,
+            descricao TEXT,
+            preco DECIMAL(10, 2) NOT NULL,
+            estoque INT DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pedidos (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            cliente_id INT NOT NULL,
+            data_pedido DATETIME DEFAULT CURRENT_TIMESTAMP,
+            valor_total DECIMAL(10, 2) NOT NULL,
+            FOREIGN KEY (cliente_id) REFERENCES clientes(id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS itens_pedido (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            pedido_id INT NOT NULL,
+            produto_id INT NOT NULL,
+            quantidade INT NOT NULL,
+            preco_unitario DECIMAL(10, 2) NOT NULL,
+            FOREIGN KEY (pedido_id) REFERENCES pedidos(id) ON DELETE CASCADE,
+            FOREIGN KEY (produto_id) REFERENCES produtos(id)
+        )
+    """)
+
+def migracao_atualizado_em(cursor):
+    for tabela in ("clientes", "produtos"):
+        if not coluna_existe(cursor, tabela, "atualizado_em"):
+            cursor.execute(
+                f"ALTER TABLE {tabela} "
+                "ADD COLUMN atualizado_em TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)"
+            )
+        adicionar_indice(cursor, tabela, f"idx_{tabela}_atualizado_em", "atualizado_em")
+
+def migracao_indices_busca(cursor):
+    adicionar_indice(cursor, "clientes", "idx_clientes_nome", "nome")
+    adicionar_indice(cursor, "produtos", "idx_produtos_nome", "nome")
+
+def migracao_indices_listagem(cursor):
+    adicionar_indice(cursor, "produtos", "idx_produtos_estoque_nome", "estoque, nome")
+    adicionar_indice(cursor, "pedidos", "idx_pedidos_data_pedido", "data_pedido, id")
+
+# Cada migração roda uma única vez por banco, em ordem, e fica registrada em
+# schema_versao. Novas alterações de esquema entram sempre no fim da lista.
+def migracao_uuid_pedidos(cursor):
+    if not coluna_existe(cursor, "pedidos", "uuid"):
+        cursor.execute("ALTER TABLE pedidos ADD COLUMN uuid CHAR(36) NULL")
+    if not indice_existe(cursor, "pedidos", "uk_pedidos_uuid"):
+        cursor.execute("ALTER TABLE pedidos ADD UNIQUE INDEX uk_pedidos_uuid (uuid)")
+
+def migracao_indices_texto_produtos(cursor):
+    # O InnoDB cria um índice FULLTEXT por vez.
+    if not indice_existe(cursor, "produtos", "ft_produtos_nome_descricao"):
+        cursor.execute("ALTER TABLE produtos ADD FULLTEXT INDEX ft_produtos_nome_descricao (nome, descricao)")
+    if not indice_existe(cursor, "produtos", "ft_produtos_nome"):
+        cursor.execute("ALTER TABLE produtos ADD FULLTEXT INDEX ft_produtos_nome (nome)")
+
+def migracao_arquivo_pedidos(cursor):
+    adicionar_indice(cursor, "pedidos", "idx_pedidos_cliente_data", "cliente_id, data_pedido, id")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS arquivos_pedidos (
+            mes CHAR(7) NOT NULL,
+            parte INT NOT NULL,
+            arquivo VARCHAR(255) NOT NULL,
+            pedidos INT NOT NULL,
+            itens INT NOT NULL,
+            valor_total DECIMAL(14, 2) NOT NULL,
+            arquivado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (mes, parte)
+        )
+    """)
+
+def migracao_resumos_vendas(cursor):
+    # Só cria as tabelas: o preenchimento a partir dos pedidos existentes é feito
+    # depois, fora da trava das migrações, por reconstruir_resumos (um mês por
+    # transação). Veja resumos_a_preencher.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vendas_diarias (
+            dia DATE PRIMARY KEY,
+            pedidos INT NOT NULL,
+            valor_total DECIMAL(14, 2) NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vendas_clientes_dia (
+            dia DATE NOT NULL,
+            cliente_id INT NOT NULL,
+            pedidos INT NOT NULL,
+            valor_total DECIMAL(14, 2) NOT NULL,
+            PRIMARY KEY (dia, cliente_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS vendas_produtos_dia (
+            dia DATE NOT NULL,
+            produto_id INT NOT NULL,
+            quantidade INT NOT NULL,
+            valor_total DECIMAL(14, 2) NOT NULL,
+            PRIMARY KEY (dia, produto_id),
+            INDEX idx_vendas_produtos_dia_produto (produto_id, dia)
+        )
+    """)
+
+def migracao_data_pedido_obrigatoria(cursor):
+    # Um pedido sem data quebrava a paginação por (data_pedido, id): a comparação
+    # com uma chave NULL não devolve nada. Cada um recebe a data do pedido anterior
+    # (por id) que tenha data, nunca dentro de um mês já arquivado, e os resumos
+    # dos meses afetados são recalculados.
+    cursor.execute("SELECT id FROM pedidos WHERE data_pedido IS NULL")
+    sem_data = [linha[0] for linha in cursor.fetchall()]
+    cursor.execute("SELECT MAX(mes) FROM arquivos_pedidos")
+    ultimo_arquivado = cursor.fetchone()[0]
+    limite = proximo_mes(datetime.strptime(ultimo_arquivado, "%Y-%m")) if ultimo_arquivado else None
+    meses = set()
+    for pedido_id in sem_data:
+        cursor.execute(
+            "SELECT data_pedido FROM pedidos WHERE id < %s AND data_pedido IS NOT NULL ORDER BY id DESC LIMIT 1", (pedido_id,)
+        )
+        anterior = cursor.fetchone()
+        data = anterior[0] if anterior else datetime.now()
+        if limite is not None and data < limite:
+            data = limite
+        cursor.execute("UPDATE pedidos SET data_pedido = %s WHERE id = %s", (data, pedido_id))
+        meses.add(datetime(data.year, data.month, 1))
+    for inicio in sorted(meses):
+        recalcular_resumos(cursor, inicio, proximo_mes(inicio))
+    cursor.execute("ALTER TABLE pedidos MODIFY data_pedido DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP")
+
+def migracao_remover_indice_estoque(cursor):
+    # idx_produtos_estoque repetia a primeira coluna de idx_produtos_estoque_nome e
+    # só encarecia a baixa de estoque no checkout.
+    if indice_existe(cursor, "produtos", "idx_produtos_estoque"):
+        cursor.execute("ALTER TABLE produtos DROP INDEX idx_produtos_estoque")
+
+MIGRACOES = [
+    (1, "Tabelas iniciais", migracao_tabelas_iniciais),
+    (2, "Coluna atualizado_em em clientes e produtos", migracao_atualizado_em),
+    (3, "Índices de busca por nome", migracao_indices_busca),
+    (4, "Índices das listagens de produtos e pedidos", migracao_indices_listagem),
+    (5, "Identificador único dos pedidos gerado no caixa", migracao_uuid_pedidos),
+    (6, "Índices de texto completo em nome e descrição dos produtos", migracao_indices_texto_produtos),
+    (7, "Filtro de pedidos por cliente e registro dos meses arquivados", migracao_arquivo_pedidos),
+    (8, "Tabelas de resumo de vendas por dia, cliente e produto", migracao_resumos_vendas),
+    (9, "Remoção do índice duplicado de estoque", migracao_remover_indice_estoque),
+    (10, "Data obrigatória nos pedidos", migracao_data_pedido_obrigatoria),
+]
+VERSAO_TABELAS_RESUMO = 8
+
+def resumos_a_preencher(aplicadas):
+    # As tabelas de resumo acabaram de ser criadas e os pedidos que já existiam
+    # ainda não estão nelas.
+    return any(versao == VERSAO_TABELAS_RESUMO for versao, _ in aplicadas)
+
+def aplicar_migracoes(conn):
+    aplicadas = []
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS clientes (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                nome VARCHAR(255) NOT NULL,
-                cpf VARCHAR(14) UNIQUE,
-                telefone VARCHAR(20),
-                email VARCHAR(255)
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS produtos (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                nome VARCHAR(255) NOT NULL,
-                descricao TEXT,
-                preco DECIMAL(10, 2) NOT NULL,
-                estoque INT DEFAULT 0
-            )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS pedidos (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                cliente_id INT NOT NULL,
-                data_pedido DATETIME DEFAULT CURRENT_TIMESTAMP,
-                valor_total DECIMAL(10, 2) NOT NULL,
-                FOREIGN KEY (cliente_id) REFERENCES clientes(id)
+        cursor.execute("SELECT GET_LOCK('sistema_vendas_migracoes', 60)")
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("Outro terminal está atualizando o esquema do banco; tente novamente.")
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_versao (
+                    versao INT PRIMARY KEY,
+                    descricao VARCHAR(255) NOT NULL,
+                    aplicada_em DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_versao")
+            versao_atual = cursor.fetchone()[0]
+            for versao, descricao, migracao in MIGRACOES:
+                if versao <= versao_atual:
+                    continue
+                migracao(cursor)
+                cursor.execute("INSERT INTO schema_versao (versao, descricao) VALUES (%s, %s)", (versao, descricao))
+                conn.commit()
+                aplicadas.append((versao, descricao))
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK('sistema_vendas_migracoes')")
+            cursor.fetchone()
+    finally:
+        cursor.close()
+    return aplicadas
+
+class EstoqueInsuficiente(Exception):
+    pass
+
+class MesArquivado(Exception):
+    pass
+
+def acumular_resumos(cursor, dia, cliente_id, itens, valor_total):
+    # Soma o pedido às tabelas de resumo dentro da transação do checkout. Fica para
+    # o fim do checkout, em ordem fixa (dia, cliente, produtos por id), para que a
+    # linha do dia, disputada por todos os caixas, fique travada o menor tempo possível.
+    por_produto = {}
+    for item in itens:
+        quantidade, valor = por_produto.get(item['produto_id'], (0, 0))
+        por_produto[item['produto_id']] = (quantidade + item['quantidade'], valor + item['quantidade'] * item['preco_unitario'])
+    cursor.execute(
+        "INSERT INTO vendas_diarias (dia, pedidos, valor_total) VALUES (%s, 1, %s) "
+        "ON DUPLICATE KEY UPDATE pedidos = pedidos + 1, valor_total = valor_total + VALUES(valor_total)",
+        (dia, valor_total)
+    )
+    cursor.execute(
+        "INSERT INTO vendas_clientes_dia (dia, cliente_id, pedidos, valor_total) VALUES (%s, %s, 1, %s) "
+        "ON DUPLICATE KEY UPDATE pedidos = pedidos + 1, valor_total = valor_total + VALUES(valor_total)",
+        (dia, cliente_id, valor_total)
+    )
+    valores = []
+    for produto_id in sorted(por_produto):
+        valores.extend((dia, produto_id, *por_produto[produto_id]))
+    cursor.execute(
+        "INSERT INTO vendas_produtos_dia (dia, produto_id, quantidade, valor_total) VALUES "
+        + ", ".join(["(%s, %s, %s, %s)"] * len(por_produto))
+        + " ON DUPLICATE KEY UPDATE quantidade = quantidade + VALUES(quantidade), valor_total = valor_total + VALUES(valor_total)",
+        valores
+    )
+
+def registrar_pedido(conn, cliente_id, itens, codigo=None, data_pedido=None):
+    # Checkout com número constante de round trips: trava os produtos (em ordem de
+    # id, para evitar deadlock entre terminais), valida o estoque, grava todos os
+    # itens num único INSERT e baixa o estoque num único UPDATE. Com codigo (o uuid
+    # gerado no caixa), um pedido já gravado não é registrado de novo. Um pedido
+    # do diário reenviado depois de o seu mês ter sido arquivado é recusado.
+    quantidades = {}
+    for item in itens:
+        quantidades[item['produto_id']] = quantidades.get(item['produto_id'], 0) + item['quantidade']
+    ids = sorted(quantidades)
+    marcadores = ", ".join(["%s"] * len(ids))
+    valor_total = sum(item['quantidade'] * item['preco_unitario'] for item in itens)
+    data_pedido = data_pedido or datetime.now()
+
+    cursor = conn.cursor()
+    try:
+        if codigo is not None:
+            cursor.execute("SELECT id FROM pedidos WHERE uuid = %s", (codigo,))
+            existente = cursor.fetchone()
+            if existente:
+                conn.rollback()
+                return existente[0]
+        mes = data_pedido.strftime("%Y-%m")
+        cursor.execute("SELECT 1 FROM arquivos_pedidos WHERE mes = %s LIMIT 1", (mes,))
+        if cursor.fetchone():
+            raise MesArquivado(f"O mês {mes} já foi arquivado; o pedido não pode mais ser gravado no banco.")
+        cursor.execute(f"SELECT id, nome, estoque FROM produtos WHERE id IN ({marcadores}) ORDER BY id FOR UPDATE", ids)
+        estoques = {produto_id: (nome, estoque) for produto_id, nome, estoque in cursor.fetchall()}
+        faltantes = []
+        for produto_id in ids:
+            if produto_id not in estoques:
+                faltantes.append(f"Produto ID {produto_id} não existe mais.")
+                continue
+            nome, estoque = estoques[produto_id]
+            estoque = estoque or 0
+            if estoque < quantidades[produto_id]:
+                faltantes.append(f"{nome}: pedido {quantidades[produto_id]}, disponível {estoque}.")
+        if faltantes:
+            raise EstoqueInsuficiente("\n".join(faltantes))
+
+        sql_pedido = "INSERT INTO pedidos (cliente_id, valor_total, data_pedido, uuid) VALUES (%s, %s, %s, %s)"
+        cursor.execute(sql_pedido, (cliente_id, valor_total, data_pedido, codigo))
+        pedido_id = cursor.lastrowid
+
+        valores = []
+        for item in itens:
+            valores.extend((pedido_id, item['produto_id'], item['quantidade'], item['preco_unitario']))
+        cursor.execute(
+            "INSERT INTO itens_pedido (pedido_id, produto_id, quantidade, preco_unitario) VALUES "
+            + ", ".join(["(%s, %s, %s, %s)"] * len(itens)),
+            valores
+        )
+
+        casos = []
+        for produto_id in ids:
+            casos.extend((produto_id, quantidades[produto_id]))
+        cursor.execute(
+            "UPDATE produtos SET estoque = estoque - CASE id "
+            + " ".join(["WHEN %s THEN %s"] * len(ids))
+            + f" END WHERE id IN ({marcadores})",
+            casos + ids
+        )
+        acumular_resumos(cursor, data_pedido.date(), cliente_id, itens, valor_total)
+
+        conn.commit()
+        return pedido_id
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def sql_pagina(sql_base, chave, ordem, referencia, para_frente, tamanho, filtro=None):
+    # filtro é (condição, parâmetros), combinado com AND à condição de keyset.
+    crescente = (ordem == "ASC") == para_frente
+    sql = sql_base
+    condicoes = []
+    params = []
+    if filtro:
+        condicoes.append(f"({filtro[0]})")
+        params.extend(filtro[1])
+    if referencia is not None:
+        marcadores = ", ".join(["%s"] * len(chave))
+        condicoes.append(f"({', '.join(chave)}) {'>' if crescente else '<'} ({marcadores})")
+        params.extend(referencia)
+    if condicoes:
+        sql += " WHERE " + " AND ".join(condicoes)
+    direcao = "ASC" if crescente else "DESC"
+    sql += " ORDER BY " + ", ".join(f"{coluna} {direcao}" for coluna in chave) + " LIMIT %s"
+    params.append(tamanho)
+    return sql, params
+
+def normalizar_texto(texto):
+    sem_acentos = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return sem_acentos.casefold()
+
+CAMPOS_IMPORTACAO = {
+    'clientes': ("nome", "cpf", "telefone", "email"),
+    'produtos': ("id", "nome", "descricao", "preco", "estoque"),
+}
+SQL_IMPORTACAO = {
+    'clientes': (
+        "INSERT INTO clientes (nome, cpf, telefone, email) VALUES ",
+        " ON DUPLICATE KEY UPDATE nome = VALUES(nome), telefone = VALUES(telefone), email = VALUES(email)"
+    ),
+    'produtos': (
+        "INSERT INTO produtos (id, nome, descricao, preco, estoque) VALUES ",
+        " ON DUPLICATE KEY UPDATE nome = VALUES(nome), descricao = VALUES(descricao), "
+        "preco = VALUES(preco), estoque = VALUES(estoque)"
+    ),
+}
+CAMPOS_EXPORTACAO = {
+    'clientes': ("id", "nome", "cpf", "telefone", "email"),
+    'produtos': ("id", "nome", "descricao", "preco", "estoque"),
+}
+
+def normalizar_cpf(cpf):
+    digitos = "".join(c for c in str(cpf or "") if c.isdigit())
+    if len(digitos) != 11:
+        raise ValueError(f"CPF inválido: {cpf!r}")
+    return digitos
+
+def converter_preco(texto):
+    # Aceita "16.90", "16,90", "1.234,56" e "R$ 16,90". Recusa separador de milhar
+    # americano ("1,234.56") e mais de duas casas decimais, em vez de arredondar.
+    valor = str(texto).replace("R$", "").strip()
+    if "," in valor:
+        if "." in valor[valor.index(","):]:
+            raise ValueError(f"Preço inválido: {texto!r}")
+        valor = valor.replace(".", "").replace(",", ".")
+    try:
+        preco = Decimal(valor)
+    except InvalidOperation:
+        raise ValueError(f"Preço inválido: {texto!r}")
+    if not preco.is_finite():
+        raise ValueError(f"Preço inválido: {texto!r}")
+    if preco.as_tuple().exponent < -2:
+        raise ValueError(f"Preço com mais de duas casas decimais: {texto!r}")
+    preco = preco.quantize(Decimal("0.01"))
+    if preco < 0:
+        raise ValueError(f"Preço negativo: {texto!r}")
+    return preco
+
+def normalizar_cliente(registro):
+    nome = str(registro.get("nome") or "").strip()
+    if not nome:
+        raise ValueError("Nome ausente")
+    email = str(registro.get("email") or "").strip() or None
+    if email and "@" not in email:
+        raise ValueError(f"E-mail inválido: {email!r}")
+    telefone = str(registro.get("telefone") or "").strip() or None
+    return (nome, normalizar_cpf(registro.get("cpf")), telefone, email)
+
+def normalizar_produto(registro):
+    nome = str(registro.get("nome") or "").strip()
+    if not nome:
+        raise ValueError("Nome ausente")
+    if registro.get("preco") in (None, ""):
+        raise ValueError("Preço ausente")
+    produto_id = registro.get("id")
+    estoque = registro.get("estoque")
+    try:
+        produto_id = int(produto_id) if produto_id not in (None, "") else None
+        estoque = int(estoque) if estoque not in (None, "") else 0
+    except (TypeError, ValueError):
+        raise ValueError("Id e Estoque devem ser números inteiros")
+    descricao = str(registro.get("descricao") or "").strip() or None
+    return (produto_id, nome, descricao, converter_preco(registro["preco"]), estoque)
+
+NORMALIZADORES = {'clientes': normalizar_cliente, 'produtos': normalizar_produto}
+
+# Linha que não pôde nem ser lida (JSON malformado); vira rejeição, como um
+# registro que falha na normalização.
+LinhaInvalida = namedtuple("LinhaInvalida", "texto motivo")
+
+def ler_json_em_fluxo(arquivo, tamanho_bloco=65536):
+    # Lê um array JSON de objetos sem carregar o arquivo inteiro.
+    decodificador = json.JSONDecoder()
+    buffer = ""
+    inicio_array = False
+    for bloco in iter(lambda: arquivo.read(tamanho_bloco), ""):
+        buffer += bloco
+        posicao = 0
+        while True:
+            while posicao < len(buffer) and buffer[posicao] in " \t\r\n,":
+                posicao += 1
+            if not inicio_array:
+                if posicao < len(buffer) and buffer[posicao] == "[":
+                    inicio_array = True
+                    posicao += 1
+                    continue
+                if posicao < len(buffer):
+                    raise ValueError("O arquivo JSON deve conter um array de objetos")
+                break
+            if posicao < len(buffer) and buffer[posicao] == "]":
+                return
+            try:
+                objeto, fim = decodificador.raw_decode(buffer, posicao)
+            except json.JSONDecodeError:
+                break
+            yield objeto
+            posicao = fim
+        buffer = buffer[posicao:]
+    if inicio_array or buffer.strip():
+        raise ValueError("Array JSON incompleto ou malformado")
+
+def ler_registros(caminho):
+    extensao = os.path.splitext(caminho)[1].lower()
+    with open(caminho, encoding="utf-8-sig", newline="") as arquivo:
+        if extensao == ".csv":
+            amostra = arquivo.read(4096)
+            arquivo.seek(0)
+            delimitador = ";" if amostra.count(";") > amostra.count(",") else ","
+            for numero, registro in enumerate(csv.DictReader(arquivo, delimiter=delimitador), start=2):
+                yield numero, {(chave or "").strip().lower(): valor for chave, valor in registro.items()}
+        elif extensao in (".jsonl", ".ndjson"):
+            for numero, linha in enumerate(arquivo, start=1):
+                if linha.strip():
+                    try:
+                        yield numero, json.loads(linha)
+                    except json.JSONDecodeError as err:
+                        yield numero, LinhaInvalida(linha.strip(), f"JSON inválido: {err.msg}")
+        elif extensao == ".json":
+            for numero, registro in enumerate(ler_json_em_fluxo(arquivo), start=1):
+                yield numero, registro
+        else:
+            raise ValueError(f"Formato não suportado: {extensao} (use .csv, .json ou .jsonl)")
+
+def gravar_lote_importacao(conn, tabela, lote):
+    inicio, fim = SQL_IMPORTACAO[tabela]
+    colunas = len(CAMPOS_IMPORTACAO[tabela])
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            inicio + ", ".join(["(" + ", ".join(["%s"] * colunas) + ")"] * len(lote)) + fim,
+            [valor for _, valores in lote for valor in valores]
+        )
+        conn.commit()
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def importar_registros(conn, tabela, registros, lote=LOTE_IMPORTACAO, ao_rejeitar=None, ao_progresso=None):
+    # Cada lote é um INSERT multi-linha numa transação própria; se o lote falhar
+    # no banco, é regravado linha a linha para isolar e rejeitar só as culpadas.
+    normalizar = NORMALIZADORES[tabela]
+    resumo = {'lidas': 0, 'gravadas': 0, 'rejeitadas': 0}
+
+    def rejeitar(numero, registro, motivo):
+        resumo['rejeitadas'] += 1
+        if ao_rejeitar:
+            ao_rejeitar(numero, registro, motivo)
+
+    def gravar(pendentes):
+        try:
+            gravar_lote_importacao(conn, tabela, pendentes)
+            resumo['gravadas'] += len(pendentes)
+        except mysql.connector.Error:
+            for numero, valores in pendentes:
+                try:
+                    gravar_lote_importacao(conn, tabela, [(numero, valores)])
+                    resumo['gravadas'] += 1
+                except mysql.connector.Error as err:
+                    rejeitar(numero, dict(zip(CAMPOS_IMPORTACAO[tabela], valores)), str(err))
+        if ao_progresso:
+            ao_progresso(dict(resumo))
+
+    pendentes = []
+    for numero, registro in registros:
+        resumo['lidas'] += 1
+        if isinstance(registro, LinhaInvalida):
+            rejeitar(numero, registro.texto, registro.motivo)
+            continue
+        try:
+            if not isinstance(registro, dict):
+                raise ValueError("O registro deve ser um objeto JSON")
+            pendentes.append((numero, normalizar(registro)))
+        except ValueError as err:
+            rejeitar(numero, registro, str(err))
+            continue
+        if len(pendentes) >= lote:
+            gravar(pendentes)
+            pendentes = []
+    if pendentes:
+        gravar(pendentes)
+    return resumo
+
+def importar_arquivo(conn, tabela, caminho, caminho_rejeitados=None, lote=LOTE_IMPORTACAO, ao_progresso=None):
+    arquivo_rejeitados = None
+    escritor = None
+    try:
+        if caminho_rejeitados:
+            arquivo_rejeitados = open(caminho_rejeitados, "w", encoding="utf-8", newline="")
+            escritor = csv.writer(arquivo_rejeitados)
+            escritor.writerow(["linha", "motivo", "registro"])
+
+        def ao_rejeitar(numero, registro, motivo):
+            if escritor:
+                escritor.writerow([numero, motivo, json.dumps(registro, ensure_ascii=False, default=str)])
+
+        return importar_registros(conn, tabela, ler_registros(caminho), lote, ao_rejeitar, ao_progresso)
+    finally:
+        if arquivo_rejeitados:
+            arquivo_rejeitados.close()
+
+def exportar_tabela(conn, tabela, caminho, lote=LOTE_EXPORTACAO, ao_progresso=None):
+    # Percorre a tabela por keyset no id, um lote por vez, gravando à medida que lê.
+    campos = CAMPOS_EXPORTACAO[tabela]
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao not in (".csv", ".json", ".jsonl", ".ndjson"):
+        raise ValueError(f"Formato não suportado: {extensao} (use .csv, .json ou .jsonl)")
+    total = 0
+    ultimo_id = 0
+    sql = f"SELECT {', '.join(campos)} FROM {tabela} WHERE id > %s ORDER BY id LIMIT %s"
+    with open(caminho, "w", encoding="utf-8", newline="") as arquivo:
+        escritor = None
+        if extensao == ".csv":
+            escritor = csv.writer(arquivo)
+            escritor.writerow(campos)
+        elif extensao == ".json":
+            arquivo.write("[")
+        while True:
+            linhas = ler(conn, sql, (ultimo_id, lote), f"exportar_{tabela}")
+            if not linhas:
+                break
+            for linha in linhas:
+                if escritor:
+                    escritor.writerow(linha)
+                else:
+                    if extensao == ".json" and total:
+                        arquivo.write(",")
+                    texto = json.dumps(linha._asdict(), ensure_ascii=False, default=str)
+                    arquivo.write(texto if extensao == ".json" else texto + "\n")
+                total += 1
+            ultimo_id = linhas[-1][0]
+            if ao_progresso:
+                ao_progresso(total)
+        if extensao == ".json":
+            arquivo.write("]\n")
+    return total
+
+def percentil(ordenados, p):
+    if not ordenados:
+        return 0.0
+    indice = max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+def redigir_sql(sql):
+    sql = re.sub(r"'(?:[^'\\]|\\.)*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    return " ".join(sql.split())
+
+def redigir_parametros(params):
+    if isinstance(params, dict):
+        params = params.values()
+    return ["NULL" if valor is None else type(valor).__name__ for valor in params]
+
+class Metricas:
+    # Contagem, tempo e linhas por consulta nomeada, log das consultas lentas (com
+    # literais e parâmetros redigidos) e atraso do laço de eventos do Tk. Os
+    # percentis são calculados sobre as últimas MAX_AMOSTRAS_METRICAS medições.
+    def __init__(self, limiar_lento=LIMIAR_CONSULTA_LENTA_S, max_amostras=MAX_AMOSTRAS_METRICAS):
+        self.limiar_lento = limiar_lento
+        self.max_amostras = max_amostras
+        self.trava = threading.Lock()
+        self.zerar()
+
+    def zerar(self):
+        with self.trava:
+            self.consultas = {}
+            self.lentas = deque(maxlen=MAX_CONSULTAS_LENTAS)
+            self.atrasos = deque(maxlen=self.max_amostras)
+            self.batimentos = 0
+            self.atraso_maximo = 0.0
+
+    def registrar(self, nome, duracao, linhas=0, sql=None, params=(), erro=False):
+        with self.trava:
+            dados = self.consultas.get(nome)
+            if dados is None:
+                dados = self.consultas[nome] = {
+                    'contagem': 0, 'erros': 0, 'linhas': 0, 'total': 0.0, 'maximo': 0.0,
+                    'amostras': deque(maxlen=self.max_amostras),
+                }
+            dados['contagem'] += 1
+            dados['erros'] += erro
+            dados['linhas'] += linhas
+            dados['total'] += duracao
+            dados['maximo'] = max(dados['maximo'], duracao)
+            dados['amostras'].append(duracao)
+            if duracao >= self.limiar_lento:
+                self.lentas.append({
+                    'quando': datetime.now().isoformat(timespec="seconds"),
+                    'consulta': nome,
+                    'duracao_ms': duracao * 1000,
+                    'linhas': linhas,
+                    'erro': erro,
+                    'sql': redigir_sql(sql) if sql else None,
+                    'parametros': redigir_parametros(params or ()),
+                })
+
+    @contextmanager
+    def medir(self, nome, sql=None, params=()):
+        medida = {'linhas': 0}
+        erro = False
+        inicio = time.perf_counter()
+        try:
+            yield medida
+        except BaseException:
+            erro = True
+            raise
+        finally:
+            self.registrar(nome, time.perf_counter() - inicio, medida['linhas'], sql, params, erro)
+
+    def registrar_atraso(self, atraso):
+        with self.trava:
+            self.batimentos += 1
+            self.atrasos.append(atraso)
+            self.atraso_maximo = max(self.atraso_maximo, atraso)
+
+    def resumo(self):
+        with self.trava:
+            consultas = {}
+            for nome, dados in sorted(self.consultas.items()):
+                amostras = sorted(dados['amostras'])
+                consultas[nome] = {
+                    'contagem': dados['contagem'],
+                    'erros': dados['erros'],
+                    'linhas': dados['linhas'],
+                    'total_ms': dados['total'] * 1000,
+                    'media_ms': dados['total'] / dados['contagem'] * 1000,
+                    'p50_ms': percentil(amostras, 50) * 1000,
+                    'p95_ms': percentil(amostras, 95) * 1000,
+                    'p99_ms': percentil(amostras, 99) * 1000,
+                    'max_ms': dados['maximo'] * 1000,
+                }
+            atrasos = sorted(self.atrasos)
+            return {
+                'gerado_em': datetime.now().isoformat(timespec="seconds"),
+                'limiar_lento_ms': self.limiar_lento * 1000,
+                'consultas': consultas,
+                'laco_eventos': {
+                    'batimentos': self.batimentos,
+                    'p50_ms': percentil(atrasos, 50) * 1000,
+                    'p95_ms': percentil(atrasos, 95) * 1000,
+                    'p99_ms': percentil(atrasos, 99) * 1000,
+                    'max_ms': self.atraso_maximo * 1000,
+                },
+                'consultas_lentas': list(self.lentas),
+            }
+
+metricas = Metricas()
+
+def rotulo_prometheus(valor):
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def formatar_prometheus(resumo):
+    linhas = [
+        "# HELP sistema_vendas_consultas_total Execuções por consulta nomeada.",
+        "# TYPE sistema_vendas_consultas_total counter",
+    ]
+    consultas = resumo['consultas']
+    for nome, dados in consultas.items():
+        linhas.append(f'sistema_vendas_consultas_total{{consulta="{rotulo_prometheus(nome)}"}} {dados["contagem"]}')
+    linhas += [
+        "# HELP sistema_vendas_consultas_erros_total Execuções que terminaram em erro.",
+        "# TYPE sistema_vendas_consultas_erros_total counter",
+    ]
+    for nome, dados in consultas.items():
+        linhas.append(f'sistema_vendas_consultas_erros_total{{consulta="{rotulo_prometheus(nome)}"}} {dados["erros"]}')
+    linhas += [
+        "# HELP sistema_vendas_consultas_linhas_total Linhas lidas ou gravadas por consulta.",
+        "# TYPE sistema_vendas_consultas_linhas_total counter",
+    ]
+    for nome, dados in consultas.items():
+        linhas.append(f'sistema_vendas_consultas_linhas_total{{consulta="{rotulo_prometheus(nome)}"}} {dados["linhas"]}')
+    linhas += [
+        "# HELP sistema_vendas_consulta_segundos Latência por consulta nomeada.",
+        "# TYPE sistema_vendas_consulta_segundos summary",
+    ]
+    for nome, dados in consultas.items():
+        rotulo = f'consulta="{rotulo_prometheus(nome)}"'
+        for quantil, campo in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+            linhas.append(f'sistema_vendas_consulta_segundos{{{rotulo},quantile="{quantil}"}} {dados[campo] / 1000:.6f}')
+        linhas.append(f"sistema_vendas_consulta_segundos_sum{{{rotulo}}} {dados['total_ms'] / 1000:.6f}")
+        linhas.append(f"sistema_vendas_consulta_segundos_count{{{rotulo}}} {dados['contagem']}")
+    laco = resumo['laco_eventos']
+    linhas += [
+        "# HELP sistema_vendas_atraso_laco_segundos Atraso do laço de eventos do Tk medido pelo batimento.",
+        "# TYPE sistema_vendas_atraso_laco_segundos summary",
+    ]
+    for quantil, campo in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+        linhas.append(f'sistema_vendas_atraso_laco_segundos{{quantile="{quantil}"}} {laco[campo] / 1000:.6f}')
+    linhas.append(f"sistema_vendas_atraso_laco_segundos_count {laco['batimentos']}")
+    linhas += [
+        "# HELP sistema_vendas_atraso_laco_maximo_segundos Maior atraso do laço de eventos observado.",
+        "# TYPE sistema_vendas_atraso_laco_maximo_segundos gauge",
+        f"sistema_vendas_atraso_laco_maximo_segundos {laco['max_ms'] / 1000:.6f}",
+        "# HELP sistema_vendas_consultas_lentas Consultas lentas mantidas no log.",
+        "# TYPE sistema_vendas_consultas_lentas gauge",
+        f"sistema_vendas_consultas_lentas {len(resumo['consultas_lentas'])}",
+    ]
+    return "\n".join(linhas) + "\n"
+
+def exportar_metricas(caminho, formato=None):
+    # Grava num temporário e renomeia, para que o coletor nunca leia um arquivo pela metade.
+    if formato is None:
+        formato = "json" if caminho.lower().endswith(".json") else "prometheus"
+    resumo = metricas.resumo()
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        if formato == "json":
+            json.dump(resumo, arquivo, ensure_ascii=False, indent=2)
+        else:
+            arquivo.write(formatar_prometheus(resumo))
+    os.replace(temporario, caminho)
+
+CLASSES_LINHA = {}
+
+def classe_linha(colunas):
+    # Uma tupla nomeada por conjunto de colunas. As linhas continuam aceitando
+    # linha['coluna'], como as do cursor de dicionário, sem um dict por linha.
+    classe = CLASSES_LINHA.get(colunas)
+    if classe is None:
+        indices = {coluna: indice for indice, coluna in enumerate(colunas)}
+
+        def __getitem__(self, chave):
+            if isinstance(chave, str):
+                return tuple.__getitem__(self, indices[chave])
+            return tuple.__getitem__(self, chave)
+
+        base = namedtuple("Linha", colunas, rename=True)
+        classe = CLASSES_LINHA[colunas] = type("Linha", (base,), {'__slots__': (), '__getitem__': __getitem__})
+    return classe
+
+class SentencasPreparadas:
+    # Cursores preparados de uma conexão, um por SQL: o servidor analisa o SQL só
+    # na primeira execução. O driver só reaproveita a sentença quando recebe o
+    # mesmo objeto str, por isso o texto guardado é o que volta para o execute().
+    # LRU limitada, porque cada sentença ocupa memória no servidor.
+    def __init__(self, conn, tamanho=MAX_SENTENCAS_PREPARADAS):
+        self.conn = conn
+        self.tamanho = tamanho
+        self.cursores = OrderedDict()
+
+    def obter(self, sql):
+        preparado = self.cursores.get(sql)
+        if preparado is not None:
+            self.cursores.move_to_end(sql)
+            return preparado
+        preparado = self.cursores[sql] = (self.conn.cursor(prepared=True), sql)
+        if len(self.cursores) > self.tamanho:
+            _, (antigo, _) = self.cursores.popitem(last=False)
+            antigo.close()
+        return preparado
+
+    def descartar(self, sql):
+        # Depois de um erro no meio da leitura o cursor pode ter ficado com linhas
+        # não lidas; ele é fechado e a próxima execução prepara de novo.
+        preparado = self.cursores.pop(sql, None)
+        try:
+            if getattr(self.conn, "unread_result", False):
+                self.conn.consume_results()
+            if preparado is not None:
+                preparado[0].close()
+        except Exception:
+            pass
+
+def sentencas_da_conexao(conn):
+    sentencas = getattr(conn, "sentencas_preparadas", None)
+    if sentencas is None:
+        sentencas = conn.sentencas_preparadas = SentencasPreparadas(conn)
+    return sentencas
+
+def ler(conn, sql, params=(), nome="consulta", ao_lote=None, tamanho_lote=LOTE_LEITURA):
+    # Caminho único de leitura: sentença preparada, linhas como tuplas nomeadas e
+    # fetchmany em lotes. Com ao_lote, cada lote é entregue assim que chega e nada
+    # fica acumulado (devolve a contagem); sem ele, devolve a lista de linhas.
+    sentencas = sentencas_da_conexao(conn)
+    cursor, texto = sentencas.obter(sql)
+    linhas = []
+    total = 0
+    try:
+        with metricas.medir(nome, sql, params) as medida:
+            cursor.execute(texto, tuple(params))
+            classe = classe_linha(tuple(coluna[0] for coluna in cursor.description))
+            while True:
+                bloco = cursor.fetchmany(tamanho_lote)
+                if not bloco:
+                    break
+                bloco = [classe._make(linha) for linha in bloco]
+                total += len(bloco)
+                medida['linhas'] = total
+                if ao_lote:
+                    ao_lote(bloco)
+                else:
+                    linhas.extend(bloco)
+    except BaseException:
+        sentencas.descartar(sql)
+        raise
+    return total if ao_lote else linhas
+
+def consulta(sql, params=(), nome="consulta", ao_lote=None):
+    return lambda conn: ler(conn, sql, params, nome, ao_lote)
+
+def escapar_like(texto):
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def buscar_clientes(texto, limite=BUSCA_LIMITE):
+    # O CPF é gravado só com dígitos, então a máscara digitada sai do prefixo.
+    digitos = texto.replace(".", "").replace("-", "")
+    if digitos.isdigit():
+        return consulta(SQL_BUSCA_CLIENTES_CPF, (escapar_like(digitos) + "%", limite), "busca_clientes_cpf")
+    return consulta(SQL_BUSCA_CLIENTES_NOME, (escapar_like(texto) + "%", limite), "busca_clientes_nome")
+
+def termos_busca(texto):
+    # Termos para o MATCH em modo booleano: sem acentos, sem palavras vazias e sem
+    # os termos curtos que o índice não guarda. Um "s" final é retirado e todo termo
+    # vira prefixo, então "ovos" encontra "ovo" e "ovos".
+    termos = []
+    for palavra in re.findall(r"\w+", normalizar_texto(texto)):
+        if len(palavra) < BUSCA_TEXTO_MIN_TERMO or palavra in PALAVRAS_VAZIAS:
+            continue
+        if len(palavra) > BUSCA_TEXTO_MIN_TERMO and palavra.endswith("s"):
+            palavra = palavra[:-1]
+        if palavra not in termos:
+            termos.append(palavra)
+    return termos
+
+def sql_busca_produtos_texto(texto, limite, deslocamento=0, so_em_estoque=False):
+    # Ordena por relevância (acertos no nome valem o dobro) e pagina por OFFSET.
+    # Sem termos indexáveis, cai na busca por prefixo do nome.
+    filtro = " AND estoque > 0" if so_em_estoque else ""
+    termos = termos_busca(texto)
+    if not termos:
+        sql = f"{SQL_LISTA_PRODUTOS} WHERE nome LIKE %s{filtro} ORDER BY nome, id LIMIT %s OFFSET %s"
+        return sql, (escapar_like(texto.strip()) + "%", limite, deslocamento), "busca_produtos_nome"
+    expressao = " ".join(f"+{termo}*" for termo in termos)
+    sql = SQL_BUSCA_TEXTO_PRODUTOS + filtro + " ORDER BY relevancia DESC, id LIMIT %s OFFSET %s"
+    return sql, (expressao, expressao, expressao, limite, deslocamento), "busca_produtos_texto"
+
+def buscar_produtos_texto(texto, limite=TAMANHO_PAGINA, deslocamento=0, so_em_estoque=False):
+    return consulta(*sql_busca_produtos_texto(texto, limite, deslocamento, so_em_estoque))
+
+def buscar_produtos(texto, limite=BUSCA_LIMITE):
+    if texto.isdigit():
+        return consulta(SQL_BUSCA_PRODUTOS_ID, (int(texto),), "busca_produtos_id")
+    return buscar_produtos_texto(texto, limite, so_em_estoque=True)
+
+def consulta_valor(sql, params=(), nome="consulta_valor"):
+    def tarefa(conn):
+        linhas = ler(conn, sql, params, nome)
+        return linhas[0][0] if linhas else None
+    return tarefa
+
+class PoolConexoes:
+    # Conexões reaproveitadas com ping antes do uso; uma conexão caída (restart do
+    # MySQL, wait_timeout) é descartada e reaberta com espera exponencial.
+    def __init__(self, tamanho, autocommit=False):
+        self.tamanho = tamanho
+        self.autocommit = autocommit
+        self.livres = queue.LifoQueue()
+        self.vagas = threading.BoundedSemaphore(tamanho)
+
+    def _abrir(self):
+        espera = RECONEXAO_ESPERA_INICIAL
+        for tentativa in range(1, RECONEXAO_TENTATIVAS + 1):
+            try:
+                return abrir_conexao(self.autocommit)
+            except mysql.connector.Error:
+                if tentativa == RECONEXAO_TENTATIVAS:
+                    raise
+                time.sleep(espera)
+                espera = min(espera * 2, RECONEXAO_ESPERA_MAXIMA)
+
+    def _fechar(self, conn):
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+
+    def obter(self):
+        self.vagas.acquire()
+        try:
+            while True:
+                try:
+                    conn = self.livres.get_nowait()
+                except queue.Empty:
+                    return self._abrir()
+                try:
+                    conn.ping(reconnect=False)
+                    return conn
+                except mysql.connector.Error:
+                    self._fechar(conn)
+        except BaseException:
+            self.vagas.release()
+            raise
+
+    def devolver(self, conn, descartar=False):
+        try:
+            if not descartar and conn.in_transaction:
+                conn.rollback()
+        except mysql.connector.Error:
+            descartar = True
+        if descartar:
+            self._fechar(conn)
+        else:
+            self.livres.put(conn)
+        self.vagas.release()
+
+    @contextmanager
+    def conexao(self):
+        conn = self.obter()
+        try:
+            yield conn
+        except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError):
+            self.devolver(conn, descartar=True)
+            raise
+        except BaseException:
+            self.devolver(conn)
+            raise
+        else:
+            self.devolver(conn)
+
+    def fechar(self):
+        while True:
+            try:
+                self._fechar(self.livres.get_nowait())
+            except queue.Empty:
+                break
+
+class ExecutorConsultas:
+    # Executa as tarefas de banco em threads próprias e devolve os resultados ao
+    # Tk pelo root.after. Leituras e escritas usam pools e filas separados, para
+    # que o checkout não espere atrás de listagens. Tarefas de um grupo cancelado
+    # são descartadas.
+    def __init__(self, root, pool_leitura, pool_escrita, ao_mudar_ocupado=None):
+        self.root = root
+        self.pools = {False: pool_leitura, True: pool_escrita}
+        self.ao_mudar_ocupado = ao_mudar_ocupado
+        self.filas = {False: queue.Queue(), True: queue.Queue()}
+        self.resultados = queue.Queue()
+        self.avisos = queue.Queue()
+        self.geracoes = {}
+        self.pendentes = 0
+        self.aguardando_resultados = False
+        self.threads = []
+        for escrita, pool in self.pools.items():
+            for _ in range(pool.tamanho):
+                thread = threading.Thread(target=self._trabalhar, args=(escrita,), daemon=True)
+                thread.start()
+                self.threads.append((escrita, thread))
+
+    def submeter(self, tarefa, ao_concluir=None, ao_falhar=None, grupo=None, escrita=False, conexao=True):
+        self.filas[escrita].put((tarefa, ao_concluir, ao_falhar, grupo, self.geracoes.get(grupo, 0), conexao))
+        self.pendentes += 1
+        if self.pendentes == 1 and self.ao_mudar_ocupado:
+            self.ao_mudar_ocupado(True)
+        if not self.aguardando_resultados:
+            self.aguardando_resultados = True
+            self.root.after(INTERVALO_RESULTADOS_MS, self._entregar_resultados)
+
+    def cancelar(self, grupo):
+        self.geracoes[grupo] = self.geracoes.get(grupo, 0) + 1
+
+    def agendar(self, funcao, *args):
+        # Pode ser chamado de dentro de uma tarefa: a função roda depois no Tk.
+        self.avisos.put((funcao, args))
+
+    def encerrar(self):
+        for escrita, _ in self.threads:
+            self.filas[escrita].put(None)
+        for _, thread in self.threads:
+            thread.join(timeout=5)
+        for pool in self.pools.values():
+            pool.fechar()
+
+    def _obsoleta(self, grupo, geracao):
+        return grupo is not None and self.geracoes.get(grupo, 0) != geracao
+
+    def _trabalhar(self, escrita):
+        fila = self.filas[escrita]
+        pool = self.pools[escrita]
+        while True:
+            item = fila.get()
+            if item is None:
+                break
+            tarefa, ao_concluir, ao_falhar, grupo, geracao, conexao = item
+            resultado, erro = None, None
+            if not self._obsoleta(grupo, geracao):
+                try:
+                    if conexao:
+                        with pool.conexao() as conn:
+                            resultado = tarefa(conn)
+                    else:
+                        resultado = tarefa(None)
+                except Exception as err:
+                    erro = err
+            self.resultados.put((resultado, erro, ao_concluir, ao_falhar, grupo, geracao))
+
+    def _chamar(self, funcao, *args):
+        # Uma falha num callback é mostrada, mas não interrompe a entrega dos demais.
+        try:
+            funcao(*args)
+        except Exception as err:
+            messagebox.showerror("Erro", f"Erro inesperado: {err}")
+
+    def _entregar_resultados(self):
+        try:
+            while True:
+                try:
+                    funcao, args = self.avisos.get_nowait()
+                except queue.Empty:
+                    break
+                self._chamar(funcao, *args)
+            while True:
+                try:
+                    resultado, erro, ao_concluir, ao_falhar, grupo, geracao = self.resultados.get_nowait()
+                except queue.Empty:
+                    break
+                self.pendentes -= 1
+                if self._obsoleta(grupo, geracao):
+                    continue
+                if erro is not None:
+                    if ao_falhar:
+                        self._chamar(ao_falhar, erro)
+                    else:
+                        messagebox.showerror("Erro", f"Erro inesperado: {erro}")
+                elif ao_concluir:
+                    self._chamar(ao_concluir, resultado)
+            if self.pendentes == 0 and self.ao_mudar_ocupado:
+                self._chamar(self.ao_mudar_ocupado, False)
+        finally:
+            if self.pendentes > 0:
+                self.root.after(INTERVALO_RESULTADOS_MS, self._entregar_resultados)
+            else:
+                self.aguardando_resultados = False
+
+class DiarioCheio(Exception):
+    pass
+
+class DiarioPedidos:
+    # Diário local (SQLite, fsync a cada commit) onde o checkout grava o pedido
+    # antes de ele ir ao MySQL. Pedidos enviados saem do diário; os recusados no
+    # envio ficam com o motivo em conflito até serem reenviados ou descartados.
+    # Guarda também uma cópia do catálogo do caixa, para vender sem o banco.
+    def __init__(self, caminho=CAMINHO_DIARIO, limite=LIMITE_PEDIDOS_PENDENTES):
+        self.limite = limite
+        self.enviados = 0
+        self.trava = threading.Lock()
+        self.conn = sqlite3.connect(caminho, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS pedidos (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    uuid TEXT NOT NULL UNIQUE,
+                    registrado_em TEXT NOT NULL,
+                    cliente_id INTEGER NOT NULL,
+                    itens TEXT NOT NULL,
+                    conflito TEXT
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS catalogo (
+                    tabela TEXT NOT NULL,
+                    id INTEGER NOT NULL,
+                    dados TEXT NOT NULL,
+                    PRIMARY KEY (tabela, id)
+                )
+            """)
+
+    def registrar(self, cliente_id, itens):
+        codigo = str(uuid.uuid4())
+        itens = json.dumps([
+            {
+                'produto_id': item['produto_id'],
+                'nome_produto': item.get('nome_produto'),
+                'quantidade': item['quantidade'],
+                'preco_unitario': str(item['preco_unitario']),
+            }
+            for item in itens
+        ], ensure_ascii=False)
+        with metricas.medir("diario_registrar"), self.trava, self.conn:
+            pendentes = self.conn.execute("SELECT COUNT(*) FROM pedidos WHERE conflito IS NULL").fetchone()[0]
+            if pendentes >= self.limite:
+                raise DiarioCheio(f"{pendentes} pedidos aguardando envio.")
+            self.conn.execute(
+                "INSERT INTO pedidos (uuid, registrado_em, cliente_id, itens) VALUES (?, ?, ?, ?)",
+                (codigo, datetime.now().isoformat(sep=" ", timespec="seconds"), cliente_id, itens)
             )
-        """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS itens_pedido (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                pedido_id INT NOT NULL,
-                produto_id INT NOT NULL,
-                quantidade INT NOT NULL,
-                preco_unitario DECIMAL(10, 2) NOT NULL,
-                FOREIGN KEY (pedido_id) REFERENCES pedidos(id) ON DELETE CASCADE,
-                FOREIGN KEY (produto_id) REFERENCES produtos(id)
+        return codigo
+
+    def _pedido(self, linha):
+        codigo, registrado_em, cliente_id, itens, conflito = linha
+        itens = json.loads(itens)
+        for item in itens:
+            item['preco_unitario'] = Decimal(item['preco_unitario'])
+        return {
+            'uuid': codigo,
+            'registrado_em': datetime.fromisoformat(registrado_em),
+            'cliente_id': cliente_id,
+            'itens': itens,
+            'conflito': conflito,
+        }
+
+    def pendentes(self, limite):
+        with self.trava:
+            linhas = self.conn.execute(
+                "SELECT uuid, registrado_em, cliente_id, itens, conflito FROM pedidos WHERE conflito IS NULL ORDER BY seq LIMIT ?",
+                (limite,)
+            ).fetchall()
+        return [self._pedido(linha) for linha in linhas]
+
+    def conflitos(self):
+        with self.trava:
+            linhas = self.conn.execute(
+                "SELECT uuid, registrado_em, cliente_id, itens, conflito FROM pedidos WHERE conflito IS NOT NULL ORDER BY seq"
+            ).fetchall()
+        return [self._pedido(linha) for linha in linhas]
+
+    def contagem(self):
+        with self.trava:
+            pendentes, conflitos = self.conn.execute(
+                "SELECT COUNT(*) - COUNT(conflito), COUNT(conflito) FROM pedidos"
+            ).fetchone()
+            return pendentes, conflitos, self.enviados
+
+    def marcar_enviado(self, codigo):
+        with self.trava, self.conn:
+            self.conn.execute("DELETE FROM pedidos WHERE uuid = ?", (codigo,))
+            self.enviados += 1
+
+    def marcar_conflito(self, codigo, motivo):
+        with self.trava, self.conn:
+            self.conn.execute("UPDATE pedidos SET conflito = ? WHERE uuid = ?", (motivo, codigo))
+
+    def reenviar(self, codigos):
+        with self.trava, self.conn:
+            self.conn.executemany("UPDATE pedidos SET conflito = NULL WHERE uuid = ?", [(codigo,) for codigo in codigos])
+
+    def descartar(self, codigos):
+        with self.trava, self.conn:
+            self.conn.executemany("DELETE FROM pedidos WHERE uuid = ?", [(codigo,) for codigo in codigos])
+
+    def guardar_catalogo(self, tabela, linhas, recente=True):
+        # A ordem das linhas (rowid) é a da LRU: REPLACE põe o registro no fim,
+        # enquanto uma atualização vinda do banco mantém a posição.
+        if recente:
+            sql = "INSERT OR REPLACE INTO catalogo (tabela, id, dados) VALUES (?, ?, ?)"
+        else:
+            sql = "INSERT INTO catalogo (tabela, id, dados) VALUES (?, ?, ?) ON CONFLICT (tabela, id) DO UPDATE SET dados = excluded.dados"
+        valores = [
+            (tabela, linha['id'], json.dumps({campo: linha[campo] for campo in CAMPOS_CATALOGO[tabela]}, ensure_ascii=False, default=str))
+            for linha in linhas
+        ]
+        with self.trava, self.conn:
+            self.conn.executemany(sql, valores)
+
+    def remover_catalogo(self, tabela, ids):
+        with self.trava, self.conn:
+            self.conn.executemany("DELETE FROM catalogo WHERE tabela = ? AND id = ?", [(tabela, registro_id) for registro_id in ids])
+
+    def catalogo(self, tabela, limite):
+        with self.trava:
+            linhas = self.conn.execute(
+                "SELECT dados FROM catalogo WHERE tabela = ? ORDER BY rowid DESC LIMIT ?", (tabela, limite)
+            ).fetchall()
+        registros = []
+        for (dados,) in reversed(linhas):
+            registro = json.loads(dados)
+            if registro.get('preco') is not None:
+                registro['preco'] = Decimal(registro['preco'])
+            registros.append(registro)
+        return registros
+
+    def fechar(self):
+        with self.trava:
+            self.conn.close()
+
+class ReplicadorPedidos:
+    # Thread que envia ao MySQL, em lotes e numa conexão própria, os pedidos do
+    # diário. O uuid de cada pedido torna o reenvio idempotente: se o commit chegou
+    # ao banco mas a resposta se perdeu, a próxima tentativa só o retira do diário.
+    # Com o banco fora do ar, espera cada vez mais entre as tentativas; deadlocks e
+    # esperas de trava estouradas não são queda do banco e são repetidos na hora.
+    def __init__(self, diario, pool, lote=LOTE_REPLICACAO):
+        self.diario = diario
+        self.pool = pool
+        self.lote = lote
+        self.ultimo_erro = None
+        self.parado = False
+        self.acordar = threading.Event()
+        self.thread = threading.Thread(target=self._trabalhar, daemon=True)
+        self.thread.start()
+
+    def notificar(self):
+        self.acordar.set()
+
+    def encerrar(self):
+        self.parado = True
+        self.acordar.set()
+        self.thread.join(timeout=5)
+        self.pool.fechar()
+
+    def _trabalhar(self):
+        espera = 0
+        while not self.parado:
+            self.acordar.wait(espera)
+            self.acordar.clear()
+            if self.parado:
+                break
+            try:
+                enviados = self.enviar_lote()
+            except Exception as err:
+                self.ultimo_erro = err
+                espera = min(max(espera * 2, INTERVALO_REPLICACAO_S), REPLICACAO_ESPERA_MAXIMA_S)
+                continue
+            self.ultimo_erro = None
+            espera = 0 if enviados == self.lote else INTERVALO_REPLICACAO_S
+
+    def enviar_lote(self):
+        pedidos = self.diario.pendentes(self.lote)
+        if not pedidos:
+            return 0
+        with self.pool.conexao() as conn:
+            for pedido in pedidos:
+                try:
+                    self.replicar(conn, pedido)
+                except (EstoqueInsuficiente, MesArquivado) as err:
+                    self.diario.marcar_conflito(pedido['uuid'], str(err))
+                except (mysql.connector.errors.IntegrityError, mysql.connector.errors.DataError) as err:
+                    self.diario.marcar_conflito(pedido['uuid'], f"Recusado pelo banco de dados: {err.msg}")
+                else:
+                    self.diario.marcar_enviado(pedido['uuid'])
+        return len(pedidos)
+
+    def replicar(self, conn, pedido):
+        for tentativa in range(REPLICACAO_TENTATIVAS_TRAVA + 1):
+            try:
+                with metricas.medir("replicar_pedido") as medida:
+                    registrar_pedido(conn, pedido['cliente_id'], pedido['itens'], pedido['uuid'], pedido['registrado_em'])
+                    medida['linhas'] = len(pedido['itens'])
+                return
+            except mysql.connector.Error as err:
+                trava = err.errno in (mysql.connector.errorcode.ER_LOCK_DEADLOCK, mysql.connector.errorcode.ER_LOCK_WAIT_TIMEOUT)
+                if not trava or tentativa == REPLICACAO_TENTATIVAS_TRAVA:
+                    raise
+                time.sleep(random.uniform(0, 0.01 * 2 ** tentativa))
+
+def carregar_itens_pedidos(pedido_ids):
+    # Um único SELECT ... IN por lote de ids, em vez de uma consulta por pedido.
+    def tarefa(conn):
+        itens = {pedido_id: [] for pedido_id in pedido_ids}
+        for inicio in range(0, len(pedido_ids), LOTE_DETALHES_PEDIDOS):
+            lote = pedido_ids[inicio:inicio + LOTE_DETALHES_PEDIDOS]
+            sql = SQL_ITENS_PEDIDOS.format(", ".join(["%s"] * len(lote)))
+            for linha in consulta(sql, lote, "itens_pedidos")(conn):
+                itens[linha['pedido_id']].append(linha)
+        return itens
+    return tarefa
+
+def filtro_pedidos(inicio=None, fim=None, cliente_id=None):
+    # Período [inicio, fim) e cliente, como (condição, parâmetros) para a ListaVirtual.
+    condicoes = []
+    params = []
+    if inicio is not None:
+        condicoes.append("p.data_pedido >= %s")
+        params.append(inicio)
+    if fim is not None:
+        condicoes.append("p.data_pedido < %s")
+        params.append(fim)
+    if cliente_id is not None:
+        condicoes.append("p.cliente_id = %s")
+        params.append(cliente_id)
+    if not condicoes:
+        return None
+    return " AND ".join(condicoes), params
+
+def proximo_mes(data):
+    return datetime(data.year + data.month // 12, data.month % 12 + 1, 1)
+
+def arquivar_mes(conn, inicio, diretorio=DIRETORIO_ARQUIVO, lote=LOTE_EXPORTACAO):
+    # Grava os pedidos do mês, com os itens e o nome do cliente e dos produtos na
+    # época, num JSON Lines compactado; só depois, numa única transação, registra o
+    # arquivo e apaga do banco exatamente os pedidos gravados. Se algo falhar antes
+    # do commit, o arquivo é descartado e o banco fica como estava.
+    fim = proximo_mes(inicio)
+    mes = inicio.strftime("%Y-%m")
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(parte), 0) + 1 FROM arquivos_pedidos WHERE mes = %s", (mes,))
+        parte = cursor.fetchone()[0]
+        nome = f"pedidos-{mes}-p{parte}.jsonl.gz"
+        caminho = os.path.join(diretorio, nome)
+        os.makedirs(diretorio, exist_ok=True)
+        temporario = caminho + ".tmp"
+        ids = []
+        resumo = {'mes': mes, 'arquivo': nome, 'pedidos': 0, 'itens': 0, 'valor_total': Decimal("0")}
+        try:
+            # GzipFile sobre um arquivo aberto para escrita: o fsync precisa de um
+            # descritor gravável (no Windows, abrir só para leitura não basta).
+            with open(temporario, "wb") as bruto:
+                with io.TextIOWrapper(gzip.GzipFile(fileobj=bruto, mode="wb"), encoding="utf-8") as arquivo:
+                    ultimo_id = 0
+                    while True:
+                        pedidos = consulta(SQL_PEDIDOS_ARQUIVAMENTO, (inicio, fim, ultimo_id, lote), "arquivar_pedidos")(conn)
+                        if not pedidos:
+                            break
+                        ultimo_id = pedidos[-1]['id']
+                        itens = carregar_itens_pedidos([pedido['id'] for pedido in pedidos])(conn)
+                        for pedido in pedidos:
+                            pedido = pedido._asdict()
+                            pedido['itens'] = [
+                                {campo: item[campo] for campo in ("produto_id", "nome_produto", "quantidade", "preco_unitario")}
+                                for item in itens[pedido['id']]
+                            ]
+                            arquivo.write(json.dumps(pedido, ensure_ascii=False, default=str) + "\n")
+                            ids.append(pedido['id'])
+                            resumo['pedidos'] += 1
+                            resumo['itens'] += len(pedido['itens'])
+                            resumo['valor_total'] += pedido['valor_total']
+                bruto.flush()
+                os.fsync(bruto.fileno())
+            if not ids:
+                os.remove(temporario)
+                conn.rollback()
+                return None
+            os.replace(temporario, caminho)
+
+            for inicio_lote in range(0, len(ids), lote):
+                bloco = ids[inicio_lote:inicio_lote + lote]
+                marcadores = ", ".join(["%s"] * len(bloco))
+                cursor.execute(f"DELETE FROM itens_pedido WHERE pedido_id IN ({marcadores})", bloco)
+                cursor.execute(f"DELETE FROM pedidos WHERE id IN ({marcadores})", bloco)
+            cursor.execute(
+                "INSERT INTO arquivos_pedidos (mes, parte, arquivo, pedidos, itens, valor_total) VALUES (%s, %s, %s, %s, %s, %s)",
+                (mes, parte, nome, resumo['pedidos'], resumo['itens'], resumo['valor_total'])
             )
-        """)
-        conn.commit()
-    except mysql.connector.Error as err:
-        messagebox.showerror("Erro ao Criar Tabelas", f"Erro: {err}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            for restante in (temporario, caminho):
+                if os.path.exists(restante):
+                    os.remove(restante)
+            raise
+        return resumo
     finally:
         cursor.close()
 
+def arquivar_pedidos(conn, manter_meses=MESES_ATIVOS_PADRAO, diretorio=DIRETORIO_ARQUIVO, lote=LOTE_EXPORTACAO, ao_progresso=None):
+    # Arquiva, mês a mês, os meses fechados anteriores aos `manter_meses` mais recentes.
+    hoje = datetime.now()
+    indice = hoje.year * 12 + hoje.month - 1 - manter_meses
+    limite = datetime(indice // 12, indice % 12 + 1, 1)
+    mais_antigo = consulta_valor("SELECT MIN(data_pedido) FROM pedidos WHERE data_pedido < %s", (limite,))(conn)
+    conn.rollback()
+    resumos = []
+    if mais_antigo is None:
+        return resumos
+    inicio = datetime(mais_antigo.year, mais_antigo.month, 1)
+    while inicio < limite:
+        resumo = arquivar_mes(conn, inicio, diretorio, lote)
+        if resumo:
+            resumos.append(resumo)
+            if ao_progresso:
+                ao_progresso(resumo)
+        inicio = proximo_mes(inicio)
+    return resumos
+
+def ler_arquivo_pedidos(caminho):
+    with gzip.open(caminho, "rt", encoding="utf-8") as arquivo:
+        for linha in arquivo:
+            pedido = json.loads(linha)
+            if pedido['data_pedido']:
+                pedido['data_pedido'] = datetime.fromisoformat(pedido['data_pedido'])
+            pedido['valor_total'] = Decimal(pedido['valor_total'])
+            for item in pedido['itens']:
+                item['preco_unitario'] = Decimal(item['preco_unitario'])
+            yield pedido
+
+def meses_arquivados(inicio=None, fim=None):
+    def tarefa(conn):
+        sql = "SELECT mes, parte, arquivo, pedidos, itens, valor_total FROM arquivos_pedidos"
+        condicoes = []
+        params = []
+        if inicio is not None:
+            condicoes.append("mes >= %s")
+            params.append(inicio.strftime("%Y-%m"))
+        if fim is not None:
+            condicoes.append("mes <= %s")
+            params.append((fim - timedelta(microseconds=1)).strftime("%Y-%m"))
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        return consulta(sql + " ORDER BY mes, parte", params, "meses_arquivados")(conn)
+    return tarefa
+
+def consultar_arquivo(inicio=None, fim=None, cliente_id=None, diretorio=DIRETORIO_ARQUIVO, ao_lote=None):
+    # Lê sob demanda os arquivos dos meses do período, do mais recente para o mais
+    # antigo, filtrando pedido a pedido. Com ao_lote, os pedidos de cada arquivo são
+    # entregues em lotes assim que o arquivo é lido e só um mês fica em memória.
+    def tarefa(conn):
+        pedidos = []
+        total = 0
+        for registro in reversed(meses_arquivados(inicio, fim)(conn)):
+            caminho = os.path.join(diretorio, registro['arquivo'])
+            if not os.path.exists(caminho):
+                raise FileNotFoundError(f"Arquivo de {registro['mes']} não encontrado: {caminho}")
+            do_arquivo = []
+            for pedido in ler_arquivo_pedidos(caminho):
+                if inicio is not None and pedido['data_pedido'] < inicio:
+                    continue
+                if fim is not None and pedido['data_pedido'] >= fim:
+                    continue
+                if cliente_id is not None and pedido['cliente_id'] != cliente_id:
+                    continue
+                do_arquivo.append(pedido)
+            do_arquivo.sort(key=lambda pedido: (pedido['data_pedido'], pedido['id']), reverse=True)
+            total += len(do_arquivo)
+            if ao_lote is None:
+                pedidos.extend(do_arquivo)
+                continue
+            for inicio_lote in range(0, len(do_arquivo), LOTE_LEITURA):
+                ao_lote(do_arquivo[inicio_lote:inicio_lote + LOTE_LEITURA])
+        return total if ao_lote else pedidos
+    return tarefa
+
+def periodo_resumos(conn, inicio=None, fim=None):
+    # Os meses já arquivados não estão mais em pedidos; seus resumos são mantidos
+    # como estão e ficam fora da reconstrução e da verificação. Devolve [inicio, fim)
+    # em dias inteiros, ou None se não houver pedidos no período.
+    ultimo_arquivado = consulta_valor("SELECT MAX(mes) FROM arquivos_pedidos", (), "resumos_periodo")(conn)
+    if ultimo_arquivado:
+        limite = proximo_mes(datetime.strptime(ultimo_arquivado, "%Y-%m"))
+        if inicio is None or inicio < limite:
+            inicio = limite
+    if inicio is None:
+        inicio = consulta_valor("SELECT MIN(data_pedido) FROM pedidos", (), "resumos_periodo")(conn)
+    conn.rollback()
+    if inicio is None:
+        return None
+    fim = fim or datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    return datetime(inicio.year, inicio.month, inicio.day), fim
+
+def meses_do_periodo(inicio, fim):
+    # Divide [inicio, fim) em meses, para manter curtas as transações de manutenção.
+    while inicio < fim:
+        seguinte = min(fim, proximo_mes(inicio))
+        yield inicio, seguinte
+        inicio = seguinte
+
+def recalcular_resumos(cursor, inicio, fim):
+    for tabela, (chave, valores, sql) in RESUMOS_VENDAS.items():
+        cursor.execute(f"DELETE FROM {tabela} WHERE dia >= %s AND dia < %s", (inicio.date(), fim.date()))
+        cursor.execute(f"INSERT INTO {tabela} ({', '.join(chave + valores)}) {sql}", (inicio, fim))
+
+def reconstruir_resumos(conn, inicio=None, fim=None, ao_progresso=None):
+    # Recalcula as tabelas de resumo a partir dos pedidos, um mês por transação.
+    periodo = periodo_resumos(conn, inicio, fim)
+    if periodo is None:
+        return
+    cursor = conn.cursor()
+    try:
+        for inicio_mes, fim_mes in meses_do_periodo(*periodo):
+            try:
+                recalcular_resumos(cursor, inicio_mes, fim_mes)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            if ao_progresso:
+                ao_progresso(inicio_mes, fim_mes)
+    finally:
+        cursor.close()
+
+def verificar_resumos(conn, inicio=None, fim=None):
+    # Compara as tabelas de resumo com o recálculo a partir dos pedidos e devolve as
+    # divergências como (tabela, chave, esperado, encontrado).
+    periodo = periodo_resumos(conn, inicio, fim)
+    if periodo is None:
+        return []
+    divergencias = []
+    for inicio_mes, fim_mes in meses_do_periodo(*periodo):
+        for tabela, (chave, valores, sql) in RESUMOS_VENDAS.items():
+            esperado = {
+                tuple(linha[coluna] for coluna in chave): tuple(linha[coluna] for coluna in valores)
+                for linha in consulta(sql, (inicio_mes, fim_mes), f"verificar_{tabela}")(conn)
+            }
+            encontrado = {
+                tuple(linha[coluna] for coluna in chave): tuple(linha[coluna] for coluna in valores)
+                for linha in consulta(
+                    f"SELECT {', '.join(chave + valores)} FROM {tabela} WHERE dia >= %s AND dia < %s",
+                    (inicio_mes.date(), fim_mes.date()), f"verificar_{tabela}"
+                )(conn)
+            }
+            for chave_linha in sorted(esperado.keys() | encontrado.keys()):
+                if esperado.get(chave_linha) != encontrado.get(chave_linha):
+                    divergencias.append((tabela, chave_linha, esperado.get(chave_linha), encontrado.get(chave_linha)))
+        conn.rollback()
+    return divergencias
+
+def carregar_painel(dias):
+    # Lê apenas as tabelas de resumo (e o estoque atual) para o painel de vendas.
+    def tarefa(conn):
+        hoje = datetime.now().date()
+        inicio = hoje - timedelta(days=dias - 1)
+        fim = hoje + timedelta(days=1)
+        return {
+            'inicio': inicio,
+            'dias': consulta(SQL_PAINEL_DIAS, (inicio, fim), "painel_dias")(conn),
+            'produtos': consulta(SQL_PAINEL_PRODUTOS, (inicio, fim, PAINEL_RANKING), "painel_produtos")(conn),
+            'clientes': consulta(SQL_PAINEL_CLIENTES, (inicio, fim, PAINEL_RANKING), "painel_clientes")(conn),
+            'estoque_baixo': consulta(
+                SQL_PAINEL_ESTOQUE_BAIXO, (inicio, fim, ESTOQUE_MINIMO, TAMANHO_PAGINA), "painel_estoque_baixo"
+            )(conn),
+        }
+    return tarefa
+
+class CacheDetalhesPedidos:
+    # Itens dos pedidos já carregados, num LRU de no máximo `tamanho` pedidos. Um
+    # pedido não muda depois de gravado, então o que está no cache nunca fica velho.
+    def __init__(self, executor, ao_carregar=None, tamanho=MAX_DETALHES_PEDIDOS):
+        self.executor = executor
+        self.ao_carregar = ao_carregar
+        self.tamanho = tamanho
+        self.itens = OrderedDict()
+        self.carregando = set()
+
+    def obter(self, pedido_id):
+        itens = self.itens.get(pedido_id)
+        if itens is not None:
+            self.itens.move_to_end(pedido_id)
+        return itens
+
+    def carregar(self, pedido_ids):
+        faltantes = [pedido_id for pedido_id in dict.fromkeys(pedido_ids)
+                     if pedido_id not in self.itens and pedido_id not in self.carregando]
+        if not faltantes:
+            return
+        self.carregando.update(faltantes)
+
+        def entregar(itens):
+            self.carregando.difference_update(faltantes)
+            for pedido_id, linhas in itens.items():
+                self.itens[pedido_id] = linhas
+                self.itens.move_to_end(pedido_id)
+            while len(self.itens) > self.tamanho:
+                self.itens.popitem(last=False)
+            if self.ao_carregar:
+                self.ao_carregar(faltantes)
+
+        def falhar(err):
+            self.carregando.difference_update(faltantes)
+            messagebox.showerror("Erro de Banco de Dados", f"Erro ao carregar itens dos pedidos: {err}")
+
+        self.executor.submeter(carregar_itens_pedidos(faltantes), entregar, falhar)
+
+def carregar_catalogo(tabela, ids, marca=None):
+    # Relê só as chaves guardadas no cache: quais ids ainda existem e, entre eles,
+    # as linhas alteradas desde a marca (todas, se ainda não há marca). A nova
+    # marca é lida antes, para que nada alterado durante a leitura fique para trás.
+    def tarefa(conn):
+        nova_marca = consulta_valor(f"SELECT MAX(atualizado_em) FROM {tabela}", nome=f"catalogo_{tabela}_marca")(conn)
+        existentes = set()
+        alteradas = []
+        for inicio in range(0, len(ids), LOTE_DETALHES_PEDIDOS):
+            lote = ids[inicio:inicio + LOTE_DETALHES_PEDIDOS]
+            marcadores = ", ".join(["%s"] * len(lote))
+            existentes.update(
+                linha[0] for linha in ler(conn, f"SELECT id FROM {tabela} WHERE id IN ({marcadores})", lote, f"catalogo_{tabela}_existentes")
+            )
+            sql = f"{SQL_CATALOGO[tabela]} WHERE id IN ({marcadores})"
+            params = list(lote)
+            if marca is not None:
+                sql += " AND atualizado_em >= %s"
+                params.append(marca - timedelta(seconds=MARGEM_ALTERACOES_S))
+            alteradas.extend(consulta(sql, params, f"catalogo_{tabela}_alteracoes")(conn))
+        return nova_marca, existentes, alteradas
+    return tarefa
+
+class CacheCatalogo:
+    # Clientes e produtos já escolhidos no caixa, por id (e os clientes também por
+    # CPF), numa LRU de até CACHE_CATALOGO_MAX registros por tabela. As buscas vão
+    # ao banco; o cache só responde às consultas exatas por código e CPF. Vale por
+    # CACHE_CATALOGO_TTL_S ou até invalidar(); depois disso atualizar() relê só as
+    # chaves guardadas que mudaram. Com um diário, o cache é copiado nele e
+    # recarregado na abertura, para o caixa funcionar com o banco fora do ar.
+    def __init__(self, executor, diario=None, tamanho=CACHE_CATALOGO_MAX):
+        self.executor = executor
+        self.diario = diario
+        self.tamanho = tamanho
+        self.registros = {'clientes': OrderedDict(), 'produtos': OrderedDict()}
+        self.marcas = {'clientes': None, 'produtos': None}
+        self.validade = {'clientes': 0.0, 'produtos': 0.0}
+        self.atualizando = {'clientes': False, 'produtos': False}
+        self.repetir = {'clientes': False, 'produtos': False}
+        self.indice_cpf = {}
+        if diario is not None:
+            for tabela in self.registros:
+                for linha in diario.catalogo(tabela, tamanho):
+                    self._substituir(tabela, linha)
+
+    def invalidar(self, tabela):
+        self.validade[tabela] = 0.0
+        if self.atualizando[tabela]:
+            self.repetir[tabela] = True
+
+    def guardar(self, tabela, linhas):
+        registros = self.registros[tabela]
+        for linha in linhas:
+            self._remover(tabela, linha['id'])
+            self._substituir(tabela, linha)
+        descartados = []
+        while len(registros) > self.tamanho:
+            descartados.append(next(iter(registros)))
+            self._remover(tabela, descartados[-1])
+        if self.diario is not None:
+            self.diario.guardar_catalogo(tabela, linhas)
+            self.diario.remover_catalogo(tabela, descartados)
+
+    def _substituir(self, tabela, linha):
+        # Sem mexer na ordem da LRU quando a chave já está guardada.
+        anterior = self.registros[tabela].get(linha['id'])
+        if anterior is not None and tabela == "clientes" and self.indice_cpf.get(anterior['cpf']) == linha['id']:
+            del self.indice_cpf[anterior['cpf']]
+        self.registros[tabela][linha['id']] = linha
+        if tabela == "clientes" and linha['cpf']:
+            self.indice_cpf[linha['cpf']] = linha['id']
+
+    def _remover(self, tabela, registro_id):
+        linha = self.registros[tabela].pop(registro_id, None)
+        if linha is not None and tabela == "clientes" and self.indice_cpf.get(linha['cpf']) == registro_id:
+            del self.indice_cpf[linha['cpf']]
+
+    def atualizar(self, tabela):
+        if self.atualizando[tabela] or time.monotonic() < self.validade[tabela]:
+            return
+        ids = list(self.registros[tabela])
+        if not ids:
+            return
+        self.atualizando[tabela] = True
+
+        def entregar(resultado):
+            nova_marca, existentes, alteradas = resultado
+            excluidos = [registro_id for registro_id in ids if registro_id not in existentes]
+            for registro_id in excluidos:
+                self._remover(tabela, registro_id)
+            alteradas = [linha for linha in alteradas if linha['id'] in self.registros[tabela]]
+            for linha in alteradas:
+                self._substituir(tabela, linha)
+            if self.diario is not None:
+                self.diario.remover_catalogo(tabela, excluidos)
+                self.diario.guardar_catalogo(tabela, alteradas, recente=False)
+            self.marcas[tabela] = nova_marca
+            self.validade[tabela] = time.monotonic() + CACHE_CATALOGO_TTL_S
+            terminar()
+
+        def terminar(_=None):
+            self.atualizando[tabela] = False
+            if self.repetir[tabela]:
+                self.repetir[tabela] = False
+                self.validade[tabela] = 0.0
+                self.atualizar(tabela)
+
+        self.executor.submeter(carregar_catalogo(tabela, ids, self.marcas[tabela]), entregar, terminar)
+
+    def _obter(self, tabela, registro_id):
+        linha = self.registros[tabela].get(registro_id)
+        if linha is not None:
+            self.registros[tabela].move_to_end(registro_id)
+        return linha
+
+    def cliente(self, cliente_id):
+        return self._obter('clientes', cliente_id)
+
+    def produto(self, produto_id):
+        return self._obter('produtos', produto_id)
+
+    def cliente_por_cpf(self, cpf):
+        cliente_id = self.indice_cpf.get(cpf)
+        return self.cliente(cliente_id) if cliente_id is not None else None
+
+class CampoBusca:
+    # Campo com sugestões: a cada pausa na digitação (BUSCA_ATRASO_MS) consulta o
+    # banco por prefixo, com LIMIT, e guarda em `selecionado` o registro escolhido.
+    # buscar devolve a tarefa de banco ou, se já tem a resposta (cache), a lista.
+    def __init__(self, master, executor, buscar, rotular, grupo, ao_selecionar=None, width=40):
+        self.executor = executor
+        self.buscar = buscar
+        self.rotular = rotular
+        self.grupo = grupo
+        self.ao_selecionar = ao_selecionar
+        self.resultados = []
+        self.selecionado = None
+        self.agendado = None
+        self.escolher_ao_receber = False
+        self.popup = None
+        self.lista = None
+        self.entry = ttk.Entry(master, width=width)
+        self.entry.bind("<KeyRelease>", self._ao_digitar)
+        self.entry.bind("<Down>", self._focar_lista)
+        self.entry.bind("<Return>", self._ao_confirmar)
+        self.entry.bind("<Escape>", lambda event: self._fechar_popup())
+        self.entry.bind("<FocusOut>", lambda event: self.entry.after(100, self._verificar_foco))
+
+    def grid(self, **opcoes):
+        self.entry.grid(**opcoes)
+
+    def cancelar(self):
+        if self.agendado:
+            self.entry.after_cancel(self.agendado)
+            self.agendado = None
+        self.executor.cancelar(self.grupo)
+        self._fechar_popup()
+
+    def limpar(self):
+        if self.agendado:
+            self.entry.after_cancel(self.agendado)
+            self.agendado = None
+        self.executor.cancelar(self.grupo)
+        self.selecionado = None
+        self.resultados = []
+        self.entry.delete(0, tk.END)
+        self._fechar_popup()
+
+    def _ao_digitar(self, event):
+        if event.keysym in ("Down", "Up", "Return", "KP_Enter", "Escape", "Tab"):
+            return
+        self.selecionado = None
+        if self.agendado:
+            self.entry.after_cancel(self.agendado)
+        self.agendado = self.entry.after(BUSCA_ATRASO_MS, self._pesquisar)
+
+    def _pesquisar(self):
+        self.agendado = None
+        self.executor.cancelar(self.grupo)
+        texto = self.entry.get().strip()
+        if len(texto) < BUSCA_MIN_CARACTERES and not texto.isdigit():
+            self.resultados = []
+            self._fechar_popup()
+            return
+        tarefa = self.buscar(texto)
+        if isinstance(tarefa, list):
+            self._mostrar(tarefa)
+            return
+        self.executor.submeter(tarefa, self._mostrar, self._falha, grupo=self.grupo)
+
+    def _falha(self, err):
+        messagebox.showerror("Erro de Banco de Dados", f"Erro na busca: {err}")
+
+    def _mostrar(self, linhas):
+        self.resultados = linhas
+        if self.escolher_ao_receber:
+            self.escolher_ao_receber = False
+            if linhas:
+                self._selecionar(0)
+                return
+        if not linhas:
+            self._fechar_popup()
+            return
+        if self.popup is None:
+            self.popup = tk.Toplevel(self.entry)
+            self.popup.wm_overrideredirect(True)
+            self.lista = tk.Listbox(self.popup, height=min(len(linhas), 10), exportselection=False)
+            self.lista.pack(fill=tk.BOTH, expand=True)
+            self.lista.bind("<ButtonRelease-1>", lambda event: self._selecionar_da_lista())
+            self.lista.bind("<Return>", lambda event: self._selecionar_da_lista())
+            self.lista.bind("<Escape>", lambda event: self._fechar_popup())
+            self.lista.bind("<FocusOut>", lambda event: self.entry.after(100, self._verificar_foco))
+        self.lista.delete(0, tk.END)
+        for linha in linhas:
+            self.lista.insert(tk.END, self.rotular(linha))
+        self.lista.configure(height=min(len(linhas), 10))
+        x = self.entry.winfo_rootx()
+        y = self.entry.winfo_rooty() + self.entry.winfo_height()
+        self.popup.geometry(f"{self.entry.winfo_width()}x{self.lista.winfo_reqheight()}+{x}+{y}")
+
+    def _fechar_popup(self):
+        if self.popup is not None:
+            self.popup.destroy()
+            self.popup = None
+            self.lista = None
+
+    def _verificar_foco(self):
+        foco = self.entry.focus_get()
+        if foco is not self.entry and foco is not self.lista:
+            self._fechar_popup()
+
+    def _focar_lista(self, event):
+        if self.lista is not None:
+            self.lista.focus_set()
+            self.lista.selection_clear(0, tk.END)
+            self.lista.selection_set(0)
+            self.lista.activate(0)
+        return "break"
+
+    def _ao_confirmar(self, event):
+        if self.agendado:
+            self.entry.after_cancel(self.agendado)
+            self.escolher_ao_receber = True
+            self._pesquisar()
+        elif self.resultados and self.selecionado is None:
+            self._selecionar(0)
+        return "break"
+
+    def _selecionar_da_lista(self):
+        selecao = self.lista.curselection() if self.lista is not None else ()
+        if selecao:
+            self._selecionar(selecao[0])
+
+    def _selecionar(self, indice):
+        self.selecionado = self.resultados[indice]
+        self.entry.delete(0, tk.END)
+        self.entry.insert(0, self.rotular(self.selecionado))
+        self._fechar_popup()
+        self.entry.focus_set()
+        if self.ao_selecionar:
+            self.ao_selecionar(self.selecionado)
+
+class LinhaCarrinho:
+    __slots__ = ("produto_id", "nome_produto", "quantidade", "preco_unitario", "subtotal")
+
+    def __init__(self, produto_id, nome_produto, quantidade, preco_unitario):
+        self.produto_id = produto_id
+        self.nome_produto = nome_produto
+        self.quantidade = quantidade
+        self.preco_unitario = preco_unitario
+        self.subtotal = quantidade * preco_unitario
+
+class Carrinho:
+    # Itens do pedido em edição, uma linha por produto. O total é ajustado a cada
+    # alteração em vez de ser ressomado, sempre em Decimal.
+    def __init__(self):
+        self.linhas = {}
+        self.total = Decimal("0")
+
+    def __len__(self):
+        return len(self.linhas)
+
+    def __iter__(self):
+        return iter(self.linhas.values())
+
+    def linha(self, produto_id):
+        return self.linhas[produto_id]
+
+    def adicionar(self, produto_id, nome_produto, quantidade, preco_unitario):
+        # Devolve a linha e se ela é nova; um produto repetido soma na linha existente
+        # e passa a usar o preço mais recente.
+        preco_unitario = Decimal(str(preco_unitario))
+        linha = self.linhas.get(produto_id)
+        if linha is None:
+            linha = self.linhas[produto_id] = LinhaCarrinho(produto_id, nome_produto, quantidade, preco_unitario)
+            self.total += linha.subtotal
+            return linha, True
+        linha.preco_unitario = preco_unitario
+        return self.alterar(produto_id, linha.quantidade + quantidade), False
+
+    def alterar(self, produto_id, quantidade):
+        linha = self.linhas[produto_id]
+        self.total -= linha.subtotal
+        linha.quantidade = quantidade
+        linha.subtotal = quantidade * linha.preco_unitario
+        self.total += linha.subtotal
+        return linha
+
+    def remover(self, produto_id):
+        linha = self.linhas.pop(produto_id)
+        self.total -= linha.subtotal
+        return linha
+
+    def limpar(self):
+        self.linhas.clear()
+        self.total = Decimal("0")
+
+    def itens(self):
+        return [
+            {
+                'produto_id': linha.produto_id,
+                'nome_produto': linha.nome_produto,
+                'quantidade': linha.quantidade,
+                'preco_unitario': linha.preco_unitario,
+            }
+            for linha in self.linhas.values()
+        ]
+
+def rotular_cliente(cliente):
+    return f"{cliente['nome']} (CPF: {cliente['cpf']})"
+
+def rotular_produto(prod):
+    return f"{prod['id']} - {prod['nome']} (R$ {prod['preco']:.2f})"
+
+def formatar_cliente(cliente):
+    return (cliente['id'], cliente['nome'], cliente['cpf'], cliente['telefone'], cliente['email'])
+
+def formatar_produto(prod):
+    return (prod['id'], prod['nome'], f"{prod['preco']:.2f}", prod['estoque'], prod['descricao'])
+
+def formatar_linha_carrinho(linha):
+    return (linha.nome_produto, linha.quantidade, f"{linha.preco_unitario:.2f}", f"{linha.subtotal:.2f}")
+
+def formatar_item_pedido(item):
+    subtotal = item['quantidade'] * item['preco_unitario']
+    return ("", f"{item['quantidade']}x {item['nome_produto']}", f"{item['preco_unitario']:.2f} cada", f"{subtotal:.2f}")
+
+def formatar_pedido(pedido):
+    data_formatada = pedido['data_pedido'].strftime("%d/%m/%Y %H:%M") if pedido['data_pedido'] else "N/A"
+    return (pedido['id'], pedido['nome_cliente'], data_formatada, f"{pedido['valor_total']:.2f}")
+
+class ListaVirtual:
+    # Mantém no Treeview apenas uma janela de páginas em torno da posição visível,
+    # buscando as vizinhas por keyset (WHERE (chave) > (...) LIMIT n) conforme a rolagem.
+    # Com coluna_marca, atualizar() traz só as linhas novas ou alteradas desde a
+    # última leitura e as aplica item a item, usando o id do banco como iid.
+    def __init__(self, tree, scrollbar, executor, sql_base, chave, formatar, descricao,
+                 ordem="ASC", tamanho_pagina=TAMANHO_PAGINA, paginas_margem=PAGINAS_MARGEM, grupo=None,
+                 coluna_marca=None, sql_marca=None, ao_inserir=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.executor = executor
+        self.grupo = grupo or f"lista_{descricao}"
+        self.sql_base = sql_base
+        self.chave = chave
+        self.campos_chave = [coluna.split(".")[-1] for coluna in chave]
+        self.formatar = formatar
+        self.descricao = descricao
+        self.ordem = ordem
+        self.tamanho_pagina = tamanho_pagina
+        self.max_linhas = tamanho_pagina * (2 * paginas_margem + 1)
+        self.chaves = {}
+        self.inicio_alcancado = True
+        self.fim_alcancado = True
+        self.carregando = False
+        self.versao = 0
+        self.coluna_marca = coluna_marca
+        self.campo_marca = coluna_marca.split(".")[-1] if coluna_marca else None
+        self.sql_marca = sql_marca
+        self.marca = None
+        self.ao_inserir = ao_inserir
+        self.filtro = None
+        self.tree.configure(yscrollcommand=self._ao_rolar)
+
+    def _ao_rolar(self, primeiro, ultimo):
+        self.scrollbar.set(primeiro, ultimo)
+        if self.carregando:
+            return
+        if float(ultimo) >= LIMIAR_ROLAGEM and not self.fim_alcancado:
+            self.carregar_proxima()
+        elif float(primeiro) <= 1 - LIMIAR_ROLAGEM and not self.inicio_alcancado:
+            self.carregar_anterior()
+
+    def _buscar(self, referencia, para_frente, ao_concluir):
+        self.carregando = True
+        versao = self.versao
+
+        def entregar(linhas):
+            if versao == self.versao:
+                self.carregando = False
+                ao_concluir(linhas)
+
+        sql, params = sql_pagina(self.sql_base, self.chave, self.ordem, referencia, para_frente, self.tamanho_pagina, self.filtro)
+        nome = f"lista_{self.descricao}_{'proxima' if para_frente else 'anterior'}"
+        self.executor.submeter(consulta(sql, params, nome), entregar, self._falha, grupo=self.grupo)
+
+    def _falha(self, err):
+        self.carregando = False
+        messagebox.showerror("Erro de Banco de Dados", f"Erro ao listar {self.descricao}: {err}")
+
+    def cancelar(self):
+        # Descarta as buscas em andamento (a tela foi escondida). Se uma página ou
+        # recarga ficou pela metade, sem marca o próximo atualizar() recarrega tudo.
+        self.executor.cancelar(self.grupo)
+        self.versao += 1
+        if self.carregando:
+            self.carregando = False
+            self.marca = None
+
+    def _chave_da_linha(self, linha):
+        return tuple(linha[campo] for campo in self.campos_chave)
+
+    def _inserir(self, linhas, posicao):
+        novos = []
+        for linha in linhas:
+            iid = str(linha['id'])
+            if iid in self.chaves:
+                self.tree.item(iid, values=self.formatar(linha))
+                continue
+            self.tree.insert("", posicao, iid=iid, values=self.formatar(linha))
+            self.chaves[iid] = self._chave_da_linha(linha)
+            novos.append(iid)
+            if posicao != "end":
+                posicao += 1
+        if novos and self.ao_inserir:
+            self.ao_inserir(novos)
+
+    def _remover(self, iids):
+        if iids:
+            self.tree.delete(*iids)
+            for iid in iids:
+                del self.chaves[iid]
+
+    def _primeira_visivel(self, filhos):
+        if not filhos:
+            return 0
+        return int(float(self.tree.yview()[0]) * len(filhos))
+
+    def _comparavel(self, chave):
+        return tuple(normalizar_texto(valor) if isinstance(valor, str) else valor for valor in chave)
+
+    def _posicao(self, chave, filhos):
+        # Índice onde a chave entra na janela atual, ou None se ela cair fora dela.
+        chaves = [self._comparavel(self.chaves[iid]) for iid in filhos]
+        alvo = self._comparavel(chave)
+        if self.ordem == "ASC":
+            posicao = bisect_left(chaves, alvo)
+        else:
+            chaves.reverse()
+            posicao = len(chaves) - bisect_left(chaves, alvo)
+        if posicao == 0 and not self.inicio_alcancado:
+            return None
+        if posicao == len(filhos) and not self.fim_alcancado:
+            return None
+        return posicao
+
+    def filtrar(self, filtro):
+        self.filtro = filtro
+        self.recarregar()
+
+    def recarregar(self):
+        self.versao += 1
+        versao = self.versao
+        self.carregando = True
+        sql, params = sql_pagina(self.sql_base, self.chave, self.ordem, None, True, self.tamanho_pagina, self.filtro)
+
+        def tarefa(conn):
+            marca = consulta_valor(self.sql_marca, nome=f"lista_{self.descricao}_marca")(conn) if self.sql_marca else None
+            return consulta(sql, params, f"lista_{self.descricao}_inicio")(conn), marca
+
+        def entregar(resultado):
+            if versao == self.versao:
+                self.carregando = False
+                linhas, self.marca = resultado
+                self._aplicar_recarga(linhas)
+
+        self.executor.submeter(tarefa, entregar, self._falha, grupo=self.grupo)
+
+    def atualizar(self):
+        if not self.coluna_marca or self.marca is None:
+            self.recarregar()
+            return
+        versao = self.versao
+        referencia = self.marca
+        if isinstance(referencia, datetime):
+            referencia -= timedelta(seconds=MARGEM_ALTERACOES_S)
+        elif isinstance(referencia, int):
+            referencia -= MARGEM_ALTERACOES_IDS
+        sql = f"{self.sql_base} WHERE {self.coluna_marca} >= %s"
+        params = [referencia]
+        if self.filtro:
+            sql += f" AND ({self.filtro[0]})"
+            params.extend(self.filtro[1])
+        sql += f" ORDER BY {self.coluna_marca} LIMIT %s"
+        params.append(MAX_ALTERACOES)
+
+        def entregar(linhas):
+            if versao != self.versao:
+                return
+            if len(linhas) >= MAX_ALTERACOES:
+                self.recarregar()
+            else:
+                self._aplicar_alteracoes(linhas)
+
+        tarefa = consulta(sql, params, f"lista_{self.descricao}_alteracoes")
+        self.executor.submeter(tarefa, entregar, self._falha, grupo=self.grupo)
+
+    def _aplicar_alteracoes(self, linhas):
+        for linha in linhas:
+            if self.marca is None or linha[self.campo_marca] > self.marca:
+                self.marca = linha[self.campo_marca]
+            iid = str(linha['id'])
+            chave = self._chave_da_linha(linha)
+            if iid in self.chaves:
+                if self.chaves[iid] == chave:
+                    self.tree.item(iid, values=self.formatar(linha))
+                    continue
+                self._remover([iid])
+            filhos = self.tree.get_children()
+            posicao = self._posicao(chave, filhos)
+            if posicao is not None:
+                self._inserir([linha], posicao)
+
+    def _aplicar_recarga(self, linhas):
+        self._remover(self.tree.get_children())
+        self._inserir(linhas, "end")
+        self.inicio_alcancado = True
+        self.fim_alcancado = len(linhas) < self.tamanho_pagina
+        self.tree.yview_moveto(0)
+
+    def carregar_proxima(self):
+        filhos = self.tree.get_children()
+        if filhos:
+            self._buscar(self.chaves[filhos[-1]], True, self._aplicar_proxima)
+
+    def _aplicar_proxima(self, linhas):
+        filhos = self.tree.get_children()
+        topo = self._primeira_visivel(filhos)
+        self.fim_alcancado = len(linhas) < self.tamanho_pagina
+        self._inserir(linhas, "end")
+        filhos = self.tree.get_children()
+        excedente = len(filhos) - self.max_linhas
+        if excedente > 0:
+            self._remover(filhos[:excedente])
+            self.inicio_alcancado = False
+            topo = max(topo - excedente, 0)
+            self.tree.yview_moveto(topo / (len(filhos) - excedente))
+
+    def carregar_anterior(self):
+        filhos = self.tree.get_children()
+        if filhos:
+            self._buscar(self.chaves[filhos[0]], False, self._aplicar_anterior)
+
+    def _aplicar_anterior(self, linhas):
+        filhos = self.tree.get_children()
+        topo = self._primeira_visivel(filhos)
+        self.inicio_alcancado = len(linhas) < self.tamanho_pagina
+        linhas.reverse()
+        self._inserir(linhas, 0)
+        filhos = self.tree.get_children()
+        excedente = len(filhos) - self.max_linhas
+        if excedente > 0:
+            self._remover(filhos[-excedente:])
+            self.fim_alcancado = False
+        total = len(filhos) - max(excedente, 0)
+        self.tree.yview_moveto((topo + len(linhas)) / total)
+
+class ListaBusca:
+    # Resultados de uma busca ordenada por relevância. A relevância não serve de
+    # chave para keyset, então as páginas seguintes vêm por OFFSET conforme a rolagem.
+    def __init__(self, tree, scrollbar, executor, buscar, formatar, grupo, tamanho_pagina=TAMANHO_PAGINA):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.executor = executor
+        self.buscar = buscar
+        self.formatar = formatar
+        self.grupo = grupo
+        self.tamanho_pagina = tamanho_pagina
+        self.texto = ""
+        self.carregados = 0
+        self.fim_alcancado = True
+        self.carregando = False
+        self.versao = 0
+        self.tree.configure(yscrollcommand=self._ao_rolar)
+
+    def pesquisar(self, texto):
+        self.versao += 1
+        self.executor.cancelar(self.grupo)
+        self.texto = texto
+        self.carregados = 0
+        self.fim_alcancado = False
+        self.tree.delete(*self.tree.get_children())
+        self._carregar()
+
+    def _ao_rolar(self, primeiro, ultimo):
+        self.scrollbar.set(primeiro, ultimo)
+        if not self.carregando and not self.fim_alcancado and float(ultimo) >= LIMIAR_ROLAGEM:
+            self._carregar()
+
+    def _carregar(self):
+        self.carregando = True
+        versao = self.versao
+
+        def entregar(linhas):
+            if versao != self.versao:
+                return
+            self.carregando = False
+            for linha in linhas:
+                if not self.tree.exists(str(linha['id'])):
+                    self.tree.insert("", "end", iid=str(linha['id']), values=self.formatar(linha))
+            self.carregados += len(linhas)
+            self.fim_alcancado = len(linhas) < self.tamanho_pagina
+
+        def falhar(err):
+            if versao == self.versao:
+                self.carregando = False
+                messagebox.showerror("Erro de Banco de Dados", f"Erro na busca: {err}")
+
+        tarefa = self.buscar(self.texto, self.tamanho_pagina, self.carregados)
+        self.executor.submeter(tarefa, entregar, falhar, grupo=self.grupo)
+
 class SistemaVendasApp:
-    def __init__(self, root_tk):
+    def __init__(self, root_tk, arquivo_metricas=None):
         self.root = root_tk
         self.root.title("Sistema de Gestão de Vendas")
         self.root.geometry("900x700")
 
-        self.conn = conectar_db()
-        if self.conn:
-            criar_tabelas(self.conn)
-        else:
-            self.root.quit()
-            return
-
-        self.itens_pedido_atual = []
+        self.carrinho = Carrinho()
         self.cliente_selecionado_pedido = None
-        self.total_pedido_atual = tk.DoubleVar(value=0.0)
+        self.total_pedido_atual = tk.StringVar(value="0.00")
+        self.tela_atual = None
+        self.telas = {}
+        self.banco_pronto = False
+        self.diario = DiarioPedidos()
+        self.replicador = None
+        self.pedidos_enviados = 0
+        self.conflitos_avisados = 0
+        self.janela_conflitos = None
+        self.arquivo_metricas = arquivo_metricas
+        self.espera_banco = None
 
         self.criar_menu()
+        self.criar_barra_status()
+        self.executor = ExecutorConsultas(
+            self.root,
+            PoolConexoes(POOL_LEITURA, autocommit=True),
+            PoolConexoes(POOL_ESCRITA),
+            self.atualizar_indicador_ocupado
+        )
+        self.catalogo = CacheCatalogo(self.executor, self.diario)
         self.container_principal = tk.Frame(self.root)
         self.container_principal.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
-        self.mostrar_tela_clientes()
+        self.iniciar_banco()
+        self.label_status.config(text="Conectando ao banco de dados...")
+        self.janela_diagnostico = None
+        self.batimento()
+        self.verificar_diario()
+        if self.arquivo_metricas:
+            self.gravar_metricas()
+
+    def batimento(self, esperado=None):
+        # O atraso entre o horário previsto e a execução real do after mede quanto
+        # tempo o laço de eventos ficou ocupado.
+        agora = time.perf_counter()
+        if esperado is not None:
+            metricas.registrar_atraso(max(0.0, agora - esperado))
+        self.root.after(INTERVALO_BATIMENTO_MS, self.batimento, agora + INTERVALO_BATIMENTO_MS / 1000)
+
+    def iniciar_banco(self):
+        self.executor.submeter(self.inicializar_banco, self.ao_banco_pronto, self.ao_falhar_banco, escrita=True, conexao=False)
+
+    def inicializar_banco(self, _):
+        conn = preparar_banco()
+        try:
+            return aplicar_migracoes(conn)
+        finally:
+            conn.close()
+
+    def ao_banco_pronto(self, aplicadas):
+        self.banco_pronto = True
+        self.espera_banco = None
+        self.replicador = ReplicadorPedidos(self.diario, PoolConexoes(1))
+        if self.tela_atual == "pedidos":
+            # O caixa estava vendendo só com o diário; a venda em curso fica como está.
+            self.filtrar_historico()
+        else:
+            self.mostrar_tela_clientes()
+        if resumos_a_preencher(aplicadas):
+            self.preencher_resumos()
+
+    def preencher_resumos(self):
+        # Recalcula os resumos dos pedidos existentes numa thread e conexão
+        # próprias, sem ocupar os pools nem o indicador de ocupado; o Tk só
+        # acompanha o término. Cada mês é uma transação, então uma interrupção
+        # deixa os meses seguintes para o 'resumos --reconstruir'.
+        estado = {'terminado': False, 'erro': None}
+
+        def trabalhar():
+            try:
+                conn = abrir_conexao()
+                try:
+                    reconstruir_resumos(conn)
+                finally:
+                    conn.close()
+            except Exception as err:
+                estado['erro'] = err
+            estado['terminado'] = True
+
+        def acompanhar():
+            if not estado['terminado']:
+                self.root.after(INTERVALO_DIARIO_MS, acompanhar)
+            elif estado['erro'] is not None:
+                messagebox.showerror(
+                    "Erro nos Resumos",
+                    f"Erro ao calcular os resumos de vendas: {estado['erro']}\n"
+                    "Execute 'resumos --reconstruir' para completá-los."
+                )
+            elif self.tela_atual == "painel":
+                self.atualizar_painel()
+
+        threading.Thread(target=trabalhar, daemon=True).start()
+        acompanhar()
+
+    def ao_falhar_banco(self, err):
+        # Sem o banco na abertura, o caixa fica na tela de pedidos com o diário e o
+        # catálogo guardado, e a preparação é repetida com a espera crescente do
+        # PoolConexoes até o banco voltar.
+        if self.espera_banco is None:
+            self.espera_banco = RECONEXAO_ESPERA_INICIAL
+            messagebox.showwarning(
+                "Banco de Dados Indisponível",
+                f"Não foi possível preparar o banco de dados: {err}\n"
+                "Os pedidos ficam no diário local e serão enviados quando o banco voltar."
+            )
+            self.mostrar_tela_pedidos()
+        else:
+            self.espera_banco = min(self.espera_banco * 2, RECONEXAO_ESPERA_MAXIMA)
+        self.root.after(int(self.espera_banco * 1000), self.iniciar_banco)
 
     def criar_menu(self):
         menubar = tk.Menu(self.root)
@@ -104,16 +2590,308 @@ class SistemaVendasApp:
         menu_cadastros.add_command(label="Clientes", command=self.mostrar_tela_clientes)
         menu_cadastros.add_command(label="Produtos", command=self.mostrar_tela_produtos)
         menu_cadastros.add_command(label="Pedidos", command=self.mostrar_tela_pedidos)
+        menu_cadastros.add_command(label="Painel de Vendas", command=self.mostrar_tela_painel)
         menu_cadastros.add_separator()
         menu_cadastros.add_command(label="Sair", command=self.root.quit)
 
+        menu_dados = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Dados", menu=menu_dados)
+        menu_dados.add_command(label="Importar Clientes...", command=lambda: self.importar("clientes"))
+        menu_dados.add_command(label="Importar Produtos...", command=lambda: self.importar("produtos"))
+        menu_dados.add_separator()
+        menu_dados.add_command(label="Exportar Clientes...", command=lambda: self.exportar("clientes"))
+        menu_dados.add_command(label="Exportar Produtos...", command=lambda: self.exportar("produtos"))
+        menu_dados.add_separator()
+        menu_dados.add_command(label="Pedidos em Conflito...", command=self.mostrar_conflitos)
+
         menu_ajuda = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Ajuda", menu=menu_ajuda)
+        menu_ajuda.add_command(label="Diagnóstico", command=self.mostrar_diagnostico)
         menu_ajuda.add_command(label="Sobre", command=self.mostrar_sobre)
 
-    def limpar_container_principal(self):
-        for widget in self.container_principal.winfo_children():
-            widget.destroy()
+    def criar_barra_status(self):
+        barra_status = ttk.Frame(self.root)
+        barra_status.pack(side=tk.BOTTOM, fill=tk.X)
+        self.label_status = ttk.Label(barra_status, text="")
+        self.label_status.pack(side=tk.LEFT, padx=10, pady=2)
+        self.progresso_status = ttk.Progressbar(barra_status, mode="indeterminate", length=120)
+        self.label_pendentes = ttk.Label(barra_status, text="")
+        self.label_pendentes.pack(side=tk.RIGHT, padx=10, pady=2)
+
+    def verificar_diario(self):
+        pendentes, conflitos, enviados = self.diario.contagem()
+        partes = []
+        if not self.banco_pronto and self.espera_banco is not None:
+            partes.append("Sem banco de dados: vendendo pelo diário local")
+        if pendentes:
+            partes.append(f"Pedidos pendentes: {pendentes}")
+            if self.replicador and self.replicador.ultimo_erro:
+                partes.append("banco de dados indisponível")
+        if conflitos:
+            partes.append(f"Em conflito: {conflitos}")
+        self.label_pendentes.config(text=" | ".join(partes))
+
+        if enviados != self.pedidos_enviados:
+            self.pedidos_enviados = enviados
+            self.catalogo.invalidar("produtos")
+            if "pedidos" in self.telas:
+                self.lista_pedidos.atualizar()
+                self.catalogo.atualizar("produtos")
+            if "produtos" in self.telas:
+                self.lista_produtos.atualizar()
+            if self.tela_atual == "painel":
+                self.atualizar_painel()
+        novos_conflitos = conflitos - self.conflitos_avisados
+        self.conflitos_avisados = conflitos
+        if novos_conflitos > 0:
+            if self.janela_conflitos and self.janela_conflitos.winfo_exists():
+                self.atualizar_conflitos()
+            messagebox.showwarning(
+                "Pedidos em Conflito",
+                f"{novos_conflitos} pedido(s) foram recusados ao serem enviados ao banco de dados.\n"
+                "Veja Dados > Pedidos em Conflito."
+            )
+        self.root.after(INTERVALO_DIARIO_MS, self.verificar_diario)
+
+    def gravar_metricas(self):
+        # Regrava o arquivo de métricas para um coletor externo (node_exporter com
+        # textfile, por exemplo). Uma falha de gravação não interrompe o timer.
+        try:
+            exportar_metricas(self.arquivo_metricas)
+        except OSError as err:
+            print(f"Erro ao gravar métricas em {self.arquivo_metricas}: {err}", file=sys.stderr)
+        self.root.after(INTERVALO_METRICAS_MS, self.gravar_metricas)
+
+    def mostrar_conflitos(self):
+        if self.janela_conflitos and self.janela_conflitos.winfo_exists():
+            self.janela_conflitos.lift()
+            self.atualizar_conflitos()
+            return
+        janela = tk.Toplevel(self.root)
+        janela.title("Pedidos em Conflito")
+        janela.geometry("800x350")
+        self.janela_conflitos = janela
+
+        frame_conflitos = ttk.LabelFrame(janela, text="Pedidos recusados no envio ao banco de dados", padding=10)
+        frame_conflitos.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        colunas = ("Registrado em", "Cliente", "Itens", "Total", "Motivo")
+        self.tree_conflitos = ttk.Treeview(frame_conflitos, columns=colunas, show="headings")
+        for col in colunas:
+            self.tree_conflitos.heading(col, text=col)
+            self.tree_conflitos.column(col, width=100)
+        self.tree_conflitos.column("Itens", width=200)
+        self.tree_conflitos.column("Motivo", width=260)
+        self.tree_conflitos.pack(fill=tk.BOTH, expand=True)
+
+        frame_botoes = ttk.Frame(janela)
+        frame_botoes.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Button(frame_botoes, text="Reenviar Selecionados", command=self.reenviar_conflitos).pack(side=tk.LEFT, padx=5)
+        ttk.Button(frame_botoes, text="Descartar Selecionados", command=self.descartar_conflitos).pack(side=tk.LEFT, padx=5)
+
+        self.atualizar_conflitos()
+
+    def atualizar_conflitos(self):
+        self.tree_conflitos.delete(*self.tree_conflitos.get_children())
+        for pedido in self.diario.conflitos():
+            cliente = self.catalogo.cliente(pedido['cliente_id'])
+            itens = ", ".join(f"{item['quantidade']}x {item['nome_produto'] or item['produto_id']}" for item in pedido['itens'])
+            total = sum(item['quantidade'] * item['preco_unitario'] for item in pedido['itens'])
+            self.tree_conflitos.insert("", tk.END, iid=pedido['uuid'], values=(
+                pedido['registrado_em'].strftime('%d/%m/%Y %H:%M'),
+                cliente['nome'] if cliente else f"ID {pedido['cliente_id']}",
+                itens, f"{total:.2f}", pedido['conflito'].replace("\n", " ")
+            ))
+
+    def reenviar_conflitos(self):
+        selecionados = self.tree_conflitos.selection()
+        if not selecionados:
+            return
+        self.diario.reenviar(selecionados)
+        self.conflitos_avisados -= len(selecionados)
+        if self.replicador:
+            self.replicador.notificar()
+        self.atualizar_conflitos()
+
+    def descartar_conflitos(self):
+        selecionados = self.tree_conflitos.selection()
+        if not selecionados:
+            return
+        if not messagebox.askyesno(
+            "Descartar Pedidos", f"Descartar {len(selecionados)} pedido(s)? Eles não serão gravados no banco de dados.",
+            parent=self.janela_conflitos
+        ):
+            return
+        self.diario.descartar(selecionados)
+        self.conflitos_avisados -= len(selecionados)
+        self.atualizar_conflitos()
+
+    def atualizar_indicador_ocupado(self, ocupado):
+        if ocupado:
+            self.label_status.config(text="Consultando o banco de dados...")
+            self.progresso_status.pack(side=tk.RIGHT, padx=10, pady=2)
+            self.progresso_status.start(10)
+            self.root.config(cursor="watch")
+        else:
+            self.label_status.config(text="")
+            self.progresso_status.stop()
+            self.progresso_status.pack_forget()
+            self.root.config(cursor="")
+
+    def importar(self, tabela):
+        caminho = filedialog.askopenfilename(
+            title=f"Importar {tabela}",
+            filetypes=[("CSV", "*.csv"), ("JSON", "*.json"), ("JSON Lines", "*.jsonl"), ("Todos", "*.*")]
+        )
+        if not caminho:
+            return
+        caminho_rejeitados = os.path.splitext(caminho)[0] + "_rejeitados.csv"
+
+        def ao_progresso(resumo):
+            self.executor.agendar(
+                self.label_status.config,
+                {'text': f"Importando {tabela}: {resumo['lidas']} lidas, {resumo['gravadas']} gravadas, {resumo['rejeitadas']} rejeitadas"}
+            )
+
+        def tarefa(conn):
+            return importar_arquivo(conn, tabela, caminho, caminho_rejeitados, ao_progresso=ao_progresso)
+
+        def ao_concluir(resumo):
+            self.catalogo.invalidar(tabela)
+            mensagem = f"{resumo['lidas']} registros lidos, {resumo['gravadas']} gravados, {resumo['rejeitadas']} rejeitados."
+            if resumo['rejeitadas']:
+                mensagem += f"\nOs rejeitados foram registrados em:\n{caminho_rejeitados}"
+            else:
+                os.remove(caminho_rejeitados)
+            messagebox.showinfo("Importação Concluída", mensagem)
+            if tabela in self.telas:
+                getattr(self, f"lista_{tabela}").atualizar()
+
+        def ao_falhar(err):
+            messagebox.showerror("Erro na Importação", f"Erro ao importar {tabela}: {err}")
+
+        self.executor.submeter(tarefa, ao_concluir, ao_falhar, escrita=True)
+
+    def exportar(self, tabela):
+        caminho = filedialog.asksaveasfilename(
+            title=f"Exportar {tabela}", defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON", "*.json"), ("JSON Lines", "*.jsonl")]
+        )
+        if not caminho:
+            return
+
+        def ao_progresso(total):
+            self.executor.agendar(self.label_status.config, {'text': f"Exportando {tabela}: {total} registros"})
+
+        def ao_concluir(total):
+            messagebox.showinfo("Exportação Concluída", f"{total} registros exportados para:\n{caminho}")
+
+        def ao_falhar(err):
+            messagebox.showerror("Erro na Exportação", f"Erro ao exportar {tabela}: {err}")
+
+        self.executor.submeter(lambda conn: exportar_tabela(conn, tabela, caminho, ao_progresso=ao_progresso), ao_concluir, ao_falhar)
+
+    def exibir_tela(self, tela):
+        # As telas são construídas uma vez e depois só escondidas e reexibidas.
+        # Retorna True quando a tela já existia.
+        # As buscas em andamento da tela escondida são descartadas.
+        if self.tela_atual == "pedidos":
+            self.busca_cliente_pedido.cancelar()
+            self.busca_produto_pedido.cancelar()
+            self.busca_cliente_historico.cancelar()
+            self.lista_pedidos.cancelar()
+        elif self.tela_atual == "clientes":
+            self.lista_clientes.cancelar()
+        elif self.tela_atual == "produtos":
+            self.lista_produtos.cancelar()
+        elif self.tela_atual == "painel":
+            self.executor.cancelar("painel")
+        if self.tela_atual in self.telas:
+            self.telas[self.tela_atual].pack_forget()
+        self.tela_atual = tela
+        if tela in self.telas:
+            self.telas[tela].pack(fill=tk.BOTH, expand=True)
+            return True
+        return False
+
+    def mostrar_diagnostico(self):
+        if self.janela_diagnostico and self.janela_diagnostico.winfo_exists():
+            self.janela_diagnostico.lift()
+            return
+        janela = tk.Toplevel(self.root)
+        janela.title("Diagnóstico")
+        janela.geometry("900x550")
+        self.janela_diagnostico = janela
+
+        frame_consultas = ttk.LabelFrame(janela, text="Consultas", padding=10)
+        frame_consultas.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        colunas = ("Consulta", "Execuções", "Erros", "Linhas", "Média (ms)", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Máx (ms)")
+        self.tree_diagnostico = ttk.Treeview(frame_consultas, columns=colunas, show="headings", height=10)
+        for col in colunas:
+            self.tree_diagnostico.heading(col, text=col)
+            self.tree_diagnostico.column(col, width=80, anchor=tk.E)
+        self.tree_diagnostico.column("Consulta", width=220, anchor=tk.W)
+        self.tree_diagnostico.pack(fill=tk.BOTH, expand=True)
+        self.label_atraso_laco = ttk.Label(frame_consultas, text="")
+        self.label_atraso_laco.pack(anchor=tk.W, pady=(5, 0))
+
+        frame_lentas = ttk.LabelFrame(janela, text=f"Consultas Lentas (acima de {metricas.limiar_lento * 1000:.0f} ms)", padding=10)
+        frame_lentas.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        colunas = ("Quando", "Consulta", "Duração (ms)", "Linhas", "SQL", "Parâmetros")
+        self.tree_lentas = ttk.Treeview(frame_lentas, columns=colunas, show="headings", height=6)
+        for col in colunas:
+            self.tree_lentas.heading(col, text=col)
+            self.tree_lentas.column(col, width=90)
+        self.tree_lentas.column("Quando", width=140)
+        self.tree_lentas.column("Consulta", width=160)
+        self.tree_lentas.column("SQL", width=300)
+        self.tree_lentas.pack(fill=tk.BOTH, expand=True)
+
+        frame_botoes = ttk.Frame(janela)
+        frame_botoes.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Button(frame_botoes, text="Exportar JSON...", command=lambda: self.exportar_diagnostico("json")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(frame_botoes, text="Exportar Prometheus...", command=lambda: self.exportar_diagnostico("prometheus")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(frame_botoes, text="Zerar", command=metricas.zerar).pack(side=tk.RIGHT, padx=5)
+
+        self.atualizar_diagnostico()
+
+    def atualizar_diagnostico(self):
+        if not (self.janela_diagnostico and self.janela_diagnostico.winfo_exists()):
+            return
+        resumo = metricas.resumo()
+        self.tree_diagnostico.delete(*self.tree_diagnostico.get_children())
+        for nome, dados in resumo['consultas'].items():
+            self.tree_diagnostico.insert("", tk.END, values=(
+                nome, dados['contagem'], dados['erros'], dados['linhas'],
+                f"{dados['media_ms']:.1f}", f"{dados['p50_ms']:.1f}", f"{dados['p95_ms']:.1f}",
+                f"{dados['p99_ms']:.1f}", f"{dados['max_ms']:.1f}"
+            ))
+        laco = resumo['laco_eventos']
+        self.label_atraso_laco.config(
+            text=f"Atraso do laço de eventos: p50 {laco['p50_ms']:.1f} ms, p95 {laco['p95_ms']:.1f} ms, "
+                 f"p99 {laco['p99_ms']:.1f} ms, máx {laco['max_ms']:.1f} ms"
+        )
+        self.tree_lentas.delete(*self.tree_lentas.get_children())
+        for lenta in reversed(resumo['consultas_lentas']):
+            self.tree_lentas.insert("", tk.END, values=(
+                lenta['quando'], lenta['consulta'], f"{lenta['duracao_ms']:.1f}", lenta['linhas'],
+                lenta['sql'] or "", ", ".join(lenta['parametros'])
+            ))
+        self.janela_diagnostico.after(INTERVALO_DIAGNOSTICO_MS, self.atualizar_diagnostico)
+
+    def exportar_diagnostico(self, formato):
+        extensao = ".json" if formato == "json" else ".prom"
+        caminho = filedialog.asksaveasfilename(
+            parent=self.janela_diagnostico, title="Exportar métricas", defaultextension=extensao,
+            filetypes=[("JSON", "*.json")] if formato == "json" else [("Prometheus", "*.prom"), ("Texto", "*.txt")]
+        )
+        if not caminho:
+            return
+        try:
+            exportar_metricas(caminho, formato)
+        except OSError as err:
+            messagebox.showerror("Erro na Exportação", f"Erro ao exportar métricas: {err}", parent=self.janela_diagnostico)
+            return
+        messagebox.showinfo("Exportação Concluída", f"Métricas exportadas para:\n{caminho}", parent=self.janela_diagnostico)
 
     def mostrar_sobre(self):
         messagebox.showinfo(
@@ -125,9 +2903,14 @@ class SistemaVendasApp:
         )
 
     def mostrar_tela_clientes(self):
-        self.limpar_container_principal()
+        if not self.banco_pronto:
+            return
+        if self.exibir_tela("clientes"):
+            self.lista_clientes.atualizar()
+            return
         frame_clientes = ttk.LabelFrame(self.container_principal, text="Gerenciamento de Clientes", padding=10)
         frame_clientes.pack(fill=tk.BOTH, expand=True)
+        self.telas["clientes"] = frame_clientes
 
         form_frame = ttk.Frame(frame_clientes, padding=10)
         form_frame.pack(fill=tk.X, pady=5)
@@ -164,6 +2947,11 @@ class SistemaVendasApp:
         self.tree_clientes.configure(yscrollcommand=scrollbar_clientes.set)
         scrollbar_clientes.pack(side="right", fill="y")
 
+        self.lista_clientes = ListaVirtual(
+            self.tree_clientes, scrollbar_clientes, self.executor,
+            SQL_LISTA_CLIENTES, CHAVE_LISTA_CLIENTES, formatar_cliente, "clientes",
+            coluna_marca="atualizado_em", sql_marca=SQL_MARCA_CLIENTES
+        )
         self.listar_clientes()
 
     def adicionar_cliente(self):
@@ -175,43 +2963,49 @@ class SistemaVendasApp:
         if not nome or not cpf:
             messagebox.showwarning("Campo Obrigatório", "Nome e CPF são obrigatórios!")
             return
-
         try:
-            cursor = self.conn.cursor()
-            sql = "INSERT INTO clientes (nome, cpf, telefone, email) VALUES (%s, %s, %s, %s)"
-            cursor.execute(sql, (nome, cpf, telefone, email))
-            self.conn.commit()
+            cpf = normalizar_cpf(cpf)
+        except ValueError:
+            messagebox.showwarning("Dado Inválido", "O CPF deve conter 11 dígitos.")
+            return
+
+        def tarefa(conn):
+            cursor = conn.cursor()
+            try:
+                sql = "INSERT INTO clientes (nome, cpf, telefone, email) VALUES (%s, %s, %s, %s)"
+                with metricas.medir("inserir_cliente", sql, (nome, cpf, telefone, email)) as medida:
+                    cursor.execute(sql, (nome, cpf, telefone, email))
+                    conn.commit()
+                    medida['linhas'] = cursor.rowcount
+            finally:
+                cursor.close()
+
+        def ao_concluir(_):
+            self.catalogo.invalidar("clientes")
             messagebox.showinfo("Sucesso", "Cliente adicionado com sucesso!")
             self.entry_cliente_nome.delete(0, tk.END)
             self.entry_cliente_cpf.delete(0, tk.END)
             self.entry_cliente_telefone.delete(0, tk.END)
             self.entry_cliente_email.delete(0, tk.END)
-            self.listar_clientes()
-        except mysql.connector.Error as err:
+            self.lista_clientes.atualizar()
+
+        def ao_falhar(err):
             messagebox.showerror("Erro de Banco de Dados", f"Erro ao adicionar cliente: {err}")
-        finally:
-            if cursor:
-                cursor.close()
+
+        self.executor.submeter(tarefa, ao_concluir, ao_falhar, escrita=True)
     
     def listar_clientes(self):
-        for i in self.tree_clientes.get_children():
-            self.tree_clientes.delete(i)
-        try:
-            cursor = self.conn.cursor(dictionary=True)
-            cursor.execute("SELECT id, nome, cpf, telefone, email FROM clientes ORDER BY nome")
-            clientes = cursor.fetchall()
-            for cliente in clientes:
-                self.tree_clientes.insert("", "end", values=(cliente['id'], cliente['nome'], cliente['cpf'], cliente['telefone'], cliente['email']))
-        except mysql.connector.Error as err:
-            messagebox.showerror("Erro de Banco de Dados", f"Erro ao listar clientes: {err}")
-        finally:
-            if cursor:
-                cursor.close()
+        self.lista_clientes.recarregar()
 
     def mostrar_tela_produtos(self):
-        self.limpar_container_principal()
+        if not self.banco_pronto:
+            return
+        if self.exibir_tela("produtos"):
+            self.lista_produtos.atualizar()
+            return
         frame_produtos = ttk.LabelFrame(self.container_principal, text="Gerenciamento de Produtos", padding=10)
         frame_produtos.pack(fill=tk.BOTH, expand=True)
+        self.telas["produtos"] = frame_produtos
 
         form_frame = ttk.Frame(frame_produtos, padding=10)
         form_frame.pack(fill=tk.X, pady=5)
@@ -237,19 +3031,69 @@ class SistemaVendasApp:
         btn_adicionar_produto = ttk.Button(form_frame, text="Adicionar Produto", command=self.adicionar_produto)
         btn_adicionar_produto.grid(row=4, column=0, columnspan=2, pady=10)
 
+        busca_frame = ttk.Frame(frame_produtos)
+        busca_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(busca_frame, text="Buscar (nome ou descrição):").pack(side=tk.LEFT, padx=5)
+        self.entry_busca_produtos = ttk.Entry(busca_frame)
+        self.entry_busca_produtos.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.entry_busca_produtos.bind("<KeyRelease>", self.ao_digitar_busca_produtos)
+        self.entry_busca_produtos.bind("<Escape>", lambda event: self.limpar_busca_produtos())
+        self.busca_produtos_agendada = None
+
         cols_produtos = ("ID", "Nome", "Preço (R$)", "Estoque", "Descrição")
         self.tree_produtos = ttk.Treeview(frame_produtos, columns=cols_produtos, show="headings", height=10)
-        for col in cols_produtos:
-            self.tree_produtos.heading(col, text=col)
-            self.tree_produtos.column(col, width=120 if col not in ["ID", "Descrição"] else (50 if col == "ID" else 200) , anchor="w")
+        self.tree_busca_produtos = ttk.Treeview(frame_produtos, columns=cols_produtos, show="headings", height=10)
+        for tree in (self.tree_produtos, self.tree_busca_produtos):
+            for col in cols_produtos:
+                tree.heading(col, text=col)
+                tree.column(col, width=120 if col not in ["ID", "Descrição"] else (50 if col == "ID" else 200) , anchor="w")
         self.tree_produtos.pack(fill=tk.BOTH, expand=True, pady=10)
 
         scrollbar_produtos = ttk.Scrollbar(self.tree_produtos, orient="vertical", command=self.tree_produtos.yview)
         self.tree_produtos.configure(yscrollcommand=scrollbar_produtos.set)
         scrollbar_produtos.pack(side="right", fill="y")
 
+        scrollbar_busca_produtos = ttk.Scrollbar(self.tree_busca_produtos, orient="vertical", command=self.tree_busca_produtos.yview)
+        scrollbar_busca_produtos.pack(side="right", fill="y")
+        self.busca_produtos = ListaBusca(
+            self.tree_busca_produtos, scrollbar_busca_produtos, self.executor,
+            buscar_produtos_texto, formatar_produto, "busca_texto_produtos"
+        )
+
+        self.lista_produtos = ListaVirtual(
+            self.tree_produtos, scrollbar_produtos, self.executor,
+            SQL_LISTA_PRODUTOS, CHAVE_LISTA_PRODUTOS, formatar_produto, "produtos",
+            coluna_marca="atualizado_em", sql_marca=SQL_MARCA_PRODUTOS
+        )
         self.listar_produtos()
 
+    def ao_digitar_busca_produtos(self, event):
+        if self.busca_produtos_agendada:
+            self.entry_busca_produtos.after_cancel(self.busca_produtos_agendada)
+        self.busca_produtos_agendada = self.entry_busca_produtos.after(BUSCA_ATRASO_MS, self.pesquisar_produtos)
+
+    def pesquisar_produtos(self):
+        self.busca_produtos_agendada = None
+        texto = self.entry_busca_produtos.get().strip()
+        if len(texto) < BUSCA_MIN_CARACTERES:
+            self.mostrar_lista_produtos()
+            return
+        if not self.tree_busca_produtos.winfo_ismapped():
+            self.tree_produtos.pack_forget()
+            self.tree_busca_produtos.pack(fill=tk.BOTH, expand=True, pady=10)
+        self.busca_produtos.pesquisar(texto)
+
+    def limpar_busca_produtos(self):
+        self.entry_busca_produtos.delete(0, tk.END)
+        self.mostrar_lista_produtos()
+
+    def mostrar_lista_produtos(self):
+        self.busca_produtos.versao += 1
+        self.executor.cancelar(self.busca_produtos.grupo)
+        if self.tree_busca_produtos.winfo_ismapped():
+            self.tree_busca_produtos.pack_forget()
+            self.tree_produtos.pack(fill=tk.BOTH, expand=True, pady=10)
+
     def adicionar_produto(self):
         nome = self.entry_produto_nome.get()
         descricao = self.entry_produto_descricao.get("1.0", tk.END).strip()
@@ -260,65 +3104,72 @@ class SistemaVendasApp:
             messagebox.showwarning("Campo Obrigatório", "Nome e Preço são obrigatórios!")
             return
         try:
-            preco = float(preco_str.replace(",", "."))
+            preco = converter_preco(preco_str)
             estoque = int(estoque_str) if estoque_str else 0
         except ValueError:
             messagebox.showwarning("Dado Inválido", "Preço e Estoque devem ser números válidos.")
             return
 
-        try:
-            cursor = self.conn.cursor()
-            sql = "INSERT INTO produtos (nome, descricao, preco, estoque) VALUES (%s, %s, %s, %s)"
-            cursor.execute(sql, (nome, descricao, preco, estoque))
-            self.conn.commit()
+        def tarefa(conn):
+            cursor = conn.cursor()
+            try:
+                sql = "INSERT INTO produtos (nome, descricao, preco, estoque) VALUES (%s, %s, %s, %s)"
+                with metricas.medir("inserir_produto", sql, (nome, descricao, preco, estoque)) as medida:
+                    cursor.execute(sql, (nome, descricao, preco, estoque))
+                    conn.commit()
+                    medida['linhas'] = cursor.rowcount
+            finally:
+                cursor.close()
+
+        def ao_concluir(_):
+            self.catalogo.invalidar("produtos")
             messagebox.showinfo("Sucesso", "Produto adicionado com sucesso!")
             self.entry_produto_nome.delete(0, tk.END)
             self.entry_produto_descricao.delete("1.0", tk.END)
             self.entry_produto_preco.delete(0, tk.END)
             self.entry_produto_estoque.delete(0, tk.END)
-            self.listar_produtos()
-        except mysql.connector.Error as err:
+            self.lista_produtos.atualizar()
+
+        def ao_falhar(err):
             messagebox.showerror("Erro de Banco de Dados", f"Erro ao adicionar produto: {err}")
-        finally:
-            if cursor:
-                cursor.close()
+
+        self.executor.submeter(tarefa, ao_concluir, ao_falhar, escrita=True)
 
     def listar_produtos(self):
-        for i in self.tree_produtos.get_children():
-            self.tree_produtos.delete(i)
-        try:
-            cursor = self.conn.cursor(dictionary=True)
-            cursor.execute("SELECT id, nome, preco, estoque, descricao FROM produtos ORDER BY nome")
-            produtos = cursor.fetchall()
-            for prod in produtos:
-                self.tree_produtos.insert("", "end", values=(prod['id'], prod['nome'], f"{prod['preco']:.2f}", prod['estoque'], prod['descricao']))
-        except mysql.connector.Error as err:
-            messagebox.showerror("Erro de Banco de Dados", f"Erro ao listar produtos: {err}")
-        finally:
-            if cursor:
-                cursor.close()
+        self.lista_produtos.recarregar()
 
     def mostrar_tela_pedidos(self):
-        self.limpar_container_principal()
+        # A única tela que abre sem o banco: o caixa vende pelo diário e pelo
+        # catálogo guardado, e o histórico só é lido quando o banco estiver pronto.
+        if self.exibir_tela("pedidos"):
+            if self.banco_pronto:
+                self.lista_pedidos.atualizar()
+                self.catalogo.atualizar("clientes")
+                self.catalogo.atualizar("produtos")
+            return
         frame_pedidos = ttk.LabelFrame(self.container_principal, text="Gerenciamento de Pedidos", padding=10)
         frame_pedidos.pack(fill=tk.BOTH, expand=True)
+        self.telas["pedidos"] = frame_pedidos
 
         novo_pedido_frame = ttk.LabelFrame(frame_pedidos, text="Novo Pedido", padding=10)
         novo_pedido_frame.pack(fill=tk.X, pady=10)
 
-        ttk.Label(novo_pedido_frame, text="Cliente:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        self.combo_cliente_pedido = ttk.Combobox(novo_pedido_frame, state="readonly", width=37)
-        self.combo_cliente_pedido.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
-        self.combo_cliente_pedido.bind("<<ComboboxSelected>>", self.selecionar_cliente_para_pedido)
-        self.carregar_clientes_combobox()
+        ttk.Label(novo_pedido_frame, text="Cliente (nome ou CPF):").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        self.busca_cliente_pedido = CampoBusca(
+            novo_pedido_frame, self.executor, self.buscar_clientes_pedido, rotular_cliente,
+            "busca_clientes", ao_selecionar=self.selecionar_cliente_para_pedido
+        )
+        self.busca_cliente_pedido.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
 
         produto_add_frame = ttk.Frame(novo_pedido_frame)
         produto_add_frame.grid(row=1, column=0, columnspan=4, pady=10, sticky="ew")
 
-        ttk.Label(produto_add_frame, text="Produto:").grid(row=0, column=0, padx=5, pady=2, sticky="w")
-        self.combo_produto_pedido = ttk.Combobox(produto_add_frame, state="readonly", width=30)
-        self.combo_produto_pedido.grid(row=0, column=1, padx=5, pady=2, sticky="ew")
-        self.carregar_produtos_combobox()
+        ttk.Label(produto_add_frame, text="Produto (nome ou código):").grid(row=0, column=0, padx=5, pady=2, sticky="w")
+        self.busca_produto_pedido = CampoBusca(
+            produto_add_frame, self.executor, self.buscar_produtos_pedido, rotular_produto,
+            "busca_produtos", ao_selecionar=lambda produto: self.catalogo.guardar("produtos", [produto]), width=30
+        )
+        self.busca_produto_pedido.grid(row=0, column=1, padx=5, pady=2, sticky="ew")
 
         ttk.Label(produto_add_frame, text="Qtd:").grid(row=0, column=2, padx=5, pady=2, sticky="w")
         self.entry_qtd_produto_pedido = ttk.Entry(produto_add_frame, width=5)
@@ -341,9 +3192,16 @@ class SistemaVendasApp:
         
         scrollbar_itens_pedido = ttk.Scrollbar(self.tree_itens_pedido_atual, orient="vertical", command=self.tree_itens_pedido_atual.yview)
         self.tree_itens_pedido_atual.configure(yscrollcommand=scrollbar_itens_pedido.set)
+        self.tree_itens_pedido_atual.bind("<Double-1>", lambda event: self.alterar_item_pedido_atual())
+        self.tree_itens_pedido_atual.bind("<Delete>", lambda event: self.remover_itens_pedido_atual())
+
+        itens_acoes_frame = ttk.Frame(novo_pedido_frame)
+        itens_acoes_frame.grid(row=3, column=0, columnspan=2, pady=10, sticky="w")
+        ttk.Button(itens_acoes_frame, text="Alterar Quantidade", command=self.alterar_item_pedido_atual).pack(side=tk.LEFT, padx=5)
+        ttk.Button(itens_acoes_frame, text="Remover Item", command=self.remover_itens_pedido_atual).pack(side=tk.LEFT, padx=5)
 
         total_frame = ttk.Frame(novo_pedido_frame)
-        total_frame.grid(row=3, column=0, columnspan=4, pady=10, sticky="e")
+        total_frame.grid(row=3, column=2, columnspan=2, pady=10, sticky="e")
         ttk.Label(total_frame, text="Total do Pedido: R$", font=("Arial", 12, "bold")).pack(side=tk.LEFT, padx=5)
         ttk.Label(total_frame, textvariable=self.total_pedido_atual, font=("Arial", 12, "bold")).pack(side=tk.LEFT)
 
@@ -354,57 +3212,167 @@ class SistemaVendasApp:
         listar_pedidos_frame = ttk.LabelFrame(frame_pedidos, text="Histórico de Pedidos", padding=10)
         listar_pedidos_frame.pack(fill=tk.BOTH, expand=True, pady=10)
 
+        filtro_frame = ttk.Frame(listar_pedidos_frame)
+        filtro_frame.pack(fill=tk.X)
+        ttk.Label(filtro_frame, text="De:").grid(row=0, column=0, padx=5, pady=2, sticky="w")
+        self.entry_historico_de = ttk.Entry(filtro_frame, width=12)
+        self.entry_historico_de.grid(row=0, column=1, padx=5, pady=2)
+        ttk.Label(filtro_frame, text="Até:").grid(row=0, column=2, padx=5, pady=2, sticky="w")
+        self.entry_historico_ate = ttk.Entry(filtro_frame, width=12)
+        self.entry_historico_ate.grid(row=0, column=3, padx=5, pady=2)
+        ttk.Label(filtro_frame, text="Cliente:").grid(row=0, column=4, padx=5, pady=2, sticky="w")
+        self.busca_cliente_historico = CampoBusca(
+            filtro_frame, self.executor, self.buscar_clientes_pedido, rotular_cliente,
+            "busca_clientes_historico", ao_selecionar=lambda cliente: self.filtrar_historico(), width=25
+        )
+        self.busca_cliente_historico.grid(row=0, column=5, padx=5, pady=2, sticky="ew")
+        ttk.Button(filtro_frame, text="Filtrar", command=self.filtrar_historico).grid(row=0, column=6, padx=5, pady=2)
+        ttk.Button(filtro_frame, text="Limpar", command=self.limpar_filtro_historico).grid(row=0, column=7, padx=5, pady=2)
+        filtro_frame.columnconfigure(5, weight=1)
+        for entry in (self.entry_historico_de, self.entry_historico_ate):
+            entry.bind("<Return>", lambda event: self.filtrar_historico())
+
+        arquivo_frame = ttk.Frame(listar_pedidos_frame)
+        arquivo_frame.pack(fill=tk.X)
+        self.label_arquivo_historico = ttk.Label(arquivo_frame, text="")
+        self.label_arquivo_historico.pack(side=tk.LEFT, padx=5)
+        ttk.Button(arquivo_frame, text="Consultar Arquivo...", command=self.consultar_arquivo_historico).pack(side=tk.RIGHT, padx=5)
+
         cols_pedidos = ("ID Pedido", "Cliente", "Data", "Valor Total (R$)")
-        self.tree_pedidos = ttk.Treeview(listar_pedidos_frame, columns=cols_pedidos, show="headings", height=8)
+        self.tree_pedidos = ttk.Treeview(listar_pedidos_frame, columns=cols_pedidos, show="tree headings", height=8)
+        self.tree_pedidos.column("#0", width=30, stretch=False)
         for col in cols_pedidos:
             self.tree_pedidos.heading(col, text=col)
             self.tree_pedidos.column(col, width=150, anchor="w")
         self.tree_pedidos.column("ID Pedido", width=80, anchor="center")
+        self.tree_pedidos.bind("<<TreeviewOpen>>", self.ao_abrir_pedido)
+        self.tree_pedidos.bind("<<TreeviewSelect>>", lambda event: self.carregar_itens_pedidos_visiveis())
+        self.detalhes_pedidos = CacheDetalhesPedidos(self.executor, self.ao_carregar_itens_pedidos)
         self.tree_pedidos.pack(fill=tk.BOTH, expand=True, pady=5)
         
         scrollbar_pedidos = ttk.Scrollbar(self.tree_pedidos, orient="vertical", command=self.tree_pedidos.yview)
         self.tree_pedidos.configure(yscrollcommand=scrollbar_pedidos.set)
         scrollbar_pedidos.pack(side="right", fill="y")
 
-        self.listar_pedidos_registrados()
+        self.lista_pedidos = ListaVirtual(
+            self.tree_pedidos, scrollbar_pedidos, self.executor,
+            SQL_LISTA_PEDIDOS, CHAVE_LISTA_PEDIDOS, formatar_pedido, "pedidos", ordem="DESC",
+            coluna_marca="p.id", sql_marca=SQL_MARCA_PEDIDOS, ao_inserir=self.ao_inserir_pedidos
+        )
+        self.limpar_filtro_historico()
         self.resetar_novo_pedido_form()
 
-    def carregar_clientes_combobox(self):
-        try:
-            cursor = self.conn.cursor(dictionary=True)
-            cursor.execute("SELECT id, nome FROM clientes ORDER BY nome")
-            clientes = cursor.fetchall()
-            self.clientes_map = {f"{c['nome']} (ID: {c['id']})": c['id'] for c in clientes}
-            self.combo_cliente_pedido['values'] = list(self.clientes_map.keys())
-        except mysql.connector.Error as err:
-            messagebox.showerror("Erro", f"Erro ao carregar clientes: {err}")
-        finally:
-            if cursor: cursor.close()
+    def mostrar_tela_painel(self):
+        if not self.banco_pronto:
+            return
+        if self.exibir_tela("painel"):
+            self.atualizar_painel()
+            return
+        frame_painel = ttk.LabelFrame(self.container_principal, text="Painel de Vendas", padding=10)
+        frame_painel.pack(fill=tk.BOTH, expand=True)
+        self.telas["painel"] = frame_painel
 
-    def selecionar_cliente_para_pedido(self, event=None):
-        selected_display_name = self.combo_cliente_pedido.get()
-        if selected_display_name in self.clientes_map:
-            self.cliente_selecionado_pedido = self.clientes_map[selected_display_name]
-        else:
-            self.cliente_selecionado_pedido = None
+        periodo_frame = ttk.Frame(frame_painel)
+        periodo_frame.pack(fill=tk.X)
+        ttk.Label(periodo_frame, text="Período:").pack(side=tk.LEFT, padx=5)
+        self.periodo_painel = ttk.Combobox(periodo_frame, values=list(PERIODOS_PAINEL), state="readonly", width=18)
+        self.periodo_painel.set("Últimos 30 dias")
+        self.periodo_painel.bind("<<ComboboxSelected>>", lambda event: self.atualizar_painel())
+        self.periodo_painel.pack(side=tk.LEFT, padx=5)
+        ttk.Button(periodo_frame, text="Atualizar", command=self.atualizar_painel).pack(side=tk.LEFT, padx=5)
 
-    def carregar_produtos_combobox(self):
-        try:
-            cursor = self.conn.cursor(dictionary=True)
-            cursor.execute("SELECT id, nome, preco FROM produtos WHERE estoque > 0 ORDER BY nome") 
-            produtos = cursor.fetchall()
-            self.produtos_map = {f"{p['nome']} (R$ {p['preco']:.2f})": {'id': p['id'], 'preco': p['preco']} for p in produtos}
-            self.combo_produto_pedido['values'] = list(self.produtos_map.keys())
-        except mysql.connector.Error as err:
-            messagebox.showerror("Erro", f"Erro ao carregar produtos: {err}")
-        finally:
-            if cursor: cursor.close()
+        totais_frame = ttk.Frame(frame_painel)
+        totais_frame.pack(fill=tk.X, pady=10)
+        self.labels_painel = {}
+        for coluna, (chave, titulo) in enumerate((
+            ("faturamento", "Faturamento"), ("pedidos", "Pedidos"), ("ticket", "Ticket Médio"), ("hoje", "Faturamento Hoje")
+        )):
+            cartao = ttk.LabelFrame(totais_frame, text=titulo, padding=10)
+            cartao.grid(row=0, column=coluna, padx=5, sticky="ew")
+            totais_frame.columnconfigure(coluna, weight=1)
+            self.labels_painel[chave] = ttk.Label(cartao, text="-", font=("TkDefaultFont", 14, "bold"))
+            self.labels_painel[chave].pack()
+
+        rankings_frame = ttk.Frame(frame_painel)
+        rankings_frame.pack(fill=tk.BOTH, expand=True)
+        self.trees_painel = {}
+        for coluna, (chave, titulo, colunas) in enumerate((
+            ("produtos", "Produtos Mais Vendidos", ("Produto", "Quantidade", "Valor (R$)")),
+            ("clientes", "Melhores Clientes", ("Cliente", "Pedidos", "Valor (R$)")),
+            ("estoque_baixo", f"Estoque Baixo (até {ESTOQUE_MINIMO} un.)", ("Produto", "Estoque", "Vendidos no Período")),
+        )):
+            quadro = ttk.LabelFrame(rankings_frame, text=titulo, padding=5)
+            quadro.grid(row=0, column=coluna, padx=5, sticky="nsew")
+            rankings_frame.columnconfigure(coluna, weight=1)
+            tree = ttk.Treeview(quadro, columns=colunas, show="headings", height=12)
+            for col in colunas:
+                tree.heading(col, text=col)
+                tree.column(col, width=90, anchor=tk.E)
+            tree.column(colunas[0], width=200, anchor=tk.W)
+            tree.pack(fill=tk.BOTH, expand=True)
+            self.trees_painel[chave] = tree
+        rankings_frame.rowconfigure(0, weight=1)
+
+        self.atualizar_painel()
+
+    def atualizar_painel(self):
+        def ao_falhar(err):
+            messagebox.showerror("Erro no Painel", f"Erro ao carregar o painel de vendas: {err}")
+
+        self.executor.cancelar("painel")
+        self.executor.submeter(
+            carregar_painel(PERIODOS_PAINEL[self.periodo_painel.get()]), self.preencher_painel, ao_falhar, grupo="painel"
+        )
+
+    def preencher_painel(self, painel):
+        pedidos = sum(dia['pedidos'] for dia in painel['dias'])
+        faturamento = sum((dia['valor_total'] for dia in painel['dias']), Decimal("0"))
+        hoje = datetime.now().date()
+        faturamento_hoje = sum((dia['valor_total'] for dia in painel['dias'] if dia['dia'] == hoje), Decimal("0"))
+        self.labels_painel['faturamento'].config(text=f"R$ {faturamento:.2f}")
+        self.labels_painel['pedidos'].config(text=str(pedidos))
+        self.labels_painel['ticket'].config(text=f"R$ {faturamento / pedidos:.2f}" if pedidos else "-")
+        self.labels_painel['hoje'].config(text=f"R$ {faturamento_hoje:.2f}")
+
+        linhas = {
+            'produtos': [(linha['nome'], linha['quantidade'], f"{linha['valor_total']:.2f}") for linha in painel['produtos']],
+            'clientes': [(linha['nome'], linha['pedidos'], f"{linha['valor_total']:.2f}") for linha in painel['clientes']],
+            'estoque_baixo': [(linha['nome'], linha['estoque'], linha['vendidos']) for linha in painel['estoque_baixo']],
+        }
+        for chave, valores in linhas.items():
+            tree = self.trees_painel[chave]
+            tree.delete(*tree.get_children())
+            for linha in valores:
+                tree.insert("", tk.END, values=linha)
+
+    def buscar_clientes_pedido(self, texto):
+        # Sem o banco, só o catálogo guardado responde.
+        if texto.isdigit():
+            cliente = self.catalogo.cliente_por_cpf(texto)
+            if cliente:
+                return [cliente]
+        if not self.banco_pronto:
+            return []
+        return buscar_clientes(texto)
+
+    def selecionar_cliente_para_pedido(self, cliente):
+        self.cliente_selecionado_pedido = cliente['id']
+        self.catalogo.guardar("clientes", [cliente])
+
+    def buscar_produtos_pedido(self, texto):
+        if texto.isdigit():
+            produto = self.catalogo.produto(int(texto))
+            if produto and (produto['estoque'] or 0) > 0:
+                return [produto]
+        if not self.banco_pronto:
+            return []
+        return buscar_produtos(texto)
 
     def adicionar_item_ao_pedido_atual(self):
-        produto_display_name = self.combo_produto_pedido.get()
+        produto = self.busca_produto_pedido.selecionado
         qtd_str = self.entry_qtd_produto_pedido.get()
 
-        if not produto_display_name:
+        if not produto:
             messagebox.showwarning("Seleção Necessária", "Selecione um produto.")
             return
         if not qtd_str:
@@ -420,123 +3388,1292 @@ class SistemaVendasApp:
             messagebox.showwarning("Quantidade Inválida", "A quantidade deve ser um número inteiro.")
             return
 
-        produto_info = self.produtos_map.get(produto_display_name)
-        if not produto_info:
-            messagebox.showerror("Erro", "Produto selecionado não encontrado no mapa.")
-            return
-
-        produto_id = produto_info['id']
-        preco_unitario = produto_info['preco']
-        nome_produto = produto_display_name.split(" (R$")[0]
-        subtotal = quantidade * preco_unitario
+        linha, nova = self.carrinho.adicionar(produto['id'], produto['nome'], quantidade, produto['preco'])
+        iid = str(linha.produto_id)
+        if nova:
+            self.tree_itens_pedido_atual.insert("", "end", iid=iid, values=formatar_linha_carrinho(linha))
+        else:
+            self.tree_itens_pedido_atual.item(iid, values=formatar_linha_carrinho(linha))
+        self.tree_itens_pedido_atual.selection_set(iid)
+        self.tree_itens_pedido_atual.see(iid)
+        self.atualizar_total_pedido_atual()
 
-        self.itens_pedido_atual.append({
-            'produto_id': produto_id,
-            'nome_produto': nome_produto,
-            'quantidade': quantidade,
-            'preco_unitario': preco_unitario,
-            'subtotal': subtotal
-        })
-        self.atualizar_tree_itens_pedido_atual()
-        self.calcular_total_pedido_atual()
+    def alterar_item_pedido_atual(self):
+        selecionados = self.tree_itens_pedido_atual.selection()
+        if not selecionados:
+            messagebox.showwarning("Seleção Necessária", "Selecione um item do pedido.")
+            return
+        iid = selecionados[0]
+        linha = self.carrinho.linha(int(iid))
+        quantidade = simpledialog.askinteger(
+            "Alterar Quantidade", f"Quantidade de {linha.nome_produto} (0 remove o item):",
+            initialvalue=linha.quantidade, minvalue=0, parent=self.root
+        )
+        if quantidade is None:
+            return
+        if quantidade == 0:
+            self.carrinho.remover(linha.produto_id)
+            self.tree_itens_pedido_atual.delete(iid)
+        else:
+            self.carrinho.alterar(linha.produto_id, quantidade)
+            self.tree_itens_pedido_atual.item(iid, values=formatar_linha_carrinho(linha))
+        self.atualizar_total_pedido_atual()
 
-    def atualizar_tree_itens_pedido_atual(self):
-        for i in self.tree_itens_pedido_atual.get_children():
-            self.tree_itens_pedido_atual.delete(i)
-        
-        for item in self.itens_pedido_atual:
-            self.tree_itens_pedido_atual.insert("", "end", values=(
-                item['nome_produto'], 
-                item['quantidade'], 
-                f"{item['preco_unitario']:.2f}",
-                f"{item['subtotal']:.2f}"
-            ))
+    def remover_itens_pedido_atual(self):
+        selecionados = self.tree_itens_pedido_atual.selection()
+        if not selecionados:
+            messagebox.showwarning("Seleção Necessária", "Selecione um item do pedido.")
+            return
+        for iid in selecionados:
+            self.carrinho.remover(int(iid))
+        self.tree_itens_pedido_atual.delete(*selecionados)
+        self.atualizar_total_pedido_atual()
 
-    def calcular_total_pedido_atual(self):
-        total = sum(item['subtotal'] for item in self.itens_pedido_atual)
-        self.total_pedido_atual.set(f"{total:.2f}")
+    def atualizar_total_pedido_atual(self):
+        self.total_pedido_atual.set(f"{self.carrinho.total:.2f}")
 
 
     def finalizar_pedido(self):
         if not self.cliente_selecionado_pedido:
             messagebox.showwarning("Cliente Necessário", "Selecione um cliente para o pedido.")
             return
-        if not self.itens_pedido_atual:
+        if not self.carrinho:
             messagebox.showwarning("Itens Necessários", "Adicione pelo menos um item ao pedido.")
             return
 
-        valor_total_pedido = float(self.total_pedido_atual.get())
-        cursor = None
+        # O pedido vai para o diário local e o replicador o envia ao MySQL em
+        # seguida; assim o caixa não espera pelo banco nem perde a venda se ele cair.
         try:
-            cursor = self.conn.cursor()
-            sql_pedido = "INSERT INTO pedidos (cliente_id, valor_total, data_pedido) VALUES (%s, %s, %s)"
-            data_agora = datetime.now()
-            cursor.execute(sql_pedido, (self.cliente_selecionado_pedido, valor_total_pedido, data_agora))
-            pedido_id = cursor.lastrowid
-
-            sql_item_pedido = "INSERT INTO itens_pedido (pedido_id, produto_id, quantidade, preco_unitario) VALUES (%s, %s, %s, %s)"
-            sql_update_estoque = "UPDATE produtos SET estoque = estoque - %s WHERE id = %s"
-
-            for item in self.itens_pedido_atual:
-                cursor.execute(sql_item_pedido, (pedido_id, item['produto_id'], item['quantidade'], item['preco_unitario']))
-                cursor.execute(sql_update_estoque, (item['quantidade'], item['produto_id']))
-            
-            self.conn.commit()
-            messagebox.showinfo("Sucesso", f"Pedido Nº {pedido_id} finalizado com sucesso!")
-            self.resetar_novo_pedido_form()
-            self.listar_pedidos_registrados()
-            self.carregar_produtos_combobox()
-        
-        except mysql.connector.Error as err:
-            self.conn.rollback()
-            messagebox.showerror("Erro de Banco de Dados", f"Erro ao finalizar pedido: {err}")
-        finally:
-            if cursor:
-                cursor.close()
+            codigo = self.diario.registrar(self.cliente_selecionado_pedido, self.carrinho.itens())
+        except DiarioCheio as err:
+            messagebox.showwarning(
+                "Muitos Pedidos Pendentes",
+                f"O pedido não foi finalizado: {err}\nAguarde o envio dos pedidos pendentes ao banco de dados."
+            )
+            return
+        except sqlite3.Error as err:
+            messagebox.showerror("Erro no Diário Local", f"Erro ao gravar o pedido: {err}")
+            return
+        if self.replicador:
+            self.replicador.notificar()
+        messagebox.showinfo("Sucesso", f"Pedido {codigo[:8]} finalizado com sucesso!")
+        self.resetar_novo_pedido_form()
 
     def resetar_novo_pedido_form(self):
-        self.itens_pedido_atual.clear()
-        self.atualizar_tree_itens_pedido_atual()
-        self.total_pedido_atual.set(0.0)
-        self.combo_cliente_pedido.set('')
-        self.combo_produto_pedido.set('')
+        self.carrinho.limpar()
+        self.tree_itens_pedido_atual.delete(*self.tree_itens_pedido_atual.get_children())
+        self.atualizar_total_pedido_atual()
+        self.busca_cliente_pedido.limpar()
+        self.busca_produto_pedido.limpar()
         self.entry_qtd_produto_pedido.delete(0, tk.END)
         self.entry_qtd_produto_pedido.insert(0, "1")
         self.cliente_selecionado_pedido = None
 
 
-    def listar_pedidos_registrados(self):
-        for i in self.tree_pedidos.get_children():
-            self.tree_pedidos.delete(i)
-        try:
-            cursor = self.conn.cursor(dictionary=True)
-            sql = """
-                SELECT p.id, c.nome as nome_cliente, p.data_pedido, p.valor_total
-                FROM pedidos p
-                JOIN clientes c ON p.cliente_id = c.id
-                ORDER BY p.data_pedido DESC
-            """
-            cursor.execute(sql)
-            pedidos = cursor.fetchall()
+    def ao_inserir_pedidos(self, iids):
+        for iid in iids:
+            self.preencher_itens_pedido(iid)
+
+    def preencher_itens_pedido(self, iid):
+        # Sem os itens em cache, o pedido ganha só uma linha "Carregando itens...",
+        # que garante a seta de expansão e é trocada quando o lote chegar.
+        self.tree_pedidos.delete(*self.tree_pedidos.get_children(iid))
+        itens = self.detalhes_pedidos.obter(int(iid))
+        if itens is None:
+            self.tree_pedidos.insert(iid, "end", iid=f"{iid}:carregando", values=("", "Carregando itens...", "", ""))
+            return
+        for indice, item in enumerate(itens):
+            self.tree_pedidos.insert(iid, "end", iid=f"{iid}:{indice}", values=formatar_item_pedido(item))
+        if not itens:
+            self.tree_pedidos.insert(iid, "end", iid=f"{iid}:vazio", values=("", "Pedido sem itens", "", ""))
+
+    def ao_carregar_itens_pedidos(self, pedido_ids):
+        for pedido_id in pedido_ids:
+            if self.tree_pedidos.exists(f"{pedido_id}:carregando"):
+                self.preencher_itens_pedido(str(pedido_id))
+
+    def ao_abrir_pedido(self, event):
+        iid = self.tree_pedidos.focus()
+        if iid and ":" not in iid and self.tree_pedidos.exists(f"{iid}:carregando"):
+            self.preencher_itens_pedido(iid)
+        self.carregar_itens_pedidos_visiveis()
+
+    def carregar_itens_pedidos_visiveis(self):
+        # Um lote com os pedidos selecionados e os visíveis; depois, em segundo
+        # plano, as páginas vizinhas que a lista já trouxe.
+        filhos = self.tree_pedidos.get_children()
+        if not filhos:
+            return
+        inicio, fim = self.tree_pedidos.yview()
+        primeiro = int(float(inicio) * len(filhos))
+        ultimo = math.ceil(float(fim) * len(filhos))
+        selecionados = [iid.split(":")[0] for iid in self.tree_pedidos.selection()]
+        self.detalhes_pedidos.carregar([int(iid) for iid in (*selecionados, *filhos[primeiro:ultimo])])
+        vizinhos = filhos[max(0, primeiro - TAMANHO_PAGINA):primeiro] + filhos[ultimo:ultimo + TAMANHO_PAGINA]
+        self.detalhes_pedidos.carregar([int(iid) for iid in vizinhos])
+
+    def ler_filtro_historico(self):
+        # Devolve (inicio, fim, cliente_id), com fim exclusivo, ou None se inválido.
+        datas = []
+        for entry in (self.entry_historico_de, self.entry_historico_ate):
+            texto = entry.get().strip()
+            if not texto:
+                datas.append(None)
+                continue
+            try:
+                datas.append(datetime.strptime(texto, "%d/%m/%Y"))
+            except ValueError:
+                messagebox.showwarning("Data Inválida", f"Use o formato dd/mm/aaaa: {texto}")
+                return None
+        inicio, fim = datas
+        if fim is not None:
+            fim += timedelta(days=1)
+        cliente = self.busca_cliente_historico.selecionado
+        if cliente is None and self.busca_cliente_historico.entry.get().strip():
+            messagebox.showwarning("Seleção Necessária", "Selecione o cliente na lista de sugestões.")
+            return None
+        return inicio, fim, cliente['id'] if cliente else None
+
+    def filtrar_historico(self):
+        if not self.banco_pronto:
+            return
+        filtro = self.ler_filtro_historico()
+        if filtro is None:
+            return
+        inicio, fim, cliente_id = filtro
+        self.lista_pedidos.filtrar(filtro_pedidos(inicio, fim, cliente_id))
+
+        def ao_concluir(meses):
+            if not meses:
+                self.label_arquivo_historico.config(text="")
+                return
+            pedidos = sum(mes['pedidos'] for mes in meses)
+            self.label_arquivo_historico.config(
+                text=f"{len({mes['mes'] for mes in meses})} mês(es) deste período estão arquivados ({pedidos} pedidos)."
+            )
+
+        self.executor.submeter(meses_arquivados(inicio, fim), ao_concluir, lambda err: None)
+
+    def limpar_filtro_historico(self):
+        self.entry_historico_de.delete(0, tk.END)
+        self.entry_historico_de.insert(0, (datetime.now() - timedelta(days=DIAS_HISTORICO_PADRAO)).strftime("%d/%m/%Y"))
+        self.entry_historico_ate.delete(0, tk.END)
+        self.busca_cliente_historico.limpar()
+        self.filtrar_historico()
+
+    def consultar_arquivo_historico(self):
+        filtro = self.ler_filtro_historico()
+        if filtro is None:
+            return
+        inicio, fim, cliente_id = filtro
+
+        janela, tree = self.mostrar_pedidos_arquivados()
+
+        def inserir(pedidos):
+            if not janela.winfo_exists():
+                return
             for pedido in pedidos:
-                data_formatada = pedido['data_pedido'].strftime("%d/%m/%Y %H:%M") if pedido['data_pedido'] else "N/A"
-                self.tree_pedidos.insert("", "end", values=(
-                    pedido['id'], 
-                    pedido['nome_cliente'], 
-                    data_formatada,
-                    f"{pedido['valor_total']:.2f}"
-                ))
-        except mysql.connector.Error as err:
-            messagebox.showerror("Erro de Banco de Dados", f"Erro ao listar pedidos: {err}")
-        finally:
-            if cursor:
-                cursor.close()
+                iid = str(pedido['id'])
+                tree.insert("", "end", iid=iid, values=formatar_pedido(pedido))
+                for indice, item in enumerate(pedido['itens']):
+                    tree.insert(iid, "end", iid=f"{iid}:{indice}", values=formatar_item_pedido(item))
+            janela.title(f"Pedidos Arquivados ({len(tree.get_children())}...)")
+
+        def ao_concluir(total):
+            if not janela.winfo_exists():
+                return
+            if not total:
+                janela.destroy()
+                messagebox.showinfo("Arquivo de Pedidos", "Nenhum pedido arquivado neste período.")
+                return
+            janela.title(f"Pedidos Arquivados ({total})")
+
+        def ao_falhar(err):
+            if janela.winfo_exists():
+                janela.destroy()
+            messagebox.showerror("Erro no Arquivo", f"Erro ao consultar o arquivo de pedidos: {err}")
+
+        ao_lote = lambda pedidos: self.executor.agendar(inserir, pedidos)
+        self.executor.submeter(consultar_arquivo(inicio, fim, cliente_id, ao_lote=ao_lote), ao_concluir, ao_falhar)
+
+    def mostrar_pedidos_arquivados(self):
+        janela = tk.Toplevel(self.root)
+        janela.title("Pedidos Arquivados (carregando...)")
+        janela.geometry("700x400")
+        cols_pedidos = ("ID Pedido", "Cliente", "Data", "Valor Total (R$)")
+        tree = ttk.Treeview(janela, columns=cols_pedidos, show="tree headings")
+        tree.column("#0", width=30, stretch=False)
+        for col in cols_pedidos:
+            tree.heading(col, text=col)
+            tree.column(col, width=150, anchor="w")
+        tree.column("ID Pedido", width=80, anchor="center")
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        scrollbar = ttk.Scrollbar(tree, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        return janela, tree
 
     def __del__(self):
-        if hasattr(self, 'conn') and self.conn and self.conn.is_connected():
-            self.conn.close()
+        if getattr(self, 'replicador', None):
+            self.replicador.encerrar()
+        if hasattr(self, 'diario'):
+            self.diario.fechar()
+        if hasattr(self, 'executor'):
+            self.executor.encerrar()
+
+NOMES = ["Ana", "Bruno", "Carla", "Daniel", "Eduarda", "Felipe", "Gabriela", "Heitor", "Isabela", "João",
+         "Larissa", "Marcos", "Natália", "Otávio", "Paula", "Rafael", "Sofia", "Thiago", "Vitória", "Yuri"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Lima", "Pereira", "Costa", "Rodrigues", "Almeida", "Ramos"]
+PRODUTOS_BASE = ["Bandeja de Ovo", "Arroz", "Feijão", "Café", "Leite", "Açúcar", "Farinha", "Óleo", "Macarrão", "Sabão"]
+
+def conectar_cli(args):
+    global DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
+    DB_HOST, DB_USER, DB_PASSWORD, DB_NAME = args.host, args.usuario, args.senha, args.banco
+    conn = preparar_banco()
+    if resumos_a_preencher(aplicar_migracoes(conn)):
+        reconstruir_resumos(conn)
+    return conn
+
+def inserir_em_lotes(conn, sql_inicio, colunas, linhas, lote):
+    cursor = conn.cursor()
+    try:
+        for inicio in range(0, len(linhas), lote):
+            bloco = linhas[inicio:inicio + lote]
+            valores = [valor for linha in bloco for valor in linha]
+            cursor.execute(sql_inicio + ", ".join(["(" + ", ".join(["%s"] * colunas) + ")"] * len(bloco)), valores)
+            conn.commit()
+    finally:
+        cursor.close()
+
+def semear_dados(conn, clientes, produtos, pedidos, itens_por_pedido, lote=5000, semente=42):
+    aleatorio = random.Random(semente)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for tabela in ("itens_pedido", "pedidos", "produtos", "clientes", *RESUMOS_VENDAS):
+            cursor.execute(f"TRUNCATE TABLE {tabela}")
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    finally:
+        cursor.close()
+
+    linhas = []
+    for cliente_id in range(1, clientes + 1):
+        nome = f"{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)} {cliente_id}"
+        linhas.append((cliente_id, nome, f"{cliente_id:011d}", f"9{aleatorio.randrange(10**7, 10**8)}", f"cliente{cliente_id}@exemplo.com"))
+    inserir_em_lotes(conn, "INSERT INTO clientes (id, nome, cpf, telefone, email) VALUES ", 5, linhas, lote)
+
+    precos = {}
+    linhas = []
+    for produto_id in range(1, produtos + 1):
+        precos[produto_id] = Decimal(aleatorio.randrange(100, 50000)) / 100
+        nome = f"{aleatorio.choice(PRODUTOS_BASE)} {produto_id}"
+        linhas.append((produto_id, nome, f"Descrição do produto {nome}", precos[produto_id], 10**6))
+    inserir_em_lotes(conn, "INSERT INTO produtos (id, nome, descricao, preco, estoque) VALUES ", 5, linhas, lote)
+
+    agora = datetime.now()
+    item_id = 1
+    for inicio in range(1, pedidos + 1, lote):
+        linhas_pedidos = []
+        linhas_itens = []
+        for pedido_id in range(inicio, min(inicio + lote, pedidos + 1)):
+            total = Decimal("0")
+            for _ in range(aleatorio.randint(1, itens_por_pedido)):
+                produto_id = aleatorio.randint(1, produtos)
+                quantidade = aleatorio.randint(1, 5)
+                total += precos[produto_id] * quantidade
+                linhas_itens.append((item_id, pedido_id, produto_id, quantidade, precos[produto_id]))
+                item_id += 1
+            data = agora - timedelta(seconds=aleatorio.randrange(365 * 24 * 3600))
+            linhas_pedidos.append((pedido_id, aleatorio.randint(1, clientes), data, total))
+        inserir_em_lotes(conn, "INSERT INTO pedidos (id, cliente_id, data_pedido, valor_total) VALUES ", 4, linhas_pedidos, lote)
+        inserir_em_lotes(conn, "INSERT INTO itens_pedido (id, pedido_id, produto_id, quantidade, preco_unitario) VALUES ", 5, linhas_itens, lote)
+    reconstruir_resumos(conn)
+
+def medir(nome, funcao, repeticoes):
+    tempos = []
+    linhas = 0
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        linhas += funcao()
+        tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    total = sum(tempos)
+    return {
+        'caso': nome,
+        'repeticoes': repeticoes,
+        'linhas': linhas,
+        'media_ms': total / repeticoes * 1000,
+        'p50_ms': percentil(tempos, 50) * 1000,
+        'p95_ms': percentil(tempos, 95) * 1000,
+        'p99_ms': percentil(tempos, 99) * 1000,
+        'max_ms': tempos[-1] * 1000,
+        'linhas_por_s': linhas / total if total else 0.0,
+    }
+
+def casos_benchmark(conn, aleatorio, repeticoes):
+    def contar(sql, params=()):
+        return lambda: len(consulta(sql, params)(conn))
+
+    def pagina(sql_base, chave, ordem, tabela, colunas):
+        # As chaves de referência são sorteadas antes da medição, por busca na PK.
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT MAX(id) FROM {tabela}")
+        maximo = cursor.fetchone()[0] or 1
+        referencias = []
+        for _ in range(repeticoes):
+            cursor.execute(f"SELECT {colunas} FROM {tabela} WHERE id >= %s ORDER BY id LIMIT 1", (aleatorio.randint(1, maximo),))
+            referencias.append(cursor.fetchone())
+        cursor.close()
+
+        def executar():
+            sql, params = sql_pagina(sql_base, chave, ordem, referencias.pop(), True, TAMANHO_PAGINA)
+            return len(consulta(sql, params)(conn))
+        return executar
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(id) FROM clientes")
+    max_cliente = cursor.fetchone()[0] or 1
+    cursor.execute("SELECT id, preco FROM produtos ORDER BY id")
+    produtos = cursor.fetchall()
+    cursor.close()
+
+    # Um cache de produtos cheio: a primeira leitura relê todas as chaves, as
+    # seguintes só as alteradas desde a marca.
+    ids_catalogo = [produto_id for produto_id, _ in aleatorio.sample(produtos, min(len(produtos), CACHE_CATALOGO_MAX))]
+    marca_catalogo = carregar_catalogo("produtos", ids_catalogo)(conn)[0]
+
+    def busca(funcao, prefixos):
+        return lambda: len(funcao(aleatorio.choice(prefixos))(conn))
+
+    def checkout():
+        itens = [
+            {'produto_id': produto_id, 'quantidade': aleatorio.randint(1, 3), 'preco_unitario': preco}
+            for produto_id, preco in aleatorio.sample(produtos, min(len(produtos), aleatorio.randint(1, 10)))
+        ]
+        registrar_pedido(conn, aleatorio.randint(1, max_cliente), itens)
+        return len(itens)
+
+    return [
+        ("lista_clientes_primeira_pagina", contar(*sql_pagina(SQL_LISTA_CLIENTES, CHAVE_LISTA_CLIENTES, "ASC", None, True, TAMANHO_PAGINA))),
+        ("lista_clientes_pagina_aleatoria", pagina(SQL_LISTA_CLIENTES, CHAVE_LISTA_CLIENTES, "ASC", "clientes", "nome, id")),
+        ("lista_produtos_primeira_pagina", contar(*sql_pagina(SQL_LISTA_PRODUTOS, CHAVE_LISTA_PRODUTOS, "ASC", None, True, TAMANHO_PAGINA))),
+        ("lista_produtos_pagina_aleatoria", pagina(SQL_LISTA_PRODUTOS, CHAVE_LISTA_PRODUTOS, "ASC", "produtos", "nome, id")),
+        ("lista_pedidos_primeira_pagina", contar(*sql_pagina(SQL_LISTA_PEDIDOS, CHAVE_LISTA_PEDIDOS, "DESC", None, True, TAMANHO_PAGINA))),
+        ("lista_pedidos_pagina_aleatoria", pagina(SQL_LISTA_PEDIDOS, CHAVE_LISTA_PEDIDOS, "DESC", "pedidos", "data_pedido, id")),
+        ("busca_clientes_prefixo", busca(buscar_clientes, [nome[:3] for nome in NOMES])),
+        ("busca_produtos_prefixo", busca(buscar_produtos, [nome[:3] for nome in PRODUTOS_BASE])),
+        ("busca_produtos_texto", busca(buscar_produtos_texto, [normalizar_texto(nome) for nome in PRODUTOS_BASE])),
+        ("catalogo_produtos_cheio", lambda: len(carregar_catalogo("produtos", ids_catalogo)(conn)[2])),
+        ("catalogo_produtos_atualizacao", lambda: len(carregar_catalogo("produtos", ids_catalogo, marca_catalogo)(conn)[2])),
+        ("painel_30_dias", lambda: sum(len(linhas) for linhas in carregar_painel(30)(conn).values() if isinstance(linhas, list))),
+        ("checkout", checkout),
+    ]
+
+def executar_benchmark(args):
+    if args.banco == DB_NAME:
+        sys.exit(f"O benchmark apaga os dados do banco; use um banco separado de '{DB_NAME}'.")
+    conn = conectar_cli(args)
+    try:
+        if not args.sem_semear:
+            inicio = time.perf_counter()
+            semear_dados(conn, args.clientes, args.produtos, args.pedidos, args.itens_por_pedido, args.lote)
+            print(f"Dados gerados em {time.perf_counter() - inicio:.1f}s")
+        aleatorio = random.Random(args.semente)
+        resultados = []
+        for nome, funcao in casos_benchmark(conn, aleatorio, args.repeticoes):
+            if args.casos and nome not in args.casos:
+                continue
+            resultado = medir(nome, funcao, args.repeticoes)
+            resultados.append(resultado)
+            print(f"{nome:35} p50 {resultado['p50_ms']:9.2f} ms  p95 {resultado['p95_ms']:9.2f} ms  "
+                  f"p99 {resultado['p99_ms']:9.2f} ms  {resultado['linhas_por_s']:12.0f} linhas/s")
+    finally:
+        conn.close()
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump({
+                'data': datetime.now().isoformat(timespec="seconds"),
+                'python': platform.python_version(),
+                'volumes': {'clientes': args.clientes, 'produtos': args.produtos, 'pedidos': args.pedidos},
+                'resultados': resultados,
+            }, arquivo, ensure_ascii=False, indent=2)
+
+def terminal_carga(indice, conexao, opcoes, largada, resultados):
+    # Um processo por terminal, cada um com sua conexão, registrando pedidos pelo
+    # mesmo registrar_pedido do caixa até acabar o tempo. Deadlocks e esperas de
+    # trava estouradas são repetidos com o mesmo uuid, como faria o replicador.
+    global DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
+    DB_HOST, DB_USER, DB_PASSWORD, DB_NAME = conexao
+    aleatorio = random.Random(opcoes['semente'] + indice)
+    resultado = {
+        'pedidos': 0, 'itens': 0, 'recusados': 0, 'falhas': 0,
+        'deadlocks': 0, 'esperas_trava': 0, 'repeticoes': 0, 'latencias': [],
+    }
+    conn = None
+    try:
+        conn = abrir_conexao()
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM clientes")
+        max_cliente = cursor.fetchone()[0] or 1
+        cursor.execute("SELECT id, preco FROM produtos ORDER BY id")
+        produtos = cursor.fetchall()
+        cursor.close()
+        conn.rollback()
+        quentes = produtos[:opcoes['produtos_quentes']]
+        frios = produtos[opcoes['produtos_quentes']:] or quentes
+
+        largada.wait()
+        fim = time.perf_counter() + opcoes['duracao']
+        while time.perf_counter() < fim:
+            carrinho = {}
+            for _ in range(aleatorio.randint(opcoes['itens_min'], opcoes['itens_max'])):
+                produto_id, preco = aleatorio.choice(quentes if aleatorio.random() < opcoes['fracao_quente'] else frios)
+                carrinho[produto_id] = {
+                    'produto_id': produto_id,
+                    'quantidade': aleatorio.randint(1, opcoes['quantidade_max']),
+                    'preco_unitario': preco,
+                }
+            itens = list(carrinho.values())
+            codigo = str(uuid.uuid4())
+            inicio = time.perf_counter()
+            for tentativa in range(opcoes['tentativas'] + 1):
+                try:
+                    registrar_pedido(conn, aleatorio.randint(1, max_cliente), itens, codigo)
+                except EstoqueInsuficiente:
+                    resultado['recusados'] += 1
+                except mysql.connector.Error as err:
+                    if err.errno == mysql.connector.errorcode.ER_LOCK_DEADLOCK:
+                        resultado['deadlocks'] += 1
+                    elif err.errno == mysql.connector.errorcode.ER_LOCK_WAIT_TIMEOUT:
+                        resultado['esperas_trava'] += 1
+                    else:
+                        raise
+                    if tentativa < opcoes['tentativas']:
+                        resultado['repeticoes'] += 1
+                        time.sleep(aleatorio.uniform(0, 0.01 * 2 ** tentativa))
+                        continue
+                    resultado['falhas'] += 1
+                else:
+                    resultado['pedidos'] += 1
+                    resultado['itens'] += len(itens)
+                    resultado['latencias'].append(time.perf_counter() - inicio)
+                break
+    finally:
+        if conn is not None:
+            conn.close()
+        resultados.put(resultado)
+
+def fotografar_estoque(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id, estoque FROM produtos")
+        estoques = dict(cursor.fetchall())
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM pedidos")
+        return estoques, cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        conn.rollback()
+
+def verificar_estoque(conn, estoques_antes, ultimo_pedido):
+    # A baixa de estoque de cada produto tem de bater com a soma das quantidades
+    # vendidas nos pedidos criados durante a carga.
+    estoques_depois, _ = fotografar_estoque(conn)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT produto_id, SUM(quantidade) FROM itens_pedido WHERE pedido_id > %s GROUP BY produto_id",
+            (ultimo_pedido,)
+        )
+        vendidos = {produto_id: int(quantidade) for produto_id, quantidade in cursor.fetchall()}
+        cursor.execute("SELECT COUNT(*) FROM pedidos WHERE id > %s", (ultimo_pedido,))
+        pedidos = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT COUNT(*) FROM pedidos p
+            WHERE p.id > %s AND p.valor_total <> (
+                SELECT COALESCE(SUM(i.quantidade * i.preco_unitario), 0) FROM itens_pedido i WHERE i.pedido_id = p.id
+            )
+        """, (ultimo_pedido,))
+        totais_divergentes = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        conn.rollback()
+    divergencias = []
+    for produto_id, antes in estoques_antes.items():
+        baixa = (antes or 0) - (estoques_depois.get(produto_id) or 0)
+        vendido = vendidos.get(produto_id, 0)
+        if baixa != vendido or (estoques_depois.get(produto_id) or 0) < 0:
+            divergencias.append({'produto_id': produto_id, 'baixa': baixa, 'vendido': vendido})
+    return {'pedidos': pedidos, 'totais_divergentes': totais_divergentes, 'divergencias': divergencias}
+
+def executar_carga(args):
+    if args.banco == DB_NAME:
+        sys.exit(f"O teste de carga altera estoques e grava pedidos; use um banco separado de '{DB_NAME}'.")
+    if args.host not in ("localhost", "127.0.0.1", "::1"):
+        sys.exit("O teste de carga só roda contra uma instância local do banco de dados.")
+    conn = conectar_cli(args)
+    try:
+        if args.semear:
+            semear_dados(conn, args.clientes, args.produtos, 0, 1)
+        if args.estoque is not None:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE produtos SET estoque = %s", (args.estoque,))
+            conn.commit()
+            cursor.close()
+        estoques_antes, ultimo_pedido = fotografar_estoque(conn)
+        if not estoques_antes:
+            sys.exit("Não há produtos cadastrados; use --semear.")
+
+        opcoes = {
+            'duracao': args.duracao, 'itens_min': args.itens_min, 'itens_max': args.itens_max,
+            'quantidade_max': args.quantidade_max, 'produtos_quentes': args.produtos_quentes,
+            'fracao_quente': args.fracao_quente, 'tentativas': args.tentativas, 'semente': args.semente,
+        }
+        conexao = (DB_HOST, DB_USER, DB_PASSWORD, DB_NAME)
+        largada = multiprocessing.Event()
+        resultados = multiprocessing.Queue()
+        terminais = [
+            multiprocessing.Process(target=terminal_carga, args=(indice, conexao, opcoes, largada, resultados))
+            for indice in range(args.terminais)
+        ]
+        for terminal in terminais:
+            terminal.start()
+        inicio = time.perf_counter()
+        largada.set()
+        parciais = [resultados.get() for _ in terminais]
+        duracao = time.perf_counter() - inicio
+        for terminal in terminais:
+            terminal.join()
+
+        consistencia = verificar_estoque(conn, estoques_antes, ultimo_pedido)
+    finally:
+        conn.close()
+
+    total = {campo: sum(parcial[campo] for parcial in parciais) for campo in parciais[0] if campo != 'latencias'}
+    latencias = sorted(latencia for parcial in parciais for latencia in parcial['latencias'])
+    resumo = dict(
+        total,
+        terminais=args.terminais,
+        duracao_s=duracao,
+        pedidos_por_s=total['pedidos'] / duracao if duracao else 0.0,
+        p50_ms=percentil(latencias, 50) * 1000,
+        p99_ms=percentil(latencias, 99) * 1000,
+        max_ms=(latencias[-1] if latencias else 0.0) * 1000,
+        pedidos_no_banco=consistencia['pedidos'],
+        totais_divergentes=consistencia['totais_divergentes'],
+        divergencias=consistencia['divergencias'],
+    )
+    print(f"{args.terminais} terminais por {duracao:.1f}s: {total['pedidos']} pedidos ({resumo['pedidos_por_s']:.1f} pedidos/s), "
+          f"{total['itens']} itens")
+    print(f"Latência do commit: p50 {resumo['p50_ms']:.2f} ms  p99 {resumo['p99_ms']:.2f} ms  máx {resumo['max_ms']:.2f} ms")
+    print(f"Deadlocks: {total['deadlocks']}  Esperas de trava: {total['esperas_trava']}  Repetições: {total['repeticoes']}  "
+          f"Falhas: {total['falhas']}  Recusados por estoque: {total['recusados']}")
+    consistente = (
+        not consistencia['divergencias'] and not consistencia['totais_divergentes']
+        and consistencia['pedidos'] == total['pedidos']
+    )
+    if consistente:
+        print("Estoque consistente com os itens vendidos.")
+    else:
+        print(f"INCONSISTÊNCIA: {consistencia['pedidos']} pedidos no banco para {total['pedidos']} confirmados, "
+              f"{len(consistencia['divergencias'])} produtos com baixa diferente do vendido, "
+              f"{consistencia['totais_divergentes']} pedidos com total diferente da soma dos itens.")
+        for divergencia in consistencia['divergencias'][:20]:
+            print(f"  produto {divergencia['produto_id']}: baixa {divergencia['baixa']}, vendido {divergencia['vendido']}")
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(dict(resumo, data=datetime.now().isoformat(timespec="seconds"), python=platform.python_version()),
+                      arquivo, ensure_ascii=False, indent=2)
+    if not consistente:
+        sys.exit(1)
+
+def executar_arquivamento(args):
+    conn = conectar_cli(args)
+    try:
+        resumos = arquivar_pedidos(
+            conn, args.manter_meses, args.diretorio, args.lote,
+            lambda resumo: print(f"{resumo['mes']}: {resumo['pedidos']} pedidos, {resumo['itens']} itens, "
+                                 f"R$ {resumo['valor_total']:.2f} -> {resumo['arquivo']}")
+        )
+    finally:
+        conn.close()
+    if not resumos:
+        print("Nenhum mês a arquivar.")
+
+def executar_consulta_arquivo(args):
+    def imprimir(pedidos):
+        for pedido in pedidos:
+            print(f"{pedido['id']:>8}  {pedido['data_pedido']:%Y-%m-%d %H:%M}  {pedido['nome_cliente'][:30]:30}  "
+                  f"{pedido['valor_total']:>10.2f}  {len(pedido['itens'])} itens")
+
+    conn = conectar_cli(args)
+    try:
+        inicio = datetime.fromisoformat(args.de) if args.de else None
+        fim = datetime.fromisoformat(args.ate) + timedelta(days=1) if args.ate else None
+        total = consultar_arquivo(inicio, fim, args.cliente, args.diretorio, ao_lote=imprimir)(conn)
+    finally:
+        conn.close()
+    print(f"{total} pedidos arquivados encontrados.", file=sys.stderr)
+
+def executar_resumos(args):
+    conn = conectar_cli(args)
+    inicio = datetime.fromisoformat(args.de) if args.de else None
+    fim = datetime.fromisoformat(args.ate) + timedelta(days=1) if args.ate else None
+    try:
+        if args.reconstruir:
+            reconstruir_resumos(
+                conn, inicio, fim,
+                lambda inicio_mes, fim_mes: print(f"Resumos de {inicio_mes:%Y-%m-%d} a {fim_mes - timedelta(days=1):%Y-%m-%d} reconstruídos")
+            )
+        divergencias = verificar_resumos(conn, inicio, fim)
+    finally:
+        conn.close()
+    for tabela, chave, esperado, encontrado in divergencias[:100]:
+        print(f"{tabela:22} {str(chave):30} esperado {esperado}  encontrado {encontrado}")
+    if divergencias:
+        print(f"{len(divergencias)} divergência(s) entre os resumos e os pedidos.", file=sys.stderr)
+        sys.exit(1)
+    print("Resumos conferem com os pedidos.")
+
+def executar_importacao(args):
+    conn = conectar_cli(args)
+    inicio = time.perf_counter()
+
+    def ao_progresso(resumo):
+        print(f"\r{resumo['lidas']} lidas, {resumo['gravadas']} gravadas, {resumo['rejeitadas']} rejeitadas", end="", file=sys.stderr)
+
+    try:
+        resumo = importar_arquivo(conn, args.tabela, args.arquivo, args.rejeitados, args.lote, ao_progresso)
+    finally:
+        conn.close()
+    print(file=sys.stderr)
+    print(f"{resumo['lidas']} lidas, {resumo['gravadas']} gravadas, {resumo['rejeitadas']} rejeitadas "
+          f"em {time.perf_counter() - inicio:.1f}s")
+    if resumo['rejeitadas']:
+        sys.exit(1)
+
+def executar_exportacao(args):
+    conn = conectar_cli(args)
+    inicio = time.perf_counter()
+    try:
+        total = exportar_tabela(conn, args.tabela, args.arquivo, args.lote)
+    finally:
+        conn.close()
+    print(f"{total} registros exportados em {time.perf_counter() - inicio:.1f}s")
+
+def soma_linhas(linhas):
+    # Soma (mod 2^64) de um hash por linha: não depende da ordem de leitura, então
+    # as partes lidas em paralelo se combinam somando.
+    soma = 0
+    for linha in linhas:
+        texto = json.dumps(list(linha), ensure_ascii=False, default=str, separators=(",", ":"))
+        soma += int.from_bytes(hashlib.blake2b(texto.encode("utf-8"), digest_size=8).digest(), "big")
+    return soma % 2**64
+
+def em_paralelo(conexoes, tarefas, executar):
+    # Uma thread por conexão, consumindo a mesma fila de tarefas. A primeira falha
+    # interrompe as demais e é relançada.
+    fila = queue.Queue()
+    for tarefa in tarefas:
+        fila.put(tarefa)
+    resultados = []
+    erros = []
+
+    def trabalhar(conn):
+        while not erros:
+            try:
+                tarefa = fila.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                resultados.append(executar(conn, tarefa))
+            except BaseException as err:
+                erros.append(err)
+                return
+
+    threads = [threading.Thread(target=trabalhar, args=(conn,), daemon=True) for conn in conexoes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if erros:
+        raise erros[0]
+    return resultados
+
+def abrir_conexoes_backup(quantidade):
+    # TIMESTAMP é convertido pelo fuso da sessão; em UTC o backup não depende do
+    # fuso do servidor de origem nem do de destino.
+    conexoes = []
+    try:
+        for _ in range(quantidade):
+            conn = abrir_conexao()
+            cursor = conn.cursor()
+            cursor.execute("SET SESSION time_zone = '+00:00'")
+            cursor.close()
+            conexoes.append(conn)
+    except BaseException:
+        fechar_conexoes(conexoes)
+        raise
+    return conexoes
+
+def fechar_conexoes(conexoes):
+    for conn in conexoes:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+def sql_parte_backup(tabela, colunas, parte):
+    sql = f"SELECT {', '.join(colunas)} FROM {tabela}"
+    if parte['de'] is not None:
+        sql += f" WHERE {parte['coluna']} >= %s AND {parte['coluna']} < %s"
+        return sql, (parte['de'], parte['ate'])
+    return sql, ()
+
+def planejar_backup(conn, lote):
+    # Colunas e faixas de cada tabela, lidas dentro do snapshot: por id, ou por dia
+    # nos resumos, com dias suficientes para dar em média um lote por parte. As
+    # datas ficam como texto ISO para o manifesto. Tabelas sem id nem dia
+    # (arquivos_pedidos, uma linha por arquivo) vão numa parte só.
+    plano = {}
+    for tabela in TABELAS_BACKUP:
+        colunas = [linha[0] for linha in ler(
+            conn,
+            "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION",
+            (tabela,), "backup_colunas"
+        )]
+        partes = [{'coluna': None, 'de': None, 'ate': None}]
+        if "id" in colunas:
+            minimo, maximo = ler(conn, f"SELECT MIN(id), MAX(id) FROM {tabela}", (), "backup_faixa")[0]
+            partes = [] if minimo is None else [
+                {'coluna': "id", 'de': inicio, 'ate': inicio + lote} for inicio in range(minimo, maximo + 1, lote)
+            ]
+        elif "dia" in colunas:
+            minimo, maximo, linhas = ler(
+                conn, f"SELECT MIN(dia), MAX(dia), COUNT(*) FROM {tabela}", (), "backup_faixa_dias"
+            )[0]
+            partes = []
+            if minimo is not None:
+                total_dias = (maximo - minimo).days + 1
+                passo = timedelta(days=max(1, lote * total_dias // linhas))
+                inicio = minimo
+                while inicio <= maximo:
+                    partes.append({'coluna': "dia", 'de': inicio.isoformat(), 'ate': (inicio + passo).isoformat()})
+                    inicio += passo
+        plano[tabela] = {'colunas': colunas, 'partes': partes}
+    return plano
+
+def fazer_backup(diretorio, paralelo=PARALELO_BACKUP, lote=LOTE_BACKUP, ao_progresso=None):
+    # Snapshot consistente lido por várias conexões: com as tabelas travadas para
+    # escrita (LOCK TABLES ... READ espera as transações de escrita em andamento),
+    # cada conexão abre START TRANSACTION WITH CONSISTENT SNAPSHOT; soltas as
+    # travas, todas continuam vendo o mesmo instante enquanto os caixas voltam a
+    # gravar. Cada parte vira um arquivo gzip colunar (uma lista por coluna); o
+    # manifest.json, gravado por último, marca o backup como completo.
+    if os.path.exists(diretorio) and os.listdir(diretorio):
+        raise FileExistsError(f"O diretório de backup não está vazio: {diretorio}")
+    os.makedirs(diretorio, exist_ok=True)
+    coordenador = abrir_conexao()
+    conexoes = []
+    try:
+        conexoes = abrir_conexoes_backup(paralelo)
+        cursor = coordenador.cursor()
+        try:
+            cursor.execute("LOCK TABLES " + ", ".join(f"{tabela} READ" for tabela in TABELAS_BACKUP + ("schema_versao",)))
+            try:
+                for conn in conexoes:
+                    conn.start_transaction(consistent_snapshot=True, isolation_level="REPEATABLE READ", readonly=True)
+                criado_em = datetime.now()
+            finally:
+                cursor.execute("UNLOCK TABLES")
+        finally:
+            cursor.close()
+        coordenador.close()
+        coordenador = None
+
+        versao = ler(conexoes[0], "SELECT COALESCE(MAX(versao), 0) FROM schema_versao", (), "backup_versao")[0][0]
+        plano = planejar_backup(conexoes[0], lote)
+        tarefas = [(tabela, indice, parte) for tabela, info in plano.items() for indice, parte in enumerate(info['partes'])]
+        # As partes maiores (pedidos, itens) primeiro, para equilibrar as conexões.
+        tarefas.sort(key=lambda tarefa: tarefa[0] in ("pedidos", "itens_pedido"), reverse=True)
+
+        def copiar(conn, tarefa):
+            tabela, indice, parte = tarefa
+            colunas = plano[tabela]['colunas']
+            dados = [[] for _ in colunas]
+            soma = 0
+
+            def acumular(bloco):
+                nonlocal soma
+                soma = (soma + soma_linhas(bloco)) % 2**64
+                for coluna, valores in zip(dados, zip(*bloco)):
+                    coluna.extend(valores)
+
+            sql, params = sql_parte_backup(tabela, colunas, parte)
+            linhas = ler(conn, sql, params, f"backup_{tabela}", ao_lote=acumular, tamanho_lote=LOTE_EXPORTACAO)
+            parte.update({'linhas': linhas, 'soma': soma, 'arquivo': None})
+            if linhas:
+                parte['arquivo'] = f"{tabela}.{indice:05d}.json.gz"
+                caminho = os.path.join(diretorio, parte['arquivo'])
+                with gzip.open(caminho, "wt", encoding="utf-8", compresslevel=6) as arquivo:
+                    json.dump({'tabela': tabela, 'colunas': colunas, 'linhas': linhas, 'dados': dados},
+                              arquivo, ensure_ascii=False, default=str, separators=(",", ":"))
+            if ao_progresso:
+                ao_progresso(f"{tabela} parte {indice}: {linhas} linhas")
+            return tarefa
+
+        em_paralelo(conexoes, tarefas, copiar)
+        for conn in conexoes:
+            conn.rollback()
+    finally:
+        if coordenador is not None:
+            coordenador.close()
+        fechar_conexoes(conexoes)
+
+    manifesto = {
+        'formato': FORMATO_BACKUP,
+        'criado_em': criado_em.isoformat(timespec="seconds"),
+        'banco': DB_NAME,
+        'versao_esquema': versao,
+        'tabelas': {},
+    }
+    for tabela, info in plano.items():
+        partes = [parte for parte in info['partes'] if parte['linhas']]
+        manifesto['tabelas'][tabela] = {
+            'colunas': info['colunas'],
+            'linhas': sum(parte['linhas'] for parte in info['partes']),
+            'soma': sum(parte['soma'] for parte in info['partes']) % 2**64,
+            'partes': partes,
+        }
+    temporario = os.path.join(diretorio, "manifest.json.tmp")
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, indent=2)
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    os.replace(temporario, os.path.join(diretorio, "manifest.json"))
+    return manifesto
+
+def ler_manifesto(diretorio):
+    caminho = os.path.join(diretorio, "manifest.json")
+    if not os.path.exists(caminho):
+        raise FileNotFoundError(f"Backup incompleto ou inexistente: {caminho} não encontrado")
+    with open(caminho, encoding="utf-8") as arquivo:
+        manifesto = json.load(arquivo)
+    if manifesto.get('formato') != FORMATO_BACKUP:
+        raise ValueError(f"Formato de backup não suportado: {manifesto.get('formato')}")
+    return manifesto
+
+def estrutura_tabela(cursor, tabela):
+    # Índices secundários e chaves estrangeiras da tabela, para removê-los antes da
+    # carga e recriá-los depois com a mesma definição.
+    cursor.execute(
+        "SELECT INDEX_NAME, NON_UNIQUE, INDEX_TYPE, COLUMN_NAME, SUB_PART FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME <> 'PRIMARY' "
+        "ORDER BY INDEX_NAME, SEQ_IN_INDEX",
+        (tabela,)
+    )
+    indices = OrderedDict()
+    for nome, nao_unico, tipo, coluna, prefixo in cursor.fetchall():
+        indice = indices.setdefault(nome, {'unico': not int(nao_unico), 'tipo': tipo, 'colunas': []})
+        indice['colunas'].append(f"`{coluna}`({prefixo})" if prefixo else f"`{coluna}`")
+    cursor.execute(
+        "SELECT k.CONSTRAINT_NAME, k.COLUMN_NAME, k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME, "
+        "r.DELETE_RULE, r.UPDATE_RULE "
+        "FROM information_schema.KEY_COLUMN_USAGE k "
+        "JOIN information_schema.REFERENTIAL_CONSTRAINTS r "
+        "ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME AND r.TABLE_NAME = k.TABLE_NAME "
+        "WHERE k.TABLE_SCHEMA = DATABASE() AND k.TABLE_NAME = %s AND k.REFERENCED_TABLE_NAME IS NOT NULL "
+        "ORDER BY k.CONSTRAINT_NAME, k.ORDINAL_POSITION",
+        (tabela,)
+    )
+    chaves = OrderedDict()
+    for nome, coluna, tabela_ref, coluna_ref, ao_excluir, ao_atualizar in cursor.fetchall():
+        chave = chaves.setdefault(nome, {
+            'colunas': [], 'tabela': tabela_ref, 'referencias': [], 'ao_excluir': ao_excluir, 'ao_atualizar': ao_atualizar
+        })
+        chave['colunas'].append(f"`{coluna}`")
+        chave['referencias'].append(f"`{coluna_ref}`")
+    return indices, chaves
+
+def recriar_estrutura(cursor, tabela, indices, chaves):
+    # Os índices comuns num único ALTER TABLE (uma ordenação por índice, em vez de
+    # manutenção linha a linha durante a carga); FULLTEXT precisa de um ALTER cada.
+    comuns = []
+    for nome, indice in indices.items():
+        definicao = f"`{nome}` ({', '.join(indice['colunas'])})"
+        if indice['tipo'] == "FULLTEXT":
+            cursor.execute(f"ALTER TABLE {tabela} ADD FULLTEXT INDEX {definicao}")
+        else:
+            comuns.append(f"ADD {'UNIQUE ' if indice['unico'] else ''}INDEX {definicao}")
+    if comuns:
+        cursor.execute(f"ALTER TABLE {tabela} " + ", ".join(comuns))
+    if chaves:
+        cursor.execute(f"ALTER TABLE {tabela} " + ", ".join(
+            f"ADD CONSTRAINT `{nome}` FOREIGN KEY ({', '.join(chave['colunas'])}) "
+            f"REFERENCES {chave['tabela']} ({', '.join(chave['referencias'])}) "
+            f"ON DELETE {chave['ao_excluir']} ON UPDATE {chave['ao_atualizar']}"
+            for nome, chave in chaves.items()
+        ))
+
+def verificar_backup(conexoes, manifesto):
+    # Confere contagem e soma de cada parte, e a contagem total de cada tabela
+    # (que pega linhas fora das faixas do backup). Devolve as divergências.
+    def conferir(conn, tarefa):
+        tabela, parte = tarefa
+        colunas = manifesto['tabelas'][tabela]['colunas']
+        if parte is None:
+            return tabela, None, ler(conn, f"SELECT COUNT(*) FROM {tabela}", (), "verificar_backup_total")[0][0], None
+        soma = 0
+
+        def acumular(bloco):
+            nonlocal soma
+            soma = (soma + soma_linhas(bloco)) % 2**64
+
+        sql, params = sql_parte_backup(tabela, colunas, parte)
+        linhas = ler(conn, sql, params, f"verificar_backup_{tabela}", ao_lote=acumular, tamanho_lote=LOTE_EXPORTACAO)
+        return tabela, parte, linhas, soma
+
+    tarefas = [(tabela, None) for tabela in manifesto['tabelas']]
+    tarefas += [(tabela, parte) for tabela, info in manifesto['tabelas'].items() for parte in info['partes']]
+    divergencias = []
+    for tabela, parte, linhas, soma in em_paralelo(conexoes, tarefas, conferir):
+        if parte is None:
+            if linhas != manifesto['tabelas'][tabela]['linhas']:
+                divergencias.append(f"{tabela}: {linhas} linhas no banco, {manifesto['tabelas'][tabela]['linhas']} no backup")
+        elif linhas != parte['linhas'] or soma != parte['soma']:
+            faixa = f" {parte['coluna']} de {parte['de']} até antes de {parte['ate']}" if parte['de'] is not None else ""
+            divergencias.append(
+                f"{tabela}{faixa}: {linhas} linhas/soma {soma:016x} no banco, "
+                f"{parte['linhas']} linhas/soma {parte['soma']:016x} no backup"
+            )
+    for conn in conexoes:
+        conn.rollback()
+    return sorted(divergencias)
+
+def restaurar_backup(diretorio, paralelo=PARALELO_BACKUP, substituir=False, ao_progresso=None):
+    # Carga em massa num banco vazio: remove chaves estrangeiras e índices
+    # secundários, carrega as partes em paralelo com as verificações desligadas e
+    # recria a estrutura no fim (também se a carga falhar). Depois confere tudo.
+    manifesto = ler_manifesto(diretorio)
+    conn = preparar_banco()
+    try:
+        aplicar_migracoes(conn)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_versao")
+            versao = cursor.fetchone()[0]
+            if versao != manifesto['versao_esquema']:
+                raise RuntimeError(
+                    f"O backup é da versão {manifesto['versao_esquema']} do esquema e o banco está na versão {versao}."
+                )
+            cursor.execute("SET SESSION foreign_key_checks = 0")
+            ocupadas = []
+            for tabela in manifesto['tabelas']:
+                cursor.execute(f"SELECT 1 FROM {tabela} LIMIT 1")
+                if cursor.fetchall():
+                    ocupadas.append(tabela)
+            if ocupadas and not substituir:
+                raise RuntimeError(f"O banco de destino já tem dados em: {', '.join(ocupadas)} (use --substituir).")
+            for tabela in ocupadas:
+                cursor.execute(f"TRUNCATE TABLE {tabela}")
+
+            estruturas = {tabela: estrutura_tabela(cursor, tabela) for tabela in manifesto['tabelas']}
+            for tabela, (_, chaves) in estruturas.items():
+                for nome in chaves:
+                    cursor.execute(f"ALTER TABLE {tabela} DROP FOREIGN KEY `{nome}`")
+            for tabela, (indices, _) in estruturas.items():
+                if indices:
+                    cursor.execute(f"ALTER TABLE {tabela} " + ", ".join(f"DROP INDEX `{nome}`" for nome in indices))
+
+            conexoes = abrir_conexoes_backup(paralelo)
+            try:
+                for carga in conexoes:
+                    cursor_carga = carga.cursor()
+                    cursor_carga.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+                    cursor_carga.close()
+
+                def carregar(carga, tarefa):
+                    tabela, parte = tarefa
+                    with gzip.open(os.path.join(diretorio, parte['arquivo']), "rt", encoding="utf-8") as arquivo:
+                        conteudo = json.load(arquivo)
+                    linhas = list(zip(*conteudo['dados']))
+                    if len(linhas) != parte['linhas']:
+                        raise ValueError(f"{parte['arquivo']}: {len(linhas)} linhas, o manifesto indica {parte['linhas']}")
+                    colunas = conteudo['colunas']
+                    inserir_em_lotes(carga, f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ", len(colunas), linhas, LOTE_EXPORTACAO)
+                    if ao_progresso:
+                        ao_progresso(f"{parte['arquivo']}: {len(linhas)} linhas carregadas")
+                    return tarefa
+
+                tarefas = [(tabela, parte) for tabela, info in manifesto['tabelas'].items() for parte in info['partes']]
+                tarefas.sort(key=lambda tarefa: tarefa[1]['linhas'], reverse=True)
+                try:
+                    em_paralelo(conexoes, tarefas, carregar)
+                finally:
+                    for tabela, (indices, _) in estruturas.items():
+                        recriar_estrutura(cursor, tabela, indices, OrderedDict())
+                        if ao_progresso:
+                            ao_progresso(f"{tabela}: índices recriados")
+                    for tabela, (_, chaves) in estruturas.items():
+                        if chaves:
+                            recriar_estrutura(cursor, tabela, OrderedDict(), chaves)
+                    cursor.execute("SET SESSION foreign_key_checks = 1")
+                return verificar_backup(conexoes, manifesto)
+            finally:
+                fechar_conexoes(conexoes)
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+def verificar_origem_backup():
+    # O backup só lê: não cria o banco nem aplica migrações na origem. Um banco
+    # inexistente (erro de digitação em --banco) ou desatualizado é recusado.
+    try:
+        conn = abrir_conexao()
+    except mysql.connector.Error as err:
+        if err.errno == mysql.connector.errorcode.ER_BAD_DB_ERROR:
+            sys.exit(f"O banco '{DB_NAME}' não existe.")
+        raise
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'schema_versao'"
+        )
+        if not cursor.fetchone()[0]:
+            sys.exit(f"O banco '{DB_NAME}' não tem schema_versao; não parece ser um banco do sistema.")
+        cursor.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_versao")
+        versao = cursor.fetchone()[0]
+        cursor.close()
+    finally:
+        conn.close()
+    ultima = MIGRACOES[-1][0]
+    if versao != ultima:
+        sys.exit(f"O banco '{DB_NAME}' está na versão {versao} do esquema e este programa na {ultima}; rode 'migrar' antes do backup.")
+
+def executar_backup(args):
+    global DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
+    DB_HOST, DB_USER, DB_PASSWORD, DB_NAME = args.host, args.usuario, args.senha, args.banco
+    verificar_origem_backup()
+    inicio = time.perf_counter()
+    manifesto = fazer_backup(args.diretorio, args.paralelo, args.lote, print)
+    linhas = sum(info['linhas'] for info in manifesto['tabelas'].values())
+    print(f"Backup de {linhas} linhas gravado em {args.diretorio} em {time.perf_counter() - inicio:.1f}s")
+
+def executar_restauracao(args):
+    global DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
+    DB_HOST, DB_USER, DB_PASSWORD, DB_NAME = args.host, args.usuario, args.senha, args.banco
+    inicio = time.perf_counter()
+    if args.apenas_verificar:
+        conexoes = abrir_conexoes_backup(args.paralelo)
+        try:
+            for conn in conexoes:
+                conn.start_transaction(isolation_level="REPEATABLE READ", readonly=True)
+            divergencias = verificar_backup(conexoes, ler_manifesto(args.diretorio))
+        finally:
+            fechar_conexoes(conexoes)
+    else:
+        divergencias = restaurar_backup(args.diretorio, args.paralelo, args.substituir, print)
+    for divergencia in divergencias:
+        print(divergencia)
+    if divergencias:
+        print(f"{len(divergencias)} divergência(s) entre o banco e o backup.", file=sys.stderr)
+        sys.exit(1)
+    print(f"Banco confere com o backup (contagens e somas) em {time.perf_counter() - inicio:.1f}s")
+
+# Consultas cuja ordenação não tem como vir de um índice (relevância calculada,
+# agregados) e que ordenam um resultado pequeno e limitado: filesort nelas é esperado.
+ORDENACAO_ESPERADA = {"busca_produtos_texto", "painel_produtos", "painel_clientes", "painel_estoque_baixo"}
+
+def consultas_conhecidas():
+    agora = datetime.now()
+    return [
+        ("lista_clientes", *sql_pagina(SQL_LISTA_CLIENTES, CHAVE_LISTA_CLIENTES, "ASC", ("M", 0), True, TAMANHO_PAGINA)),
+        ("lista_produtos", *sql_pagina(SQL_LISTA_PRODUTOS, CHAVE_LISTA_PRODUTOS, "ASC", ("M", 0), True, TAMANHO_PAGINA)),
+        ("lista_pedidos", *sql_pagina(SQL_LISTA_PEDIDOS, CHAVE_LISTA_PEDIDOS, "DESC", (agora, 0), True, TAMANHO_PAGINA)),
+        ("alteracoes_clientes", f"{SQL_LISTA_CLIENTES} WHERE atualizado_em >= %s ORDER BY atualizado_em LIMIT %s", (agora, MAX_ALTERACOES)),
+        ("alteracoes_produtos", f"{SQL_LISTA_PRODUTOS} WHERE atualizado_em >= %s ORDER BY atualizado_em LIMIT %s", (agora, MAX_ALTERACOES)),
+        ("alteracoes_pedidos", f"{SQL_LISTA_PEDIDOS} WHERE p.id >= %s ORDER BY p.id LIMIT %s", (0, MAX_ALTERACOES)),
+        ("busca_clientes_nome", SQL_BUSCA_CLIENTES_NOME, ("Ma%", BUSCA_LIMITE)),
+        ("busca_clientes_cpf", SQL_BUSCA_CLIENTES_CPF, ("123%", BUSCA_LIMITE)),
+        ("busca_produtos_nome", *sql_busca_produtos_texto("Ar", BUSCA_LIMITE, so_em_estoque=True)[:2]),
+        ("busca_produtos_texto", *sql_busca_produtos_texto("bandeja de ovos", TAMANHO_PAGINA)[:2]),
+        ("busca_produtos_id", SQL_BUSCA_PRODUTOS_ID, (1,)),
+        ("catalogo_alteracoes_produtos", SQL_CATALOGO['produtos'] + " WHERE id IN (%s, %s, %s) AND atualizado_em >= %s", (1, 2, 3, agora)),
+        ("itens_pedidos", SQL_ITENS_PEDIDOS.format("%s, %s, %s"), (1, 2, 3)),
+        ("checkout_trava_produtos", "SELECT id, nome, estoque FROM produtos WHERE id IN (%s, %s) ORDER BY id", (1, 2)),
+        ("painel_dias", SQL_PAINEL_DIAS, (agora.date() - timedelta(days=29), agora.date())),
+        ("painel_produtos", SQL_PAINEL_PRODUTOS, (agora.date() - timedelta(days=29), agora.date(), PAINEL_RANKING)),
+        ("painel_clientes", SQL_PAINEL_CLIENTES, (agora.date() - timedelta(days=29), agora.date(), PAINEL_RANKING)),
+        ("painel_estoque_baixo", SQL_PAINEL_ESTOQUE_BAIXO, (agora.date() - timedelta(days=29), agora.date(), ESTOQUE_MINIMO, TAMANHO_PAGINA)),
+    ]
+
+def verificar_consultas(conn):
+    # Roda EXPLAIN nas consultas do aplicativo e aponta varreduras completas e filesort.
+    relatorio = []
+    cursor = conn.cursor(dictionary=True)
+    try:
+        for nome, sql, params in consultas_conhecidas():
+            cursor.execute("EXPLAIN " + sql, params)
+            for passo in cursor.fetchall():
+                extra = passo.get('Extra') or ""
+                problemas = []
+                if passo.get('type') == "ALL":
+                    problemas.append("varredura completa")
+                if "Using filesort" in extra and nome not in ORDENACAO_ESPERADA:
+                    problemas.append("filesort")
+                relatorio.append({
+                    'consulta': nome,
+                    'tabela': passo.get('table'),
+                    'tipo': passo.get('type'),
+                    'indice': passo.get('key'),
+                    'linhas': passo.get('rows'),
+                    'extra': extra,
+                    'problemas': problemas,
+                })
+    finally:
+        cursor.close()
+    return relatorio
+
+def executar_migracoes(args):
+    global DB_HOST, DB_USER, DB_PASSWORD, DB_NAME
+    DB_HOST, DB_USER, DB_PASSWORD, DB_NAME = args.host, args.usuario, args.senha, args.banco
+    conn = preparar_banco()
+    try:
+        aplicadas = aplicar_migracoes(conn)
+        for versao, descricao in aplicadas:
+            print(f"Migração {versao} aplicada: {descricao}")
+        if resumos_a_preencher(aplicadas):
+            reconstruir_resumos(
+                conn, ao_progresso=lambda inicio_mes, fim_mes: print(f"Resumos de {inicio_mes:%Y-%m} calculados")
+            )
+        if not aplicadas:
+            print("Esquema já está atualizado.")
+        if not args.verificar:
+            return
+        relatorio = verificar_consultas(conn)
+    finally:
+        conn.close()
+    problemas = 0
+    for passo in relatorio:
+        situacao = ", ".join(passo['problemas']) or "ok"
+        print(f"{passo['consulta']:30} {str(passo['tabela']):14} {str(passo['tipo']):8} "
+              f"{str(passo['indice']):28} {str(passo['linhas']):>10}  {situacao}")
+        problemas += bool(passo['problemas'])
+    if problemas:
+        sys.exit(1)
+
+def adicionar_argumentos_conexao(parser, banco_padrao):
+    parser.add_argument("--host", default=DB_HOST)
+    parser.add_argument("--usuario", default=DB_USER)
+    parser.add_argument("--senha", default=DB_PASSWORD)
+    parser.add_argument("--banco", default=banco_padrao)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sistema de Gestão de Vendas")
+    parser.add_argument(
+        "--metricas", metavar="ARQUIVO",
+        help="grava as métricas da interface neste arquivo a cada "
+             f"{INTERVALO_METRICAS_MS // 1000} s (JSON se terminar em .json, senão Prometheus)"
+    )
+    subcomandos = parser.add_subparsers(dest="comando")
+
+    benchmark = subcomandos.add_parser("benchmark", help="gera dados sintéticos e mede as consultas sem interface")
+    adicionar_argumentos_conexao(benchmark, f"{DB_NAME}_bench")
+    benchmark.add_argument("--clientes", type=int, default=10000)
+    benchmark.add_argument("--produtos", type=int, default=5000)
+    benchmark.add_argument("--pedidos", type=int, default=100000)
+    benchmark.add_argument("--itens-por-pedido", type=int, default=5)
+    benchmark.add_argument("--lote", type=int, default=5000)
+    benchmark.add_argument("--repeticoes", type=int, default=50)
+    benchmark.add_argument("--semente", type=int, default=42)
+    benchmark.add_argument("--casos", nargs="*", help="executa apenas os casos indicados")
+    benchmark.add_argument("--sem-semear", action="store_true", help="reaproveita os dados já gerados")
+    benchmark.add_argument("--saida", help="arquivo JSON com os resultados")
+    benchmark.set_defaults(funcao=executar_benchmark)
+
+    carga = subcomandos.add_parser("carga", help="simula vários terminais finalizando pedidos ao mesmo tempo")
+    adicionar_argumentos_conexao(carga, f"{DB_NAME}_bench")
+    carga.add_argument("--terminais", type=int, default=4, help="número de processos simulando caixas")
+    carga.add_argument("--duracao", type=float, default=30.0, help="segundos de carga")
+    carga.add_argument("--itens-min", type=int, default=1)
+    carga.add_argument("--itens-max", type=int, default=10)
+    carga.add_argument("--quantidade-max", type=int, default=3)
+    carga.add_argument("--produtos-quentes", type=int, default=10, help="quantos produtos concentram as vendas")
+    carga.add_argument("--fracao-quente", type=float, default=0.8, help="probabilidade de cada item ser um produto quente")
+    carga.add_argument("--tentativas", type=int, default=5, help="repetições após deadlock ou espera de trava estourada")
+    carga.add_argument("--semear", action="store_true", help="apaga o banco e gera clientes e produtos antes")
+    carga.add_argument("--clientes", type=int, default=1000)
+    carga.add_argument("--produtos", type=int, default=500)
+    carga.add_argument("--estoque", type=int, help="redefine o estoque de todos os produtos antes da carga")
+    carga.add_argument("--semente", type=int, default=42)
+    carga.add_argument("--saida", help="arquivo JSON com os resultados")
+    carga.set_defaults(funcao=executar_carga)
+
+    migrar = subcomandos.add_parser("migrar", help="aplica as migrações pendentes do esquema")
+    adicionar_argumentos_conexao(migrar, DB_NAME)
+    migrar.add_argument("--verificar", action="store_true", help="roda EXPLAIN nas consultas do aplicativo e aponta varreduras completas")
+    migrar.set_defaults(funcao=executar_migracoes)
+
+    arquivar = subcomandos.add_parser("arquivar", help="move os meses fechados de pedidos para arquivos compactados")
+    adicionar_argumentos_conexao(arquivar, DB_NAME)
+    arquivar.add_argument("--manter-meses", type=int, default=MESES_ATIVOS_PADRAO, help="meses mais recentes que ficam no banco")
+    arquivar.add_argument("--diretorio", default=DIRETORIO_ARQUIVO)
+    arquivar.add_argument("--lote", type=int, default=LOTE_EXPORTACAO)
+    arquivar.set_defaults(funcao=executar_arquivamento)
+
+    consultar = subcomandos.add_parser("consultar-arquivo", help="lista pedidos arquivados de um período")
+    adicionar_argumentos_conexao(consultar, DB_NAME)
+    consultar.add_argument("--de", help="data inicial, AAAA-MM-DD")
+    consultar.add_argument("--ate", help="data final (inclusive), AAAA-MM-DD")
+    consultar.add_argument("--cliente", type=int, help="id do cliente")
+    consultar.add_argument("--diretorio", default=DIRETORIO_ARQUIVO)
+    consultar.set_defaults(funcao=executar_consulta_arquivo)
+
+    resumos = subcomandos.add_parser("resumos", help="verifica (ou reconstrói) as tabelas de resumo de vendas")
+    adicionar_argumentos_conexao(resumos, DB_NAME)
+    resumos.add_argument("--reconstruir", action="store_true", help="recalcula os resumos a partir dos pedidos antes de verificar")
+    resumos.add_argument("--de", help="data inicial, AAAA-MM-DD")
+    resumos.add_argument("--ate", help="data final (inclusive), AAAA-MM-DD")
+    resumos.set_defaults(funcao=executar_resumos)
+
+    importar = subcomandos.add_parser("importar", help="importa clientes ou produtos de CSV/JSON em lotes")
+    adicionar_argumentos_conexao(importar, DB_NAME)
+    importar.add_argument("tabela", choices=("clientes", "produtos"))
+    importar.add_argument("arquivo", help="arquivo .csv, .json (array) ou .jsonl")
+    importar.add_argument("--rejeitados", help="CSV onde gravar as linhas rejeitadas e o motivo")
+    importar.add_argument("--lote", type=int, default=LOTE_IMPORTACAO)
+    importar.set_defaults(funcao=executar_importacao)
+
+    exportar = subcomandos.add_parser("exportar", help="exporta clientes ou produtos para CSV/JSON")
+    adicionar_argumentos_conexao(exportar, DB_NAME)
+    exportar.add_argument("tabela", choices=("clientes", "produtos"))
+    exportar.add_argument("arquivo", help="arquivo .csv, .json ou .jsonl")
+    exportar.add_argument("--lote", type=int, default=LOTE_EXPORTACAO)
+    exportar.set_defaults(funcao=executar_exportacao)
+
+    backup = subcomandos.add_parser("backup", help="grava um snapshot consistente do banco, lido em paralelo")
+    adicionar_argumentos_conexao(backup, DB_NAME)
+    backup.add_argument("diretorio", help="diretório novo (ou vazio) para o backup")
+    backup.add_argument("--paralelo", type=int, default=PARALELO_BACKUP, help="conexões lendo ao mesmo tempo")
+    backup.add_argument("--lote", type=int, default=LOTE_BACKUP, help="ids por arquivo nas tabelas grandes")
+    backup.set_defaults(funcao=executar_backup)
+
+    restaurar = subcomandos.add_parser("restaurar", help="carrega um backup num banco vazio e confere o resultado")
+    adicionar_argumentos_conexao(restaurar, DB_NAME)
+    restaurar.add_argument("diretorio")
+    restaurar.add_argument("--paralelo", type=int, default=PARALELO_BACKUP)
+    restaurar.add_argument("--substituir", action="store_true", help="apaga os dados já existentes no banco de destino")
+    restaurar.add_argument("--apenas-verificar", action="store_true", help="só compara o banco com o backup, sem carregar")
+    restaurar.set_defaults(funcao=executar_restauracao)
+
+    args = parser.parse_args(argv)
+    if args.comando is None:
+        root_tk = tk.Tk()
+        app = SistemaVendasApp(root_tk, args.metricas)
+        root_tk.mainloop()
+    else:
+        args.funcao(args)
 
 if __name__ == "__main__":
-    root_tk = tk.Tk()
-    app = SistemaVendasApp(root_tk)
-    root_tk.mainloop()
+    main()
@@ -0,0 +1,93 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+
+CAMINHO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sistema-vendas.py")
+especificacao = importlib.util.spec_from_file_location("sistema_vendas", CAMINHO)
+sv = importlib.util.module_from_spec(especificacao)
+especificacao.loader.exec_module(sv)
+
+
+class CursorFalso:
+    def execute(self, sql, params=()):
+        pass
+
+    def close(self):
+        pass
+
+
+class ConexaoFalsa:
+    def cursor(self, **opcoes):
+        return CursorFalso()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class TestConverterPreco(unittest.TestCase):
+    def test_formatos_aceitos(self):
+        self.assertEqual(sv.converter_preco("16.90"), Decimal("16.90"))
+        self.assertEqual(sv.converter_preco("16,90"), Decimal("16.90"))
+        self.assertEqual(sv.converter_preco("1.234,56"), Decimal("1234.56"))
+        self.assertEqual(sv.converter_preco("R$ 16,9"), Decimal("16.90"))
+
+    def test_separador_de_milhar_americano(self):
+        with self.assertRaises(ValueError):
+            sv.converter_preco("1,234.56")
+
+    def test_mais_de_duas_casas(self):
+        with self.assertRaises(ValueError):
+            sv.converter_preco("1.234")
+
+
+class TestLeituraImportacao(unittest.TestCase):
+    def gravar_arquivo(self, extensao, conteudo):
+        descritor, caminho = tempfile.mkstemp(suffix=extensao)
+        with os.fdopen(descritor, "w", encoding="utf-8") as arquivo:
+            arquivo.write(conteudo)
+        self.addCleanup(os.remove, caminho)
+        return caminho
+
+    def importar(self, caminho):
+        rejeitados = []
+        resumo = sv.importar_registros(
+            ConexaoFalsa(), "clientes", sv.ler_registros(caminho),
+            ao_rejeitar=lambda numero, registro, motivo: rejeitados.append(numero)
+        )
+        return resumo, rejeitados
+
+    def test_linha_jsonl_malformada_vira_rejeicao(self):
+        caminho = self.gravar_arquivo(".jsonl", '{"nome": "Ana", "cpf": "12345678900"}\n{"nome": \n{"nome": "Bia", "cpf": "98765432100"}\n')
+        resumo, rejeitados = self.importar(caminho)
+        self.assertEqual(resumo, {'lidas': 3, 'gravadas': 2, 'rejeitadas': 1})
+        self.assertEqual(rejeitados, [2])
+
+    def test_elemento_que_nao_e_objeto_vira_rejeicao(self):
+        caminho = self.gravar_arquivo(".json", '[{"nome": "Ana", "cpf": "12345678900"}, 5, ["x"], {"nome": "Bia", "cpf": "98765432100"}]')
+        resumo, rejeitados = self.importar(caminho)
+        self.assertEqual(resumo, {'lidas': 4, 'gravadas': 2, 'rejeitadas': 2})
+        self.assertEqual(rejeitados, [2, 3])
+
+    def test_array_truncado(self):
+        caminho = self.gravar_arquivo(".json", '[{"nome": "Ana", "cpf": "12345678900"},')
+        with self.assertRaises(ValueError):
+            self.importar(caminho)
+
+    def test_array_sem_fechamento(self):
+        caminho = self.gravar_arquivo(".json", '[{"nome": "Ana", "cpf": "12345678900"}')
+        with self.assertRaises(ValueError):
+            self.importar(caminho)
+
+    def test_array_completo(self):
+        caminho = self.gravar_arquivo(".json", '[{"nome": "Ana", "cpf": "12345678900"}, {"nome": "Bia", "cpf": "98765432100"}]\n')
+        resumo, rejeitados = self.importar(caminho)
+        self.assertEqual(resumo, {'lidas': 2, 'gravadas': 2, 'rejeitadas': 0})
+
+
+if __name__ == "__main__":
+    unittest.main()